@@ -0,0 +1,222 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+"""
+Benchmarks of the hot paths of Wilfred against an in-memory Docker client
+
+Run from the repository root using `python -m benchmarks` (or `tox -e bench`).
+Wilfred is pointed to a temporary configuration and data directory through
+XDG_CONFIG_HOME/XDG_DATA_HOME, the database and images of the user are never touched.
+"""
+
+import click
+import json
+import os
+import sys
+
+from statistics import median
+from tempfile import mkdtemp
+from time import perf_counter
+from shutil import rmtree
+
+SIZES = "10,100,1000"
+
+
+def _measure(function, setup, repeat):
+    timings = []
+
+    for _ in range(repeat):
+        setup()
+
+        started = perf_counter()
+        function()
+        timings.append(perf_counter() - started)
+
+    return timings
+
+
+def _cases(n, latency):
+    """fills the database with `n` servers and returns the benchmark cases"""
+
+    from benchmarks.fake_docker import FakeDockerClient, stats_sample
+    from benchmarks.fixtures import (
+        write_images,
+        write_configuration,
+        fill_database,
+    )
+    from appdirs import user_config_dir, user_data_dir
+
+    from wilfred.api.config_parser import Config
+    from wilfred.api.images import Images
+    from wilfred.api.servers import Servers
+    from wilfred.api.server_config import ServerConfig
+    from wilfred.database import session, Server
+    from wilfred.top import TopView
+
+    config_dir = f"{user_config_dir()}/wilfred"
+    data_path = f"{user_data_dir()}/wilfred/servers"
+
+    docker = FakeDockerClient(latency=latency)
+
+    uids = write_images(config_dir, n)
+    write_configuration(config_dir, data_path)
+    fill_database(n, uids, data_path, docker_client=docker)
+
+    config = Config()
+    config.read()
+
+    images = Images()
+    images.read_images()
+
+    servers = Servers(docker, config.configuration, images)
+
+    rows = servers.all()
+    samples = {server["id"]: stats_sample() for server in rows[: n // 2]}
+    changed = {server_id: stats_sample(cpu=20) for server_id in samples}
+    view = TopView()
+
+    def _server_configs():
+        for server in session.query(Server).all():
+            ServerConfig(
+                config.configuration,
+                servers,
+                server,
+                images.get_image(server.image_uid),
+            ).raw
+
+    def _nothing():
+        pass
+
+    def _cold():
+        # every CLI invocation starts without a snapshot of the containers
+        servers._invalidate_snapshot()
+        session.expire_all()
+
+    def _first_frame():
+        view._layout = None
+
+    return docker, (
+        ("Servers.all", servers.all, _cold),
+        (
+            "Servers.all (stats)",
+            lambda: servers.all(cpu_load=True, memory_usage=True),
+            _cold,
+        ),
+        ("Servers.sync", servers.sync, _cold),
+        ("Images.read_images", lambda: Images().read_images(), _nothing),
+        ("ServerConfig (all servers)", _server_configs, _cold),
+        (
+            "top frame (full)",
+            lambda: view.render(rows, samples, size=(200, n + 5)),
+            _first_frame,
+        ),
+        (
+            "top frame (update)",
+            lambda: (
+                view.render(rows, samples, size=(200, n + 5)),
+                view.render(rows, changed, size=(200, n + 5)),
+            ),
+            _first_frame,
+        ),
+    )
+
+
+@click.command()
+@click.option(
+    "--sizes",
+    default=SIZES,
+    show_default=True,
+    help="Comma separated numbers of servers to benchmark with.",
+)
+@click.option(
+    "--latency",
+    default=1.0,
+    type=float,
+    show_default=True,
+    help="Milliseconds every Docker API call takes.",
+)
+@click.option("--repeat", default=5, show_default=True, help="Runs per benchmark.")
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write median timings (ms) as JSON, e.g. to use as baseline.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Fail if a median timing is slower than in this file (written by --output).",
+)
+@click.option(
+    "--threshold",
+    default=0.25,
+    show_default=True,
+    help="Allowed slowdown compared to --baseline, 0.25 is 25%.",
+)
+def bench(sizes, latency, repeat, output, baseline, threshold):
+    root = mkdtemp(prefix="wilfred-bench-")
+
+    # must happen before Wilfred (the database module) is imported
+    os.environ["XDG_CONFIG_HOME"] = f"{root}/config"
+    os.environ["XDG_DATA_HOME"] = f"{root}/data"
+
+    from tabulate import tabulate
+
+    results = {}
+    rows = []
+
+    try:
+        for n in [int(size) for size in sizes.split(",")]:
+            docker, cases = _cases(n, latency / 1000)
+
+            for name, function, setup in cases:
+                function()  # warm up
+
+                timings = _measure(function, setup, repeat)
+
+                docker.reset_calls()
+                setup()
+                function()
+
+                results[f"{name} @ {n}"] = median(timings) * 1000
+                rows.append(
+                    {
+                        "benchmark": name,
+                        "servers": n,
+                        "median (ms)": round(median(timings) * 1000, 2),
+                        "min (ms)": round(min(timings) * 1000, 2),
+                        "docker calls": sum(docker.calls.values()),
+                    }
+                )
+    finally:
+        rmtree(root, ignore_errors=True)
+
+    click.echo(tabulate(rows, headers="keys"))
+
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+
+    if baseline:
+        with open(baseline) as f:
+            _baseline = json.load(f)
+
+        regressions = [
+            f"{key}: {round(results[key], 2)} ms, baseline {round(_baseline[key], 2)} ms"
+            for key in results
+            if key in _baseline and results[key] > _baseline[key] * (1 + threshold)
+        ]
+
+        if regressions:
+            click.echo("\nRegressions:\n" + "\n".join(regressions), err=True)
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    bench()
@@ -0,0 +1,171 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import threading
+
+from collections import Counter
+from itertools import count
+from time import sleep
+
+from docker.errors import NotFound
+
+
+def stats_sample(cpu=10, memory=256):
+    """Returns a stats sample shaped like the one returned by the Docker API"""
+
+    return {
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": 1000 + cpu * 10},
+            "system_cpu_usage": 2000,
+            "online_cpus": 1,
+        },
+        "precpu_stats": {"cpu_usage": {"total_usage": 1000}, "system_cpu_usage": 1000},
+        "memory_stats": {"usage": memory * 1024 * 1024, "limit": 1024 * 1024 * 1024},
+        "networks": {"eth0": {"rx_bytes": 1000, "tx_bytes": 1000}},
+        "blkio_stats": {"io_service_bytes_recursive": []},
+    }
+
+
+class FakeDockerClient(object):
+    """
+    In-memory stand-in for docker.DockerClient, covering the calls Wilfred makes
+
+    Every call that would be an API request sleeps for `latency` seconds and is
+    counted in `calls`, keyed by the name of the call (e.g. `containers.list`).
+    """
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.calls = Counter()
+        self.containers = FakeContainers(self)
+
+        self._lock = threading.Lock()
+
+    def request(self, name):
+        with self._lock:
+            self.calls[name] += 1
+
+        if self.latency:
+            sleep(self.latency)
+
+    def reset_calls(self):
+        with self._lock:
+            self.calls = Counter()
+
+    def events(self, decode=False, filters=None):
+        self.request("events")
+
+        return FakeEvents()
+
+
+class FakeContainers(object):
+    def __init__(self, client):
+        self._client = client
+        self._containers = {}
+        self._ids = count(1)
+
+    def add(self, name, status="running"):
+        """Adds a container without counting an API call (test setup)"""
+
+        container = FakeContainer(self._client, self, name, f"{next(self._ids):064x}")
+        container.status = status
+        self._containers[name] = container
+
+        return container
+
+    def list(self, all=False, filters=None, sparse=False):
+        self._client.request("containers.list")
+
+        name = (filters or {}).get("name", "")
+
+        return [
+            container
+            for container in self._containers.values()
+            if name in container.name and (all or container.status == "running")
+        ]
+
+    def get(self, name):
+        self._client.request("containers.get")
+
+        if name not in self._containers:
+            raise NotFound(f"No such container: {name}")
+
+        return self._containers[name]
+
+    def run(self, image, command=None, name=None, **kwargs):
+        self._client.request("containers.run")
+
+        return self.add(name)
+
+    def remove(self, name):
+        self._containers.pop(name, None)
+
+
+class FakeContainer(object):
+    def __init__(self, client, containers, name, container_id):
+        self._client = client
+        self._containers = containers
+
+        self.name = name
+        self.id = container_id
+        self.status = "running"
+        self.attrs = {"Id": container_id, "Names": [f"/{name}"]}
+
+    def stats(self, stream=True, decode=False):
+        self._client.request("container.stats")
+
+        if not stream:
+            return stats_sample()
+
+        return self._stream()
+
+    def _stream(self):
+        while self.name in self._containers._containers:
+            yield stats_sample()
+            sleep(1)
+
+    def kill(self, signal=None):
+        self._client.request("container.kill")
+        self._containers.remove(self.name)
+
+    def wait(self, timeout=None, condition=None):
+        self._client.request("container.wait")
+        self._containers.remove(self.name)
+
+        return {"StatusCode": 0}
+
+    def attach_socket(self, params=None):
+        self._client.request("container.attach_socket")
+
+        return FakeSocket()
+
+    def logs(self, stream=False, tail="all"):
+        self._client.request("container.logs")
+
+        return iter(()) if stream else b""
+
+
+class FakeSocket(object):
+    def __init__(self):
+        self._sock = self
+
+    def send(self, data):
+        return len(data)
+
+    def close(self):
+        pass
+
+
+class FakeEvents(object):
+    def __iter__(self):
+        return iter(())
+
+    def close(self):
+        pass
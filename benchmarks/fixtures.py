@@ -0,0 +1,213 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import json
+
+from datetime import datetime
+from pathlib import Path
+from shutil import rmtree
+
+# keys of a typical server.properties, every server gets its own copy
+PROPERTIES = [
+    "allow-flight=false",
+    "allow-nether=true",
+    "broadcast-console-to-ops=true",
+    "difficulty=easy",
+    "enable-command-block=false",
+    "enable-query=false",
+    "enable-rcon=false",
+    "enforce-whitelist=false",
+    "force-gamemode=false",
+    "gamemode=survival",
+    "generate-structures=true",
+    "hardcore=false",
+    "level-name=world",
+    "level-seed=",
+    "level-type=default",
+    "max-build-height=256",
+    "max-players=20",
+    "max-tick-time=60000",
+    "max-world-size=29999984",
+    "motd=A Minecraft Server",
+    "network-compression-threshold=256",
+    "online-mode=true",
+    "op-permission-level=4",
+    "player-idle-timeout=0",
+    "pvp=true",
+    "query.port=25565",
+    "rcon.password=",
+    "rcon.port=25575",
+    "server-ip=",
+    "server-port=25565",
+    "snooper-enabled=true",
+    "spawn-animals=true",
+    "spawn-monsters=true",
+    "spawn-npcs=true",
+    "spawn-protection=16",
+    "use-native-transport=true",
+    "view-distance=10",
+    "white-list=false",
+]
+
+
+def image(uid):
+    """Returns a valid image, modelled after the default Minecraft images"""
+
+    return {
+        "meta": {"api_version": 2},
+        "uid": uid,
+        "name": uid,
+        "author": "benchmark@wilfredproject.org",
+        "docker_image": "wilfreddev/java:latest",
+        "command": "java -Xms128M -Xmx{{SERVER_MEMORY}}M -jar server.jar",
+        "default_port": "25565",
+        "user": "container",
+        "stop_command": "stop",
+        "default_image": True,
+        "config": {
+            "files": [
+                {
+                    "filename": "server.properties",
+                    "parser": "properties",
+                    "environment": [
+                        {
+                            "config_variable": "server-port",
+                            "environment_variable": "SERVER_PORT",
+                            "value_format": None,
+                        }
+                    ],
+                    "action": {"difficulty": "difficulty {}"},
+                }
+            ]
+        },
+        "installation": {
+            "docker_image": "wilfreddev/alpine:latest",
+            "shell": "/bin/ash",
+            "script": ["echo installing"],
+        },
+        "variables": [
+            {
+                "prompt": "Version",
+                "variable": "MINECRAFT_VERSION",
+                "install_only": True,
+                "default": "latest",
+                "hidden": False,
+            },
+            {
+                "prompt": "EULA",
+                "variable": "EULA_ACCEPTANCE",
+                "install_only": True,
+                "default": "true",
+                "hidden": False,
+            },
+        ],
+    }
+
+
+def write_images(config_dir, count):
+    """
+    Writes `count` images and a fresh image cache to the Wilfred config directory
+
+    Returns:
+        Returns ``list`` of image uids.
+    """
+
+    from wilfred.version import version
+
+    image_dir = Path(config_dir) / "images" / "default" / "benchmark"
+
+    rmtree(image_dir.parent, ignore_errors=True)
+    image_dir.mkdir(parents=True)
+
+    uids = [f"benchmark-{i}" for i in range(count)]
+
+    for uid in uids:
+        with open(image_dir / f"{uid}.json", "w") as f:
+            json.dump(image(uid), f, indent=4)
+
+    with open(Path(config_dir) / "image_cache.json", "w") as f:
+        json.dump({"time": str(datetime.now()), "version": version}, f)
+
+    return uids
+
+
+def write_configuration(config_dir, data_path):
+    from wilfred.api.config_parser import Config
+
+    Path(config_dir).mkdir(parents=True, exist_ok=True)
+    Config().write(data_path)
+
+
+def fill_database(count, uids, data_path, docker_client=None, running=0.5):
+    """
+    Replaces all servers in the database with `count` generated servers
+
+    Every server gets its environment variables, an additional port and a
+    server.properties file. If `docker_client` (a FakeDockerClient) is
+    specified, a container is added for the first `running` fraction of servers,
+    which are then marked as running so that the database and Docker agree.
+
+    Returns:
+        Returns ``list`` of server ids.
+    """
+
+    from wilfred.database import session, Server, EnvironmentVariable, Port
+
+    session.query(EnvironmentVariable).delete()
+    session.query(Port).delete()
+    session.query(Server).delete()
+    session.commit()
+
+    rmtree(data_path, ignore_errors=True)
+
+    server_ids = []
+
+    for i in range(count):
+        server_id = f"{i:08x}"
+        name = f"server{i}"
+        is_running = i < count * running
+
+        session.add(
+            Server(
+                id=server_id,
+                name=name,
+                image_uid=uids[i % len(uids)],
+                memory=1024,
+                port=20000 + i,
+                custom_startup=None,
+                status="running" if is_running else "stopped",
+            )
+        )
+        session.add(
+            EnvironmentVariable(
+                server_id=server_id, variable="MINECRAFT_VERSION", value="latest"
+            )
+        )
+        session.add(
+            EnvironmentVariable(
+                server_id=server_id, variable="EULA_ACCEPTANCE", value="true"
+            )
+        )
+        session.add(Port(server_id=server_id, port=40000 + i))
+
+        path = Path(data_path) / f"{name}_{server_id}"
+        path.mkdir(parents=True)
+
+        with open(path / "server.properties", "w") as f:
+            f.write("#Minecraft server properties\n" + "\n".join(PROPERTIES) + "\n")
+
+        if docker_client and is_running:
+            docker_client.containers.add(f"wilfred_{server_id}")
+
+        server_ids.append(server_id)
+
+    session.commit()
+
+    return server_ids
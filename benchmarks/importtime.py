@@ -0,0 +1,81 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+"""
+Import-time profile of the Wilfred CLI
+
+Run from the repository root using `python -m benchmarks.importtime` (or
+`tox -e importtime`). Imports the CLI module in a fresh interpreter using
+`python -X importtime`, prints the slowest imports and fails if any of the
+heavy dependencies are imported up front, they must only be imported by the
+commands that use them.
+"""
+
+import click
+import subprocess
+import sys
+
+# only to be imported on the code paths that need them
+HEAVY = ("docker", "halo", "requests", "sqlalchemy", "tabulate", "yaml")
+
+MODULE = "wilfred.wilfred"
+
+
+def profile(module=MODULE):
+    """
+    Imports module in a fresh interpreter
+
+    Returns:
+        Returns ``list`` of (module, self time, cumulative time) in microseconds, in import order.
+    """
+
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+        check=True,
+    )
+
+    imports = []
+
+    for line in result.stderr.decode("utf-8").splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+
+        _self, cumulative, name = line[len("import time:") :].split("|")
+        imports.append((name.strip(), int(_self), int(cumulative)))
+
+    return imports
+
+
+@click.command()
+@click.option("--top", default=15, show_default=True, help="Number of imports to list.")
+def importtime(top):
+    # leave out what the interpreter imports at startup (site, .pth files)
+    startup = {name for name, _, _ in profile("site")}
+    imports = [x for x in profile() if x[0] not in startup]
+
+    heavy = sorted({name.split(".")[0] for name, _, _ in imports} & set(HEAVY))
+
+    click.echo(f"Slowest imports (cumulative) of {MODULE}:")
+
+    for name, _, cumulative in sorted(imports, key=lambda x: x[2], reverse=True)[:top]:
+        click.echo(f"{round(cumulative / 1000, 1):>8} ms  {name}")
+
+    if heavy:
+        click.echo(
+            f"\n{MODULE} imports {', '.join(heavy)} up front, import on first use instead",
+            err=True,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    importtime()
@@ -0,0 +1,199 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+"""
+Startup time of the Wilfred CLI, one fresh interpreter per run
+
+Run from the repository root using `python -m benchmarks.startup`. Every command
+runs as a subprocess against a temporary configuration, database and a fake
+Docker daemon listening on a Unix socket. Targets are the time spent on top of
+starting a bare Python interpreter, the command fails if a target is missed.
+"""
+
+import click
+import json
+import os
+import subprocess
+import sys
+import threading
+
+from http.server import BaseHTTPRequestHandler
+from socketserver import ThreadingUnixStreamServer
+from statistics import median
+from tempfile import mkdtemp
+from time import perf_counter
+from shutil import rmtree
+
+# command, arguments and milliseconds allowed on top of a bare interpreter,
+# `servers` has to import SQLAlchemy and the Docker SDK
+TARGETS = (
+    ("--version", ["--version"], 150),
+    ("--path", ["--path"], 150),
+    ("servers", ["servers"], 800),
+)
+
+SERVERS = 10
+
+
+class FakeDockerDaemon(ThreadingUnixStreamServer):
+    """Answers the Docker API requests made by `wilfred servers` on a Unix socket"""
+
+    daemon_threads = True
+
+    def __init__(self, path, running):
+        self.running = running
+
+        super(FakeDockerDaemon, self).__init__(path, _DockerHandler)
+
+
+class _DockerHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        path = self.path.split("?")[0]
+
+        if path.endswith("/version"):
+            return self._json({"ApiVersion": "1.41", "Version": "20.10.0"})
+
+        if path.endswith("/containers/json"):
+            return self._json(
+                [
+                    {
+                        "Id": f"{i:064x}",
+                        "Names": [f"/wilfred_{server_id}"],
+                        "State": "running",
+                    }
+                    for i, server_id in enumerate(self.server.running)
+                ]
+            )
+
+        self._json({"message": "not found"}, status=404)
+
+    def _json(self, data, status=200):
+        payload = json.dumps(data).encode("utf-8")
+
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def address_string(self):
+        return "unix"
+
+    def log_message(self, format, *args):
+        pass
+
+
+def _run(arguments, env):
+    started = perf_counter()
+    result = subprocess.run(
+        arguments,
+        env=env,
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+
+    return (perf_counter() - started, result)
+
+
+@click.command()
+@click.option("--repeat", default=5, show_default=True, help="Runs per command.")
+def startup(repeat):
+    root = mkdtemp(prefix="wilfred-startup-")
+
+    env = {
+        **os.environ,
+        "XDG_CONFIG_HOME": f"{root}/config",
+        "XDG_DATA_HOME": f"{root}/data",
+        "DOCKER_HOST": f"unix://{root}/docker.sock",
+        # the background release check would compete with the measured runs
+        "WILFRED_NO_UPDATE_CHECK": "1",
+        "PYTHONPATH": os.pathsep.join(
+            [os.getcwd()] + [p for p in [os.environ.get("PYTHONPATH")] if p]
+        ),
+    }
+
+    # must happen before Wilfred (the database module) is imported
+    os.environ.update(env)
+
+    from benchmarks.fixtures import write_images, write_configuration, fill_database
+    from tabulate import tabulate
+
+    write_configuration(f"{root}/config/wilfred", f"{root}/data/wilfred/servers")
+    server_ids = fill_database(
+        SERVERS,
+        write_images(f"{root}/config/wilfred", 2),
+        f"{root}/data/wilfred/servers",
+    )
+
+    daemon = FakeDockerDaemon(f"{root}/docker.sock", server_ids[: SERVERS // 2])
+    threading.Thread(target=daemon.serve_forever, daemon=True).start()
+
+    failed = False
+    rows = []
+
+    try:
+        interpreter = median(
+            _run([sys.executable, "-c", "pass"], env)[0] for _ in range(repeat)
+        )
+
+        for name, arguments, target in TARGETS:
+            timings = []
+
+            for _ in range(repeat):
+                duration, result = _run(
+                    [
+                        sys.executable,
+                        "-c",
+                        "from wilfred.wilfred import main; main()",
+                        *arguments,
+                    ],
+                    env,
+                )
+                timings.append(duration)
+
+                if result.returncode != 0:
+                    break
+
+            overhead = (median(timings) - interpreter) * 1000
+
+            if result.returncode != 0:
+                outcome = f"failed (exit code {result.returncode})"
+                click.echo(result.stderr.decode("utf-8", errors="replace"), err=True)
+            else:
+                outcome = "ok" if overhead <= target else "over target"
+
+            failed = failed or outcome != "ok"
+
+            rows.append(
+                {
+                    "command": f"wilfred {name}",
+                    "median (ms)": round(median(timings) * 1000, 1),
+                    "startup (ms)": round(overhead, 1),
+                    "target (ms)": target,
+                    "": outcome,
+                }
+            )
+    finally:
+        daemon.shutdown()
+        daemon.server_close()
+        rmtree(root, ignore_errors=True)
+
+    click.echo(f"bare interpreter: {round(interpreter * 1000, 1)} ms")
+    click.echo(tabulate(rows, headers="keys"))
+
+    if failed:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    startup()
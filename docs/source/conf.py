@@ -14,7 +14,6 @@ import os
 import sys
 
 sys.path.insert(0, os.path.abspath("../.."))
-os.environ["WILFRED_SKIP_DOCKER"] = "true"
 
 
 # -- Project information -----------------------------------------------------
@@ -62,5 +62,10 @@ setup(
         "pyyaml",
         "pypiwin32 ; platform_system=='Windows'",
     ],
-    entry_points={"console_scripts": ["wilfred=wilfred.wilfred:main"]},
+    entry_points={
+        "console_scripts": [
+            "wilfred=wilfred.wilfred:main",
+            "wilfredd=wilfred.daemon:main",
+        ]
+    },
 )
@@ -8,7 +8,12 @@
 #                                                               #
 #################################################################
 
+import json
+
 from click.testing import CliRunner
+from datetime import datetime
+
+from wilfred import core
 from wilfred.wilfred import cli
 
 
@@ -31,3 +36,42 @@ def test_path():
     result = runner.invoke(cli, "--path")
 
     assert result.exit_code == 0
+
+
+def test_release_check(tmp_path, monkeypatch, capsys):
+    refreshed = []
+
+    monkeypatch.delenv(core.RELEASE_CHECK_DISABLE, raising=False)
+    monkeypatch.setattr(
+        core, "get_release_cache_path", lambda: f"{tmp_path}/release_cache.json"
+    )
+    monkeypatch.setattr(
+        core, "_refresh_release_cache_in_background", lambda: refreshed.append(1)
+    )
+
+    # nothing cached yet, refreshed in the background
+    core.check_for_new_releases()
+
+    assert refreshed and not capsys.readouterr().out
+
+    with open(tmp_path / "release_cache.json", "w") as f:
+        json.dump(
+            {
+                "time": str(datetime.now()),
+                "version": core.version,
+                "url": core._release_source()[0],
+                "latest": "v999.0.0",
+            },
+            f,
+        )
+
+    refreshed.clear()
+    core.check_for_new_releases()
+
+    assert not refreshed and "v999.0.0" in capsys.readouterr().out
+
+    core.check_for_new_releases(configuration={"update_check": False})
+    monkeypatch.setenv(core.RELEASE_CHECK_DISABLE, "1")
+    core.check_for_new_releases()
+
+    assert not capsys.readouterr().out
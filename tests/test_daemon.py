@@ -0,0 +1,105 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import click
+import pytest
+import socketserver
+import threading
+
+from types import SimpleNamespace
+
+from wilfred import daemon
+from wilfred.api.servers import Servers
+
+# e.g. Windows
+unix_sockets = pytest.mark.skipif(
+    not hasattr(socketserver, "ThreadingUnixStreamServer"), reason="no Unix sockets"
+)
+
+
+class _Daemon(daemon.Daemon):
+    def run(self, args, write, color=False, columns=80):
+        write("stdout", f"ran {' '.join(args)}\n")
+
+        return 3
+
+
+@unix_sockets
+def test_forward(tmp_path, monkeypatch, capsys):
+    monkeypatch.setenv(daemon.SOCKET_ENV, f"{tmp_path}/wilfredd.sock")
+
+    # not running, commands run in-process
+    assert daemon.forward(["servers"]) is None
+
+    server = _Daemon()
+    server._bind(socketserver.ThreadingUnixStreamServer)
+    threading.Thread(target=server._server.serve_forever, daemon=True).start()
+
+    try:
+        assert daemon.forward(["stop", "--all"]) == 3
+        assert capsys.readouterr().out == "ran stop --all\n"
+
+        # interactive commands always run in-process
+        assert daemon.forward(["start", "test", "--console"]) is None
+        assert daemon.forward(["top"]) is None
+
+        assert daemon.request("ping")["pid"]
+
+        # while another command runs, commands run in-process instead of waiting
+        with server._busy:
+            assert daemon.forward(["servers"]) is None
+
+        # clients of another version are refused
+        with daemon._connect() as sock:
+            daemon._send(sock, {"op": "ping", "version": "0.0.0"})
+
+            assert "error" in next(daemon._receive(sock))
+    finally:
+        server._server.shutdown()
+        server._server.server_close()
+
+
+def test_no_unix_sockets(tmp_path, monkeypatch):
+    socket_path = tmp_path / "wilfredd.sock"
+    socket_path.touch()
+
+    monkeypatch.setenv(daemon.SOCKET_ENV, str(socket_path))
+    monkeypatch.delattr(daemon.socket, "AF_UNIX")
+
+    # e.g. Windows, commands always run in-process
+    assert daemon.forward(["servers"]) is None
+    assert daemon.remote_stats() is None
+
+
+def test_run_state(monkeypatch, capsys):
+    from wilfred import wilfred
+
+    @click.command()
+    def width():
+        click.echo(wilfred.terminal_width())
+
+    server = daemon.Daemon("wilfredd.sock")
+
+    # the width of the client, without touching the environment of the daemon
+    assert server._invoke(width, [], False, 123) == 0
+    assert capsys.readouterr().out == "123\n"
+
+    # the watcher gets the configuration and images read by the latest command
+    config = SimpleNamespace(configuration={"data_path": "/srv"})
+    images = object()
+
+    monkeypatch.setattr(wilfred, "get_config", lambda: config)
+    monkeypatch.setattr(wilfred, "get_images", lambda: images)
+
+    server._servers = Servers(None, {}, None)
+    server._reload()
+
+    assert server._servers._configuration is config.configuration
+    assert server._servers._images is images
@@ -0,0 +1,46 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+from sqlalchemy import create_engine, inspect
+
+from wilfred.database import migrate, SCHEMA_VERSION
+
+
+def _user_version(engine):
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+
+def test_migrate(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path}/wilfred.sqlite")
+
+    # schema of databases created before migrations were versioned
+    with engine.begin() as conn:
+        conn.exec_driver_sql("CREATE TABLE servers (id VARCHAR NOT NULL PRIMARY KEY)")
+        conn.exec_driver_sql(
+            "CREATE TABLE environment_variables (id INTEGER NOT NULL PRIMARY KEY, "
+            "server_id VARCHAR, variable VARCHAR, value VARCHAR)"
+        )
+        conn.exec_driver_sql(
+            "CREATE TABLE ports (id INTEGER NOT NULL PRIMARY KEY, server_id VARCHAR, port INTEGER)"
+        )
+
+    migrate(engine)
+
+    assert _user_version(engine) == SCHEMA_VERSION
+    assert [
+        index["column_names"]
+        for index in inspect(engine).get_indexes("environment_variables")
+    ] == [["server_id", "variable"]]
+
+    # up to date, nothing to do
+    migrate(engine)
+
+    assert _user_version(engine) == SCHEMA_VERSION
@@ -0,0 +1,121 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import pytest
+import socket
+
+from wilfred.exporter import Exporter, render, _http_server
+
+
+def _server(i, status="running", name=None):
+    return {
+        "id": f"id{i}",
+        "name": name or f"server{i}",
+        "image_uid": "minecraft-vanilla",
+        "status": status,
+    }
+
+
+def _sample(container_id="c1"):
+    return {
+        "id": container_id,
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": 50},
+            "system_cpu_usage": 100,
+            "online_cpus": 1,
+        },
+        "precpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0},
+        "memory_stats": {"usage": 512, "limit": 1024},
+        "networks": {"eth0": {"rx_bytes": 10, "tx_bytes": 20}},
+        "blkio_stats": {
+            "io_service_bytes_recursive": [
+                {"op": "Read", "value": 30},
+                {"op": "write", "value": 40},
+            ]
+        },
+    }
+
+
+class _Servers(object):
+    def subscribe_stats(self):
+        return None
+
+
+def test_render():
+    servers = [_server(0), _server(1, status="stopped", name='a "quoted"\\name\n')]
+    lines = render(servers, {"id0": _sample()}, {"id0": 2}).splitlines()
+
+    labels = 'id="id0",name="server0",image_uid="minecraft-vanilla"'
+    escaped = 'id="id1",name="a \\"quoted\\"\\\\name\\n",image_uid="minecraft-vanilla"'
+
+    # one line per status, only the current one is set
+    assert "# TYPE wilfred_server_status stateset" in lines
+    assert (
+        f'wilfred_server_status{{{labels},wilfred_server_status="running"}} 1' in lines
+    )
+    assert (
+        f'wilfred_server_status{{{labels},wilfred_server_status="stopped"}} 0' in lines
+    )
+    assert (
+        f'wilfred_server_status{{{escaped},wilfred_server_status="stopped"}} 1' in lines
+    )
+
+    # gauges as they are, counters with the _total suffix on the sample only
+    assert f"wilfred_server_cpu_percent{{{labels}}} 50.0" in lines
+    assert f"wilfred_server_memory_used_bytes{{{labels}}} 512" in lines
+    assert "# TYPE wilfred_server_network_receive_bytes counter" in lines
+    assert f"wilfred_server_network_receive_bytes_total{{{labels}}} 10" in lines
+    assert f"wilfred_server_block_write_bytes_total{{{labels}}} 40" in lines
+
+    # no samples for stopped servers, restarts for all
+    assert not any(
+        line.startswith("wilfred_server_cpu_percent{") and "id1" in line
+        for line in lines
+    )
+    assert f"wilfred_server_restarts_total{{{labels}}} 2" in lines
+    assert f"wilfred_server_restarts_total{{{escaped}}} 0" in lines
+
+    assert lines[-1] == "# EOF"
+    assert render([], {}, {}).endswith("# EOF\n")
+
+
+def test_count_restarts():
+    exporter = Exporter(_Servers())
+
+    exporter._count_restarts({"id0": _sample("c1"), "id1": _sample("c9")})
+    exporter._count_restarts({"id0": _sample("c1")})
+
+    assert exporter._restarts == {}
+
+    # started again, in a new container
+    exporter._count_restarts({"id0": _sample("c2"), "id1": _sample("c9")})
+    exporter._count_restarts({"id0": _sample("c3")})
+
+    assert exporter._restarts == {"id0": 2}
+
+
+@pytest.mark.skipif(not socket.has_ipv6, reason="no IPv6")
+def test_http_server_ipv6():
+    try:
+        httpd = _http_server("::1", 0, None)
+    except OSError:
+        pytest.skip("IPv6 loopback not available")
+
+    try:
+        assert httpd.socket.family == socket.AF_INET6
+    finally:
+        httpd.server_close()
+
+    httpd = _http_server("127.0.0.1", 0, None)
+
+    try:
+        assert httpd.socket.family == socket.AF_INET
+    finally:
+        httpd.server_close()
@@ -0,0 +1,67 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+from wilfred.api.history import ResourceHistory
+
+
+def _sample(i):
+    return {
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": 100 + i * 10},
+            "system_cpu_usage": 1000 + i * 100,
+            "online_cpus": 1,
+        },
+        "precpu_stats": {"cpu_usage": {"total_usage": 100}, "system_cpu_usage": 1000},
+        "memory_stats": {"usage": i * 1024 * 1024, "limit": 1024 * 1024 * 1024},
+        "networks": {"eth0": {"rx_bytes": i * 1000, "tx_bytes": 0}},
+    }
+
+
+def test_history_ring_buffer(tmp_path):
+    history = ResourceHistory(str(tmp_path), capacity=5)
+
+    for i in range(8):
+        history.record("test", _sample(i), timestamp=1000 + i)
+
+    # oldest samples are overwritten
+    assert [s["time"] for s in history.samples("test")] == [
+        1007,
+        1006,
+        1005,
+        1004,
+        1003,
+    ]
+
+    summary = history.summary("test", since=1005)
+
+    assert summary["samples"] == 3
+    assert summary["memory_used"]["max"] == 7 * 1024 * 1024
+    assert summary["network_rx"]["avg"] == 1000
+    assert summary["block_read"] is None
+
+
+def test_history_several_recorders(tmp_path):
+    # e.g. wilfredd and `wilfred top`, both recording the same server
+    recorders = [ResourceHistory(str(tmp_path), capacity=100) for _ in range(2)]
+
+    for i in range(20):
+        for recorder in recorders:
+            recorder.record(
+                "test", _sample(i), timestamp=1000 + i * 15, min_spacing=7.5
+            )
+
+    times = [s["time"] for s in recorders[0].samples("test")]
+
+    assert times == [1000 + i * 15 for i in reversed(range(20))]
+
+    summary = recorders[1].summary("test")
+
+    assert summary["memory_used"]["p95"] == 18 * 1024 * 1024
+    assert summary["memory_used"]["last"] == 19 * 1024 * 1024
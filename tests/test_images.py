@@ -0,0 +1,206 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import json
+import os
+import pytest
+import threading
+
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from io import BytesIO
+from zipfile import ZipFile
+
+from wilfred.api.images import Images, ImagesDownloadError
+from wilfred.version import version
+
+
+def _images(tmp_path):
+    images = Images()
+    images.config_dir = str(tmp_path)
+    images.image_dir = f"{tmp_path}/images"
+    images.index_path = f"{tmp_path}/image_index.json"
+
+    return images
+
+
+def _write_image(path, name):
+    with open(path) as f:
+        image = json.load(f)
+
+    image["name"] = name
+
+    with open(path, "w") as f:
+        json.dump(image, f)
+
+    # make sure the modification is visible even on coarse timestamps
+    os.utime(path, ns=(0, os.stat(path).st_mtime_ns + 10**9))
+
+
+def test_image_index(tmp_path, monkeypatch):
+    (tmp_path / "images" / "default" / "minecraft").mkdir(parents=True)
+
+    with open(tmp_path / "image_cache.json", "w") as f:
+        json.dump({"time": str(datetime.now()), "version": version}, f)
+
+    with open(tmp_path / "images" / "default" / "minecraft" / "test.json", "w") as f:
+        json.dump(
+            {
+                "meta": {"api_version": 2},
+                "uid": "test",
+                "name": "Test",
+                "author": "info@wilfredproject.org",
+                "docker_image": "wilfreddev/java:latest",
+                "command": "java -jar server.jar",
+                "default_port": "25565",
+                "user": "container",
+                "stop_command": "stop",
+                "default_image": True,
+                "variables": [],
+                "installation": {
+                    "docker_image": "wilfreddev/alpine:latest",
+                    "shell": "/bin/ash",
+                    "script": [],
+                },
+                "config": {"files": []},
+            },
+            f,
+        )
+
+    assert _images(tmp_path).read_images()
+    assert os.path.isfile(tmp_path / "image_index.json")
+
+    # warm start, images are not parsed again
+    monkeypatch.setattr(Images, "_verify", lambda *args: 1 / 0)
+
+    images = _images(tmp_path)
+    images.read_images()
+
+    assert images.get_image("test")["name"] == "Test"
+    assert images.get_image("missing") is None
+    assert images.image_fetch_version == version
+
+    # shared by all callers, read-only
+    with pytest.raises(TypeError):
+        images.get_image("test")["name"] = "Changed"
+
+    assert "installation" not in images.data_strip_non_ui()[0]
+    assert images.ui[0]["uid"] == images.by_uid["test"]["uid"]
+
+    # modified image, index is rebuilt
+    monkeypatch.undo()
+    _write_image(tmp_path / "images" / "default" / "minecraft" / "test.json", "New")
+
+    images = _images(tmp_path)
+    images.read_images()
+
+    assert images.get_image("test")["name"] == "New"
+
+
+def _archive():
+    buffer = BytesIO()
+
+    with ZipFile(buffer, "w") as obj:
+        obj.writestr("images-master/README.md", "not extracted")
+        obj.writestr("images-master/images/minecraft/test.json", "{}")
+
+    return buffer.getvalue()
+
+
+class _ArchiveHandler(BaseHTTPRequestHandler):
+    archive = _archive()
+
+    def do_GET(self):
+        if not self.path.startswith("/images/"):
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        self.server.requests.append(self.path)
+
+        if self.headers.get("If-None-Match") == '"v1"':
+            self.send_response(304)
+            self.end_headers()
+            return
+
+        self.send_response(200)
+        self.send_header("ETag", '"v1"')
+        self.send_header("Content-Length", str(len(self.archive)))
+        self.end_headers()
+        self.wfile.write(self.archive)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def test_download(tmp_path):
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _ArchiveHandler)
+    server.requests = []
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    url = f"http://127.0.0.1:{server.server_port}"
+    mirrors = [f"{url}/missing/{{branch}}.zip", f"{url}/images/{{branch}}.zip"]
+
+    try:
+        images = _images(tmp_path)
+
+        assert images.download(mirrors=mirrors)
+        assert os.listdir(tmp_path / "images" / "default") == ["minecraft"]
+        assert sorted(os.listdir(tmp_path)) == ["image_cache.json", "images"]
+
+        # unchanged archive, nothing is extracted
+        assert not images.download(mirrors=mirrors)
+        assert os.path.isfile(
+            tmp_path / "images" / "default" / "minecraft" / "test.json"
+        )
+        assert len(server.requests) == 2
+
+        with pytest.raises(ImagesDownloadError):
+            images.download(mirrors=[f"{url}/missing/{{branch}}.zip"])
+
+        assert os.path.isdir(tmp_path / "images" / "default" / "minecraft")
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_install(tmp_path):
+    images = _images(tmp_path)
+
+    with open(tmp_path / "images.zip", "wb") as f:
+        f.write(_archive())
+
+    # images downloaded by earlier versions, a directory
+    (tmp_path / "images" / "default" / "old").mkdir(parents=True)
+
+    for _ in range(3):
+        images._install(tmp_path / "images.zip")
+
+        assert os.listdir(tmp_path / "images" / "default") == ["minecraft"]
+
+    entries = sorted(os.listdir(tmp_path / "images"))
+
+    # a link to the latest images, older ones are removed
+    if os.path.islink(tmp_path / "images" / "default"):
+        assert len(entries) == 2 and entries[0].startswith(".default-")
+        assert os.readlink(tmp_path / "images" / "default") == entries[0]
+    else:
+        assert entries == ["default"]
+
+    # hidden directories (e.g. images being installed) are not read
+    os.remove(tmp_path / "images" / "default" / "minecraft" / "test.json")
+    (tmp_path / "images" / ".default-partial").mkdir()
+    (tmp_path / "images" / ".default-partial" / "broken.json").write_text("{")
+
+    with open(tmp_path / "image_cache.json", "w") as f:
+        json.dump({"time": str(datetime.now()), "version": version}, f)
+
+    assert images.read_images()
+    assert images.images == []
@@ -0,0 +1,89 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import os
+
+from wilfred.api.parser.properties import properties_read, properties_write_many
+
+PROPERTIES = (
+    "#Minecraft server properties\r\n"
+    "! another comment\r\n"
+    "motd = A \\u00a76Minecraft\\tServer\r\n"
+    "level-name:world\r\n"
+    "server-ip\r\n"
+    "  spawn-protection   16\r\n"
+    "generator-settings=first,\\\r\n"
+    "    second\r\n"
+    "key\\=with\\:separators=value\r\n"
+    "pvp=true"
+)
+
+
+def test_read(tmp_path):
+    path = tmp_path / "server.properties"
+    path.write_bytes(PROPERTIES.encode("utf-8"))
+
+    assert properties_read(path) == {
+        "motd": "A §6Minecraft\tServer",
+        "level-name": "world",
+        "server-ip": "",
+        "spawn-protection": "16",
+        "generator-settings": "first,second",
+        "key=with:separators": "value",
+        "pvp": "true",
+    }
+
+
+def test_write(tmp_path):
+    path = tmp_path / "server.properties"
+    path.write_bytes(PROPERTIES.encode("utf-8"))
+
+    changed = properties_write_many(
+        path,
+        {
+            "server-ip": "127.0.0.1",
+            "spawn-protection": 0,
+            "generator-settings": "",
+            "key=with:separators": " spaced\\",
+            "pvp": True,
+            "missing": "ignored",
+        },
+    )
+
+    assert changed == {
+        "server-ip",
+        "spawn-protection",
+        "generator-settings",
+        "key=with:separators",
+    }
+
+    # only the changed lines differ, the missing trailing newline is kept
+    assert path.read_bytes().decode("utf-8") == (
+        "#Minecraft server properties\r\n"
+        "! another comment\r\n"
+        "motd = A \\u00a76Minecraft\\tServer\r\n"
+        "level-name:world\r\n"
+        "server-ip=127.0.0.1\r\n"
+        "  spawn-protection   0\r\n"
+        "generator-settings=\r\n"
+        "key\\=with\\:separators=\\ spaced\\\\\r\n"
+        "pvp=true"
+    )
+
+    assert properties_read(path)["key=with:separators"] == " spaced\\"
+
+    # nothing changed, the file is left alone
+    inode = os.stat(path).st_ino
+
+    assert (
+        properties_write_many(path, {"pvp": "true", "server-ip": "127.0.0.1"}) == set()
+    )
+    assert os.stat(path).st_ino == inode
+    assert os.listdir(tmp_path) == ["server.properties"]
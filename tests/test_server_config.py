@@ -0,0 +1,126 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import os
+
+from types import SimpleNamespace
+
+from wilfred.api import server_config
+from wilfred.api.server_config import ServerConfig
+
+IMAGE = {
+    "config": {
+        "files": [
+            {
+                "filename": "server.properties",
+                "parser": "properties",
+                "environment": [],
+                "action": {},
+            },
+            {
+                "filename": "bukkit.yml",
+                "parser": "yaml",
+                "environment": [],
+                "action": {},
+            },
+        ]
+    }
+}
+
+
+def test_parse_cache(tmp_path, monkeypatch):
+    server = SimpleNamespace(id="abcd1234", name="test")
+    path = tmp_path / "servers" / "test_abcd1234"
+    path.mkdir(parents=True)
+
+    (path / "server.properties").write_text("motd=A Minecraft Server\nmax-players=20\n")
+    (path / "bukkit.yml").write_text("settings:\n  allow-end: true\n")
+
+    monkeypatch.setattr(
+        server_config,
+        "get_cache_path",
+        lambda server_id: f"{tmp_path}/{server_id}.json",
+    )
+
+    def _config():
+        return ServerConfig({"data_path": f"{tmp_path}/servers"}, None, server, IMAGE)
+
+    assert _config().raw[1]["settings/allow-end"] is True
+    assert os.path.isfile(tmp_path / "abcd1234.json")
+
+    # unchanged files are not parsed again
+    monkeypatch.setitem(server_config.PARSERS, "yaml", lambda path: 1 / 0)
+
+    assert _config().raw[0]["motd"] == "A Minecraft Server"
+
+    # changed files are
+    (path / "server.properties").write_text("motd=Changed\n")
+
+    assert _config().raw[0] == {
+        "motd": "Changed",
+        "_wilfred_config_filename": "server.properties",
+    }
+
+    # only files that may contain the variable are read
+    monkeypatch.setitem(server_config.PARSERS, "properties", lambda path: 1 / 0)
+
+    occurrences = _config().occurrences("settings/allow-end")
+
+    assert [x["_wilfred_config_filename"] for x in occurrences] == ["bukkit.yml"]
+
+
+def test_apply(tmp_path, monkeypatch):
+    server = SimpleNamespace(id="abcd1234", name="test")
+    path = tmp_path / "servers" / "test_abcd1234"
+    path.mkdir(parents=True)
+
+    (path / "server.properties").write_text("motd=A Minecraft Server\nmax-players=20\n")
+    (path / "bukkit.yml").write_text("settings:\n  allow-end: true\n")
+
+    monkeypatch.setattr(
+        server_config,
+        "get_cache_path",
+        lambda server_id: f"{tmp_path}/{server_id}.json",
+    )
+
+    config = ServerConfig({"data_path": f"{tmp_path}/servers"}, None, server, IMAGE)
+    assert config.raw[0]["max-players"] == "20"
+
+    changed = config.apply(
+        [
+            ("server.properties", "motd", "Changed"),
+            ("server.properties", "max-players", "20"),
+            ("bukkit.yml", "settings/allow-end", "false"),
+            ("bukkit.yml", "settings/missing", "ignored"),
+        ]
+    )
+
+    assert changed == {
+        ("server.properties", "motd"),
+        ("bukkit.yml", "settings/allow-end"),
+    }
+
+    assert (path / "server.properties").read_text() == "motd=Changed\nmax-players=20\n"
+    assert config.raw[0]["motd"] == "Changed"
+    assert config.raw[1]["settings/allow-end"] is False
+
+    # nothing changed, the files are not written again
+    inodes = [os.stat(path / x).st_ino for x in ("server.properties", "bukkit.yml")]
+
+    assert not config.apply(
+        [
+            ("server.properties", "motd", "Changed"),
+            ("bukkit.yml", "settings/allow-end", "false"),
+        ]
+    )
+    assert [
+        os.stat(path / x).st_ino for x in ("server.properties", "bukkit.yml")
+    ] == inodes
+    assert sorted(os.listdir(path)) == ["bukkit.yml", "server.properties"]
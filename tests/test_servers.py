@@ -0,0 +1,133 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import threading
+
+from time import monotonic
+from types import SimpleNamespace
+
+from benchmarks.fake_docker import FakeDockerClient
+from wilfred.api import servers as servers_module
+from wilfred.api.servers import Servers, RESTART_LIMIT, SNAPSHOT_TTL
+
+
+class _Timer(object):
+    """records delayed restarts instead of running them"""
+
+    delays = []
+
+    def __init__(self, delay, function, args=()):
+        self.delays.append(delay)
+
+    def start(self):
+        pass
+
+
+def test_restart_backoff(monkeypatch):
+    servers = Servers(None, {}, None)
+    server = SimpleNamespace(id="abcd1234", name="test", status="running")
+    started = []
+
+    monkeypatch.setattr(servers, "_start", lambda server: started.append(server.id))
+    monkeypatch.setattr(
+        servers, "set_status", lambda server, status: setattr(server, "status", status)
+    )
+    monkeypatch.setattr(servers_module.threading, "Timer", _Timer)
+
+    # restarted right away the first time, later restarts are delayed
+    assert servers._restart_crashed(server, None) == "restarted"
+    assert started == ["abcd1234"]
+
+    for _ in range(RESTART_LIMIT - 1):
+        assert servers._restart_crashed(server, None).startswith("restarting in")
+
+    assert _Timer.delays == [5, 10, 20, 40]
+
+    # crash loop, given up on
+    assert servers._restart_crashed(server, None) == "stopped, crashed 5 times in a row"
+    assert server.status == "stopped"
+
+    # failed restarts are retried
+    server.status = "running"
+    monkeypatch.setattr(servers, "_start", lambda server: 1 / 0)
+
+    assert servers._restart_crashed(server, None).startswith(
+        "restart failed, division by zero, restarting in 5s"
+    )
+
+
+def test_collect_stats_stuck():
+    client = FakeDockerClient()
+    released = threading.Event()
+
+    for i in range(4):
+        client.containers.add(f"wilfred_server{i}")
+
+    client.containers.add("wilfred_exited", status="exited")
+
+    # never answers until the end of the test
+    stuck = client.containers._containers["wilfred_server0"]
+    stuck.stats = lambda stream=True, decode=False: released.wait()
+
+    servers = Servers(client, {}, None)
+    started = monotonic()
+
+    try:
+        results = servers._collect_stats(
+            [f"server{i}" for i in range(4)] + ["exited", "missing"],
+            workers=2,
+            timeout=0.5,
+        )
+    finally:
+        released.set()
+
+    # the other containers are served by the remaining worker
+    assert monotonic() - started < 1.5
+    assert results["server0"] == "timeout"
+    assert all(isinstance(results[f"server{i}"], dict) for i in range(1, 4))
+    assert results["exited"] == results["missing"] == "-"
+
+
+def test_container_snapshot(monkeypatch):
+    client = FakeDockerClient()
+    servers = Servers(client, {}, None)
+    now = [1000.0]
+
+    monkeypatch.setattr(servers_module, "monotonic", lambda: now[0])
+
+    for i in range(3):
+        client.containers.add(f"wilfred_server{i}")
+
+    client.containers.add("wilfred_server3", status="exited")
+    client.containers.add("unrelated")
+
+    # e.g. `wilfred servers`, sync and statistics share a single listing
+    assert servers._container_states() == {
+        "server0": "running",
+        "server1": "running",
+        "server2": "running",
+        "server3": "exited",
+    }
+    assert servers._container_alive(SimpleNamespace(id="server1"))
+    assert set(servers._collect_stats(["server0", "server3"])) == {"server0", "server3"}
+
+    assert client.calls["containers.list"] == 1
+
+    # expired
+    now[0] += SNAPSHOT_TTL + 1
+    servers._container_states()
+
+    assert client.calls["containers.list"] == 2
+
+    # starting a container invalidates the snapshot
+    servers._run({"image": "test", "name": "wilfred_server4"})
+
+    assert "server4" in servers._container_states()
+    assert client.calls["containers.list"] == 3
@@ -0,0 +1,67 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+from time import monotonic, sleep
+
+from benchmarks.fake_docker import FakeDockerClient
+from wilfred.api.stats import StatsSubscriptions, running_server_ids
+
+
+def _wait_for(condition, timeout=5):
+    deadline = monotonic() + timeout
+
+    while not condition():
+        assert monotonic() < deadline, "timed out"
+        sleep(0.01)
+
+
+def _servers(statuses):
+    return [
+        {"id": server_id, "status": status} for server_id, status in statuses.items()
+    ]
+
+
+def test_subscriptions():
+    client = FakeDockerClient()
+    subscriptions = StatsSubscriptions(client)
+
+    for server_id in ("a", "b", "c"):
+        client.containers.add(f"wilfred_{server_id}")
+
+    statuses = {"a": "running", "b": "installing", "c": "stopped"}
+
+    try:
+        subscriptions.update(running_server_ids(_servers(statuses)))
+
+        # stopped servers have no subscription
+        _wait_for(lambda: set(subscriptions.latest()) == {"a", "b"})
+        assert set(subscriptions._subscriptions) == {"a", "b"}
+
+        # started, stopped, kept
+        statuses.update({"a": "stopped", "c": "running"})
+        subscriptions.update(running_server_ids(_servers(statuses)))
+
+        assert set(subscriptions._subscriptions) == {"b", "c"}
+        assert "a" not in subscriptions.latest()
+        _wait_for(lambda: set(subscriptions.latest()) == {"b", "c"})
+
+        # one stream per container, existing subscriptions are kept
+        assert client.calls["container.stats"] == 3
+
+        # container gone, the subscription ends by itself
+        client.containers.remove("wilfred_b")
+        _wait_for(lambda: "b" not in subscriptions._subscriptions)
+
+        assert set(subscriptions.latest()) == {"c"}
+    finally:
+        subscriptions.close()
+
+    assert subscriptions._subscriptions == {}
+    assert subscriptions.latest() == {}
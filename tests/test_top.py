@@ -0,0 +1,68 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+from wilfred.top import TopView
+
+
+def _server(i):
+    return {
+        "id": f"id{i}",
+        "name": f"server{i}",
+        "image_uid": "minecraft-vanilla",
+        "memory": 1024,
+        "port": 25565 + i,
+        "custom_startup": None,
+        "status": "running",
+    }
+
+
+def _sample(cpu):
+    return {
+        "cpu_stats": {
+            "cpu_usage": {"total_usage": cpu},
+            "system_cpu_usage": 100,
+            "online_cpus": 1,
+        },
+        "precpu_stats": {"cpu_usage": {"total_usage": 0}, "system_cpu_usage": 0},
+        "memory_stats": {"usage": 1024 * 1024, "limit": 1024 * 1024 * 1024},
+    }
+
+
+def test_top_view():
+    servers = [_server(i) for i in range(3)]
+    samples = {"id0": _sample(10), "id1": _sample(20)}
+    view = TopView(sort="cpu", reverse=True)
+
+    first = view.render(servers, samples, size=(120, 20))
+
+    # busiest server first, servers without statistics last
+    assert first.index("server1") < first.index("server0") < first.index("server2")
+
+    # unchanged frames are not redrawn
+    assert view.render(servers, samples, size=(120, 20)) == ""
+
+    samples["id0"] = _sample(15)
+    update = view.render(servers, samples, size=(120, 20))
+
+    assert "15.0%" in update
+    assert "server1" not in update
+
+    # wider values are cell updates too
+    samples["id0"] = _sample(9)
+    view.render(servers, samples, size=(120, 20))
+    samples["id0"] = _sample(100)
+    update = view.render(servers, samples, size=(120, 20))
+
+    assert "100.0%" in update
+    assert "\x1b[2J" not in update
+
+    assert view.handle_keys("/server2\r")
+    assert "server0" not in view.render(servers, samples, size=(120, 20))
+    assert not view.handle_keys("q")
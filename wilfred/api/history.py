@@ -0,0 +1,362 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import mmap
+import struct
+import threading
+
+from appdirs import user_data_dir
+from array import array
+from contextlib import contextmanager
+from heapq import nlargest
+from math import ceil, isnan
+from os import remove, replace
+from os.path import getsize, isfile
+from pathlib import Path
+from time import time
+
+from wilfred.api.stats import cpu_percent, memory_usage, network_io, block_io
+from wilfred.errors import WilfredException, ReadError
+
+# one sample every 15 seconds, one week of history (~2.6 MB per server)
+SAMPLE_INTERVAL = 15
+CAPACITY = 40320
+
+FIELDS = (
+    "time",
+    "cpu",
+    "memory_used",
+    "memory_limit",
+    "network_rx",
+    "network_tx",
+    "block_read",
+    "block_write",
+)
+
+# magic, capacity and number of samples written in total
+_HEADER = struct.Struct("<4sIQ")
+_RECORD = struct.Struct(f"<{len(FIELDS)}d")
+_MAGIC = b"WRB1"
+
+
+class HistoryNotFound(WilfredException):
+    """No resource history recorded for server"""
+
+
+class RingBuffer(object):
+    """
+    Fixed-size ring buffer of samples stored in a memory-mapped file
+
+    The file consists of a small header followed by `capacity` records of
+    packed doubles, the oldest record is overwritten once the buffer is full.
+    Appends are serialized between processes (e.g. `wilfred top` and wilfredd)
+    using an exclusive lock on the file, where available (POSIX).
+    """
+
+    def __init__(self, path, capacity=CAPACITY, create=True):
+        if not isfile(path):
+            if not create:
+                raise HistoryNotFound(f"no history at {path}")
+
+            # create the file in full before making it visible to readers
+            with open(f"{path}.tmp", "wb") as f:
+                f.write(_HEADER.pack(_MAGIC, capacity, 0))
+                f.truncate(_HEADER.size + capacity * _RECORD.size)
+
+            replace(f"{path}.tmp", path)
+
+        self._file = open(path, "r+b")
+        self._mmap = mmap.mmap(self._file.fileno(), 0)
+
+        magic, self.capacity, _ = _HEADER.unpack_from(self._mmap, 0)
+
+        if (
+            magic != _MAGIC
+            or getsize(path) != _HEADER.size + self.capacity * _RECORD.size
+        ):
+            self.close()
+            raise ReadError(f"{path} is not a valid history file")
+
+    def __len__(self):
+        return min(self._written(), self.capacity)
+
+    def append(self, values, min_spacing=0):
+        """
+        Appends a record, overwriting the oldest record if the buffer is full
+
+        Args:
+            values (tuple): One float per field in `FIELDS`
+            min_spacing (float): Skip the record if the newest record is less than this many seconds older,
+                when several processes record the same server.
+
+        Returns:
+            Returns ``True`` if the record was appended.
+        """
+
+        with self._locked():
+            written = self._written()
+
+            if min_spacing and written:
+                newest = _RECORD.unpack_from(
+                    self._mmap,
+                    _HEADER.size + ((written - 1) % self.capacity) * _RECORD.size,
+                )[0]
+
+                if values[0] - newest < min_spacing:
+                    return False
+
+            _RECORD.pack_into(
+                self._mmap,
+                _HEADER.size + (written % self.capacity) * _RECORD.size,
+                *values,
+            )
+            # only publish the record once it is complete
+            _HEADER.pack_into(self._mmap, 0, _MAGIC, self.capacity, written + 1)
+
+        return True
+
+    def newest_first(self):
+        """Yields records (tuples) from the newest to the oldest, reading them one by one"""
+
+        written = self._written()
+
+        for i in range(written - 1, max(written - self.capacity, 0) - 1, -1):
+            yield _RECORD.unpack_from(
+                self._mmap, _HEADER.size + (i % self.capacity) * _RECORD.size
+            )
+
+    def close(self):
+        self._mmap.close()
+        self._file.close()
+
+    def _written(self):
+        return _HEADER.unpack_from(self._mmap, 0)[2]
+
+    @contextmanager
+    def _locked(self):
+        try:
+            import fcntl
+        except ImportError:
+            # e.g. Windows
+            yield
+            return
+
+        fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+
+        try:
+            yield
+        finally:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+
+
+class ResourceHistory(object):
+    """Per-server history of resource usage, one ring buffer file per server"""
+
+    def __init__(self, path=None, capacity=CAPACITY):
+        """
+        Args:
+            path (str): Directory to store history files in, defaults to the Wilfred data directory
+            capacity (int): Number of samples to keep per server
+        """
+
+        self.path = path if path else f"{user_data_dir()}/wilfred/history"
+        self._capacity = capacity
+        self._buffers = {}
+
+        Path(self.path).mkdir(parents=True, exist_ok=True)
+
+    def record(self, server_id, sample, timestamp=None, min_spacing=0):
+        """
+        Stores the resource usage of a Docker stats sample
+
+        Args:
+            server_id (str): ID of server
+            sample (dict): Stats sample as returned by the Docker API
+            timestamp (float): Unix time of the sample, defaults to now
+            min_spacing (float): Skip the sample if the newest recorded sample is less than this many seconds older
+
+        Returns:
+            Returns ``True`` if the sample was recorded.
+        """
+
+        nan = float("nan")
+
+        cpu = cpu_percent(sample)
+        memory = memory_usage(sample) or (nan, nan)
+        network = network_io(sample) or (nan, nan)
+        block = block_io(sample) or (nan, nan)
+
+        return self._buffer(server_id).append(
+            (
+                timestamp if timestamp else time(),
+                cpu if cpu is not None else nan,
+                *memory,
+                *network,
+                *block,
+            ),
+            min_spacing=min_spacing,
+        )
+
+    def samples(self, server_id, since=None):
+        """
+        Yields samples of server from the newest to the oldest
+
+        Args:
+            server_id (str): ID of server
+            since (float): Unix time, stops at the first sample older than this
+
+        Raises:
+            :py:class:`HistoryNotFound`
+                If no history has been recorded for the server
+        """
+
+        for values in self._buffer(server_id, create=False).newest_first():
+            if since is not None and values[0] < since:
+                return
+
+            yield dict(zip(FIELDS, values))
+
+    def summary(self, server_id, since=None):
+        """
+        Summarizes the resource usage of server
+
+        CPU and memory are summarized as recorded, network and block I/O as
+        transfer rates (bytes per second) between consecutive samples. The values
+        of the window are held in memory (8 bytes each, ~2 MB for a full week), the
+        p95 only keeps the largest 5% sorted.
+
+        Args:
+            server_id (str): ID of server
+            since (float): Unix time, only include samples newer than this
+
+        Returns:
+            Returns ``dict`` of metric and ``dict`` (`min`, `avg`, `max`, `p95` and `last`),
+            the number of samples is stored under `samples`.
+
+        Raises:
+            :py:class:`HistoryNotFound`
+                If no history has been recorded for the server
+        """
+
+        values = {
+            metric: array("d")
+            for metric in (
+                "cpu",
+                "memory_used",
+                "network_rx",
+                "network_tx",
+                "block_read",
+                "block_write",
+            )
+        }
+        count = 0
+        newer = None
+
+        for sample in self.samples(server_id, since=since):
+            count += 1
+
+            for metric in ("cpu", "memory_used"):
+                if not isnan(sample[metric]):
+                    values[metric].append(sample[metric])
+
+            if newer is not None and newer["time"] > sample["time"]:
+                for metric in ("network_rx", "network_tx", "block_read", "block_write"):
+                    delta = newer[metric] - sample[metric]
+
+                    # negative delta, counters were reset by a container restart
+                    if not isnan(delta) and delta >= 0:
+                        values[metric].append(delta / (newer["time"] - sample["time"]))
+
+            newer = sample
+
+        summary = {"samples": count}
+
+        for metric, _values in values.items():
+            if not _values:
+                summary[metric] = None
+                continue
+
+            # index of the p95 in ascending order, counted from the largest value
+            largest = len(_values) - max(ceil(len(_values) * 0.95) - 1, 0)
+
+            summary[metric] = {
+                "min": min(_values),
+                "avg": sum(_values) / len(_values),
+                "max": max(_values),
+                "p95": nlargest(largest, _values)[-1],
+                # samples are read newest first
+                "last": _values[0],
+            }
+
+        return summary
+
+    def remove(self, server_id):
+        """Removes recorded history of server"""
+
+        if server_id in self._buffers:
+            self._buffers.pop(server_id).close()
+
+        try:
+            remove(f"{self.path}/{server_id}.ring")
+        except FileNotFoundError:
+            pass
+
+    def close(self):
+        for buffer in self._buffers.values():
+            buffer.close()
+
+        self._buffers = {}
+
+    def _buffer(self, server_id, create=True):
+        if server_id not in self._buffers:
+            self._buffers[server_id] = RingBuffer(
+                f"{self.path}/{server_id}.ring",
+                capacity=self._capacity,
+                create=create,
+            )
+
+        return self._buffers[server_id]
+
+
+class Sampler(threading.Thread):
+    """Records the latest samples of stats subscriptions into the resource history periodically"""
+
+    def __init__(self, subscriptions, history, interval=SAMPLE_INTERVAL):
+        """
+        Args:
+            subscriptions (StatsSubscriptions): Subscriptions to read the latest samples from
+            history (ResourceHistory): History to record samples to
+            interval (float): Seconds between samples
+        """
+
+        self._subscriptions = subscriptions
+        self._history = history
+        self._interval = interval
+        self._stopped = threading.Event()
+
+        super(Sampler, self).__init__(name="wilfred-sampler", daemon=True)
+
+    def run(self):
+        while not self._stopped.wait(self._interval):
+            self.sample()
+
+    def sample(self):
+        """
+        Records the latest sample of every subscribed container
+
+        Other processes (e.g. wilfredd while `wilfred top` runs) may record the same
+        servers, samples less than half an interval apart are skipped.
+        """
+
+        for server_id, sample in self._subscriptions.latest().items():
+            self._history.record(server_id, sample, min_spacing=self._interval / 2)
+
+    def stop(self):
+        self._stopped.set()
@@ -12,19 +12,39 @@ import json
 
 from appdirs import user_config_dir
 from pathlib import Path
-from os.path import isdir, join, isfile
-from os import walk, remove
-from requests import get
-from zipfile import ZipFile
-from shutil import move, rmtree
-from copy import deepcopy
+from os.path import basename, isdir, isabs, islink, join, normpath, realpath
+from os import walk, listdir, remove, rename, replace, stat, symlink
+from shutil import copyfileobj, rmtree
+from tempfile import mkdtemp, mkstemp
+from zipfile import BadZipFile, ZipFile
 from datetime import datetime, timedelta
+from types import MappingProxyType
 
 from wilfred.errors import WilfredException, ReadError, ParseError
 from wilfred.version import version
 
 API_VERSION = 2
 
+# bump when the layout of the compiled image index changes
+INDEX_FORMAT = 1
+
+# archive of the image repository, tried in order
+DEFAULT_MIRRORS = ("https://github.com/{repo}/archive/{branch}.zip",)
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_TIMEOUT = 30
+
+# keys of image configurations that are not shown to the user
+NON_UI_KEYS = (
+    "meta",
+    "installation",
+    "docker_image",
+    "command",
+    "stop_command",
+    "variables",
+    "user",
+    "config",
+)
+
 
 class ImagesNotPresent(WilfredException):
     """Default images not present on host"""
@@ -42,48 +62,211 @@ class ImagesOutdated(WilfredException):
     """Wilfred images are outdated and require refresh"""
 
 
+class ImagesDownloadError(WilfredException):
+    """Images could not be downloaded"""
+
+
 class Images(object):
     """Manage Wilfred images"""
 
     def __init__(self):
         self.config_dir = f"{user_config_dir()}/wilfred"
         self.image_dir = f"{self.config_dir}/images"
+        self.index_path = f"{self.config_dir}/image_index.json"
         self.images = []
 
+        self._by_uid = {}
+        self._ui = ()
+
+        self._index = None  # loaded image index, `False` if missing or stale
+        self._fetch = None  # contents of image_cache.json
+
         if not isdir(self.image_dir):
             Path(self.image_dir).mkdir(parents=True, exist_ok=True)
 
-    def download(self, branch="master", repo="wilfred-dev/images"):
+    def download(self, branch="master", repo="wilfred-dev/images", mirrors=None):
         """
-        Downloads default Wilfred Images from GitHub
+        Downloads default Wilfred Images from GitHub (or a mirror)
+
+        The archive is streamed to disk and only its `images` folder is extracted.
+        If the archive has not changed since the last download (same ETag), only the
+        fetch time is refreshed. The current images are replaced once the new ones
+        are in place, and are kept if the download fails.
+
+        Args:
+            branch (str): Branch of the image repository
+            repo (str): Image repository on GitHub
+            mirrors (list): URL templates of the repository archive, tried in order. `{repo}` and `{branch}`
+                are replaced. Defaults to `DEFAULT_MIRRORS`.
+
+        Returns:
+            Returns ``True`` if images were updated, ``False`` if they were already up to date.
+
+        Raises:
+            :py:class:`wilfred.api.images.ImagesDownloadError`
+                If the images could not be downloaded from any of the mirrors
         """
 
-        rmtree(f"{self.image_dir}/default", ignore_errors=True)
+        from requests import get
+        from requests.exceptions import RequestException
 
-        with open(f"{self.config_dir}/img.zip", "wb") as f:
-            response = get(
-                f"https://github.com/{repo}/archive/{branch}.zip",
-                stream=True,
-            )
-            f.write(response.content)
+        previous = self._fetch_metadata() or {}
+        present = self.check_if_present()
 
-        with ZipFile(f"{self.config_dir}/img.zip", "r") as obj:
-            obj.extractall(f"{self.config_dir}/temp_images")
+        errors = []
 
-        move(
-            f"{self.config_dir}/temp_images/images-{branch}/images",
-            f"{self.image_dir}/default",
-        )
+        for url in [
+            m.format(repo=repo, branch=branch) for m in mirrors or DEFAULT_MIRRORS
+        ]:
+            headers = {}
+
+            if present and previous.get("url") == url and previous.get("etag"):
+                headers["If-None-Match"] = previous["etag"]
+
+            fd, archive = mkstemp(prefix="images-", suffix=".zip", dir=self.config_dir)
+
+            try:
+                with open(fd, "wb") as f, get(
+                    url, headers=headers, stream=True, timeout=DOWNLOAD_TIMEOUT
+                ) as response:
+                    if response.status_code == 304:
+                        self._write_fetch_metadata(url, previous["etag"])
+
+                        return False
+
+                    if response.status_code != 200:
+                        errors.append(f"{url} responded with {response.status_code}")
+                        continue
+
+                    for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+
+                    etag = response.headers.get("ETag")
+
+                self._install(archive)
+            except (RequestException, OSError, BadZipFile, ReadError) as e:
+                errors.append(f"{url} failed with {type(e).__name__} {str(e)}")
+                continue
+            finally:
+                remove(archive)
+
+            self._write_fetch_metadata(url, etag)
+
+            return True
+
+        raise ImagesDownloadError(f"unable to download images, {', '.join(errors)}")
+
+    def _install(self, archive):
+        """
+        extracts the `images` folder of archive and swaps it in as the default images
+
+        `images/default` is a symlink to a hidden directory next to it (hidden
+        directories are not read), swapped atomically so readers always find either
+        the old or the new images. Where symlinks are not available (e.g. Windows
+        without the privilege) or `default` still is a directory (images downloaded
+        by earlier versions), the directories are swapped by two renames instead and
+        `images/default` is missing in between.
+        """
+
+        Path(self.image_dir).mkdir(parents=True, exist_ok=True)
+
+        # within the image directory (same file system), hidden from read_images
+        extracted = mkdtemp(prefix=".default-", dir=self.image_dir)
+        installed = False
+
+        try:
+            with ZipFile(archive) as obj:
+                for member in obj.infolist():
+                    # members are named {repository}-{branch}/images/...
+                    parts = member.filename.split("/", 2)
 
-        remove(f"{self.config_dir}/img.zip")
-        rmtree(f"{self.config_dir}/temp_images")
+                    if len(parts) < 3 or parts[1] != "images" or not parts[2]:
+                        continue
 
-        # write to cache info that images have been updated
-        data = {"time": str(datetime.now()), "version": version}
+                    path = normpath(parts[2])
 
-        with open(f"{self.config_dir}/image_cache.json", "w") as f:
+                    if path.startswith("..") or isabs(path):
+                        raise ReadError(f"invalid path {member.filename} in archive")
+
+                    if member.is_dir():
+                        Path(extracted, path).mkdir(parents=True, exist_ok=True)
+                        continue
+
+                    Path(extracted, path).parent.mkdir(parents=True, exist_ok=True)
+
+                    with obj.open(member) as src, open(
+                        join(extracted, path), "wb"
+                    ) as dst:
+                        copyfileobj(src, dst)
+
+            if not listdir(extracted):
+                raise ReadError("archive does not contain any images")
+
+            installed = self._swap(extracted)
+        finally:
+            if not installed:
+                rmtree(extracted, ignore_errors=True)
+
+    def _swap(self, extracted):
+        """makes extracted the default images, then removes the old ones"""
+
+        default = f"{self.image_dir}/default"
+        link = f"{extracted}.link"
+
+        previous = None
+
+        try:
+            # relative, the configuration directory may be moved
+            symlink(basename(extracted), link, target_is_directory=True)
+        except (OSError, NotImplementedError):
+            link = extracted
+
+        try:
+            # only directories installed by us, the link may have been set by the user
+            if islink(default) and basename(realpath(default)).startswith(".default-"):
+                previous = realpath(default)
+            elif isdir(default):
+                previous = f"{extracted}.old"
+                rename(default, previous)
+
+            replace(link, default)
+        except OSError:
+            if link != extracted and islink(link):
+                remove(link)
+
+            # put the directory back
+            if previous and not isdir(default) and isdir(previous):
+                rename(previous, default)
+
+            raise
+
+        # new readers resolve the new images
+        if previous:
+            rmtree(previous, ignore_errors=True)
+
+        return True
+
+    def _write_fetch_metadata(self, url, etag):
+        """writes image_cache.json, marks images as fetched now"""
+
+        data = {
+            "time": str(datetime.now()),
+            "version": version,
+            "url": url,
+            "etag": etag,
+        }
+
+        with open(f"{self.config_dir}/image_cache.json.tmp", "w") as f:
             json.dump(data, f)
 
+        replace(
+            f"{self.config_dir}/image_cache.json.tmp",
+            f"{self.config_dir}/image_cache.json",
+        )
+
+        self._index = None
+        self._fetch = None
+
     def data_strip_non_ui(self):
         """
         Returns a list of all images with only the variables important to the user shown
@@ -98,32 +281,15 @@ class Images(object):
         if not self._check_if_read():
             raise ImagesNotRead("Read images before trying to get images")
 
-        _images = deepcopy(self.images)
-
-        for d in _images:
-            for key in (
-                "meta",
-                "installation",
-                "docker_image",
-                "command",
-                "stop_command",
-                "variables",
-                "user",
-                "config",
-            ):
-                try:
-                    del d[key]
-                except Exception:
-                    pass
-
-        return _images
+        # the projection is computed once per read, callers get their own (shallow) copies
+        return [dict(image) for image in self._ui]
 
     def get_image(self, uid: str):
         """
         Retrieves image configuration for specific image
 
         Returns:
-            Returns ``dict`` of image configuration.
+            Returns read-only mapping of image configuration, ``None`` if there is no such image.
 
         Raises:
             :py:class:`wilfred.api.images.ImagesNotRead`
@@ -132,7 +298,38 @@ class Images(object):
         if not self._check_if_read():
             raise ImagesNotRead("Read images before trying to get image")
 
-        return next(filter(lambda img: img["uid"] == uid, self.images), None)
+        return self._by_uid.get(uid)
+
+    @property
+    def by_uid(self):
+        """
+        Read-only mapping of image uid and image configuration
+
+        Raises:
+            :py:class:`wilfred.api.images.ImagesNotRead`
+        """
+
+        if not self._check_if_read():
+            raise ImagesNotRead("Read images before trying to get images")
+
+        return MappingProxyType(self._by_uid)
+
+    @property
+    def ui(self):
+        """
+        Read-only views of all images with only the variables important to the user
+
+        Returns:
+            Returns ``tuple`` of read-only mappings, see :py:meth:`data_strip_non_ui` for mutable copies.
+
+        Raises:
+            :py:class:`wilfred.api.images.ImagesNotRead`
+        """
+
+        if not self._check_if_read():
+            raise ImagesNotRead("Read images before trying to get images")
+
+        return self._ui
 
     def read_images(self):
         """
@@ -158,24 +355,40 @@ class Images(object):
         self.image_time_to_refresh = "N/A"
 
         try:
-            with open(f"{self.config_dir}/image_cache.json") as f:
-                data = json.load(f)
-
-                self.image_fetch_date = datetime.strptime(
-                    data["time"], "%Y-%m-%d %H:%M:%S.%f"
-                )
-                self.image_fetch_version = data["version"]
-                self.image_time_to_refresh = timedelta(days=7) - (
-                    datetime.now() - self.image_fetch_date
-                )
+            data = self._fetch_metadata()
+
+            self.image_fetch_date = datetime.strptime(
+                data["time"], "%Y-%m-%d %H:%M:%S.%f"
+            )
+            self.image_fetch_version = data["version"]
+            self.image_time_to_refresh = timedelta(days=7) - (
+                datetime.now() - self.image_fetch_date
+            )
         except Exception:
             pass
 
+        # nothing changed since the images were last parsed and verified
+        if self._load_index():
+            self.images = self._index["images"]
+            self._build_views()
+
+            return True
+
         self.images = []
 
-        for root, dirs, files in walk(self.image_dir):
-            for file in files:
+        directories = {}
+        files = {}
+
+        for root, dirs, _files in walk(self.image_dir, followlinks=True):
+            # e.g. images being installed or replaced, see _install
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+
+            directories[root] = stat(root).st_mtime_ns
+
+            for file in _files:
                 if file.endswith(".json"):
+                    files[join(root, file)] = self._stat(join(root, file))
+
                     with open(join(root, file)) as f:
                         try:
                             _image = json.loads(f.read())
@@ -200,6 +413,9 @@ class Images(object):
                         self._verify(_image, file)
                         self.images.append(_image)
 
+        self._build_views()
+        self._write_index(directories, files)
+
         return True
 
     def check_if_present(self):
@@ -213,26 +429,132 @@ class Images(object):
     def is_outdated(self):
         """Checks if default images are outdated"""
 
-        if not isfile(f"{self.config_dir}/image_cache.json"):
+        data = self._fetch_metadata()
+
+        if data is None:
             return True
 
         try:
-            with open(f"{self.config_dir}/image_cache.json") as f:
-                data = json.load(f)
+            if (
+                datetime.now() - datetime.strptime(data["time"], "%Y-%m-%d %H:%M:%S.%f")
+            ) > timedelta(days=7):
+                return True
 
-                if (
-                    datetime.now()
-                    - datetime.strptime(data["time"], "%Y-%m-%d %H:%M:%S.%f")
-                ) > timedelta(days=7):
-                    return True
+            if data["version"] != version:
+                return True
 
-                if data["version"] != version:
-                    return True
-
-                return False
+            return False
         except Exception:
             return True
 
+    def _build_views(self):
+        """builds the uid lookup and the user-facing projection of the images"""
+
+        self._by_uid = {}
+
+        for image in self.images:
+            # the first image wins if several share a uid, shared by all callers
+            if image["uid"] not in self._by_uid:
+                self._by_uid[image["uid"]] = MappingProxyType(image)
+
+        self._ui = tuple(
+            MappingProxyType({k: v for k, v in image.items() if k not in NON_UI_KEYS})
+            for image in self.images
+        )
+
+    def _stat(self, path):
+        """returns modification time and size of file, ``None`` if it does not exist"""
+
+        try:
+            _stat = stat(path)
+        except FileNotFoundError:
+            return None
+
+        return [_stat.st_mtime_ns, _stat.st_size]
+
+    def _load_index(self):
+        """
+        loads the compiled image index, returns ``False`` if it is missing or stale
+
+        The index is valid as long as no image file, image directory (files added
+        or removed) or image_cache.json changed since it was written.
+        """
+
+        if self._index is not None:
+            return bool(self._index)
+
+        self._index = False
+
+        try:
+            with open(self.index_path) as f:
+                index = json.load(f)
+
+            if (
+                index["format"] != INDEX_FORMAT
+                or index["api_version"] != API_VERSION
+                or index["version"] != version
+                or index["cache"] != self._stat(f"{self.config_dir}/image_cache.json")
+            ):
+                return False
+
+            for path, mtime in index["directories"].items():
+                if stat(path).st_mtime_ns != mtime:
+                    return False
+
+            for path, _stat in index["files"].items():
+                if self._stat(path) != _stat:
+                    return False
+        except (OSError, ValueError, KeyError, TypeError):
+            return False
+
+        self._index = index
+
+        return True
+
+    def _write_index(self, directories, files):
+        """writes the compiled image index, images must be parsed and verified"""
+
+        index = {
+            "format": INDEX_FORMAT,
+            "api_version": API_VERSION,
+            "version": version,
+            "cache": self._stat(f"{self.config_dir}/image_cache.json"),
+            "fetch": self._fetch_metadata(),
+            "directories": directories,
+            "files": files,
+            "images": self.images,
+        }
+
+        # the index is only a cache, images are parsed again if it cannot be written
+        try:
+            with open(f"{self.index_path}.tmp", "w") as f:
+                json.dump(index, f)
+
+            replace(f"{self.index_path}.tmp", self.index_path)
+        except OSError:
+            return
+
+        self._index = index
+
+    def _fetch_metadata(self):
+        """returns contents of image_cache.json (from the index if valid), ``None`` if not available"""
+
+        if self._fetch is not None:
+            return self._fetch
+
+        if self._load_index():
+            self._fetch = self._index["fetch"]
+
+            return self._fetch
+
+        try:
+            with open(f"{self.config_dir}/image_cache.json") as f:
+                self._fetch = json.load(f)
+        except (OSError, ValueError):
+            return None
+
+        return self._fetch
+
     def _verify(self, image: dict, file: str):
         def _exception(key):
             raise ParseError(f"image {file} is missing key {str(key)}")
@@ -0,0 +1,110 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+from os import getpid, remove, replace
+from shutil import copymode
+
+
+def write_atomic(path, content):
+    """
+    writes content to a temporary file next to path and moves it into place,
+    readers see either the old or the new file
+    """
+
+    tmp = f"{path}.{getpid()}.tmp"
+
+    try:
+        with open(tmp, "w") as f:
+            f.write(content)
+
+        try:
+            copymode(path, tmp)
+        except OSError:
+            pass
+
+        replace(tmp, path)
+    finally:
+        # moved into place, or failed
+        try:
+            remove(tmp)
+        except OSError:
+            pass
+
+
+def _like(current, value):
+    """converts value to the type of the current value, if possible"""
+
+    if isinstance(current, bool):
+        if isinstance(value, str) and value.lower() in ("true", "false"):
+            return value.lower() == "true"
+
+        return value
+
+    if isinstance(current, int) and not isinstance(value, bool):
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return value
+
+    if isinstance(current, str) and not isinstance(value, str):
+        return str(value).lower() if isinstance(value, bool) else str(value)
+
+    return value
+
+
+def set_values(data, values):
+    """
+    sets values of nested data (parsed YAML or JSON) by their flattened key, as
+    returned by the readers (e.g. `settings/allow-end`), keys that do not exist
+    or are not a string, integer or boolean are ignored
+
+    :param data: parsed file, modified in place
+    :param dict values: flattened key and value to set
+    :returns: ``set`` of the keys whose value changed
+    """
+
+    changed = set()
+
+    for key, value in values.items():
+        parent = None
+        name = None
+        current = data
+
+        for part in key.split("/"):
+            parent = current
+
+            if isinstance(current, dict):
+                name = part if part in current else None
+
+                # e.g. numeric YAML keys
+                if name is None and part.isdigit() and int(part) in current:
+                    name = int(part)
+            elif isinstance(current, list) and part.isdigit():
+                name = int(part) if int(part) < len(current) else None
+            else:
+                name = None
+
+            if name is None:
+                break
+
+            current = current[name]
+
+        if name is None or type(current) not in [str, int, bool]:
+            continue
+
+        value = _like(current, value)
+
+        if type(value) is type(current) and value == current:
+            continue
+
+        parent[name] = value
+        changed.add(key)
+
+    return changed
@@ -10,6 +10,8 @@
 
 import json
 
+from wilfred.api.parser.common import set_values, write_atomic
+
 
 def json_read(path):
     with open(path) as f:
@@ -72,6 +74,40 @@ def json_read(path):
 
 
 def json_write(path, key, value):
-    raise Exception("Modifying JSON variables is currently not supported")
+    return json_write_many(path, {key: value})
+
+
+def json_write_many(path, values):
+    """
+    Sets several keys of a JSON file, the file is written once (atomically) and
+    only if a value changed. Keys that are not in the file are ignored.
+
+    :param str path: path of the JSON file
+    :param dict values: flattened key (e.g. `settings/port`) and value to set
+    :returns: ``set`` of the keys whose value changed
+    """
+
+    with open(path) as f:
+        content = f.read()
+
+    data = json.loads(content)
+    changed = set_values(data, values)
+
+    if changed:
+        # keep the indentation of the file (if any)
+        indented = [
+            line for line in content.splitlines()[1:] if line.startswith((" ", "\t"))
+        ]
+        indent = None
+
+        if indented:
+            line = indented[0]
+            indent = line[: len(line) - len(line.lstrip(" \t"))]
+
+        write_atomic(
+            path,
+            json.dumps(data, indent=indent, ensure_ascii=False)
+            + ("\n" if content.endswith("\n") else ""),
+        )
 
-    # return True
+    return changed
@@ -8,46 +8,186 @@
 #                                                               #
 #################################################################
 
-from configparser import RawConfigParser
+import re
 
+from os import getpid, remove, replace
+from shutil import copymode
 
-def _config_parser(path):
-    """appends a dummy section to the top of the raw file so that the built-in
-    python function, ConfigParser, can read and parse the file"""
+# the properties format as read by java.util.Properties
+WHITESPACE = " \t\f"
+SEPARATORS = "=:"
+COMMENTS = "#!"
 
-    with open(path) as f:
-        file_content = "[dummy_section]\n" + f.read()
+ESCAPES = {"t": "\t", "n": "\n", "r": "\r", "f": "\f"}
 
-    config_parser = RawConfigParser()
-    config_parser.read_string(file_content)
+_escape_sequence = re.compile(r"\\(u[0-9a-fA-F]{4}|.|$)")
 
-    return config_parser
+# key (up to an unescaped separator or whitespace) and separator
+_key_separator = re.compile(r"((?:\\.?|[^\\=: \t\f])*)([ \t\f]*(?:[=:][ \t\f]*)?)")
 
 
-def properties_read(path):
-    config_parser = _config_parser(path)
+def _open(path, mode="r"):
+    # line endings and undecodable bytes are kept as they are
+    return open(path, mode, encoding="utf-8", errors="surrogateescape", newline="")
 
-    settings = {}
 
-    for item in config_parser.items("dummy_section"):
-        settings[item[0]] = item[1]
+def _unescape(text):
+    def _replace(match):
+        sequence = match.group(1)
 
-    return settings
+        if len(sequence) == 5:
+            return chr(int(sequence[1:], 16))
 
+        return ESCAPES.get(sequence, sequence)
 
-def properties_write(path, key, value):
-    with open(path) as f:
-        raw = f.read().split("\n")
+    if "\\" not in text:
+        return text
+
+    return _escape_sequence.sub(_replace, text)
+
+
+def _escape(value):
+    value = value.replace("\\", "\\\\")
+
+    for sequence, character in ESCAPES.items():
+        value = value.replace(character, f"\\{sequence}")
+
+    # leading whitespace would be taken as part of the separator
+    if value and value[0] in WHITESPACE:
+        value = f"\\{value}"
+
+    return value
+
+
+def _format(value):
+    if isinstance(value, bool):
+        return "true" if value else "false"
+
+    return str(value)
+
+
+def _continues(line):
+    """a line ending with an odd number of backslashes continues on the next line"""
+
+    return (len(line) - len(line.rstrip("\\"))) % 2 == 1
+
+
+def _split(logical):
+    """
+    splits a logical line into key and value
+
+    :param str logical: line without leading whitespace and continuations
+    :returns: ``tuple`` of key, value (both unescaped) and the text preceding the value
+    """
+
+    match = _key_separator.match(logical)
+    end, start = match.end(1), match.end()
+
+    # a key without value nor separator, e.g. "key"
+    prefix = logical[:start] if start > end else f"{logical[:end]}="
+
+    return (_unescape(logical[:end]), _unescape(logical[start:]), prefix)
+
+
+def _entries(f):
+    """
+    reads f one logical line at a time
+
+    :param f: file opened using _open
+    :returns: generator of ``tuple`` physical lines, key, value and the text preceding
+        the value (as to be written), key is ``None`` for blank lines and comments
+    """
+
+    lines = []
+    logical = ""
+    indent = ""
 
-    _write = []
+    for line in f:
+        content = line.rstrip("\r\n")
+        stripped = content.lstrip(WHITESPACE)
 
-    for line in raw:
-        if key in line:
-            if line.split("=")[0] == key:
-                _write.append(f"{key}={value}")
+        if not lines:
+            if not stripped or stripped[0] in COMMENTS:
+                yield ([line], None, None, None)
                 continue
 
-        _write.append(line)
+            indent = content[: len(content) - len(stripped)]
+
+        lines.append(line)
+
+        if stripped.endswith("\\") and _continues(stripped):
+            logical += stripped[:-1]
+            continue
+
+        key, value, prefix = _split(logical + stripped)
+        yield (lines, key, value, indent + prefix)
+
+        lines = []
+        logical = ""
+
+    # the file ended on a continuation
+    if lines:
+        key, value, prefix = _split(logical)
+        yield (lines, key, value, indent + prefix)
+
+
+def properties_read(path):
+    """
+    Reads a properties file
+
+    :param str path: path of the properties file
+    :returns: ``dict`` of key and value, the last occurrence of a key counts
+    """
+
+    with _open(path) as f:
+        return {key: value for _, key, value, _ in _entries(f) if key is not None}
+
+
+def properties_write(path, key, value):
+    return properties_write_many(path, {key: value})
+
+
+def properties_write_many(path, values):
+    """
+    Sets several keys of a properties file in a single pass, the file is written
+    once (atomically) and only if a value changed. Keys that are not in the file are
+    ignored. Comments, ordering, separators and line endings are kept.
+
+    :param str path: path of the properties file
+    :param dict values: key and value to set
+    :returns: ``set`` of the keys whose value changed
+    """
+
+    values = {key: _format(value) for key, value in values.items()}
+    changed = set()
+
+    tmp = f"{path}.{getpid()}.tmp"
+
+    try:
+        with _open(path) as source, _open(tmp, "w") as target:
+            for lines, key, value, prefix in _entries(source):
+                if key not in values or value == values[key]:
+                    target.writelines(lines)
+                    continue
+
+                changed.add(key)
+
+                # continuations are joined, the line ending is kept
+                ending = lines[-1][len(lines[-1].rstrip("\r\n")) :]
+                target.write(f"{prefix}{_escape(values[key])}{ending}")
+
+        if changed:
+            try:
+                copymode(path, tmp)
+            except OSError:
+                pass
+
+            replace(tmp, path)
+    finally:
+        # unchanged, or failed
+        try:
+            remove(tmp)
+        except OSError:
+            pass
 
-    with open(path, "w") as f:
-        f.write("\n".join(_write))
+    return changed
@@ -8,12 +8,14 @@
 #                                                               #
 #################################################################
 
-import yaml
+from wilfred.api.parser.common import set_values, write_atomic
 
 # from wilfred.core import is_integer
 
 
 def yaml_read(path):  # this function should be refactored later on!!!
+    import yaml
+
     with open(path) as f:
         _raw = yaml.load(f.read(), Loader=yaml.FullLoader)
 
@@ -112,42 +114,34 @@ def yaml_read(path):  # this function should be refactored later on!!!
 #         # yaml.dump(_raw, f)
 
 
-def yaml_write(path, key, value):  # does not work yet!!
-    raise Exception("Modifying YAML variables is currently not supported")
+def yaml_write(path, key, value):
+    return yaml_write_many(path, {key: value})
 
-    # with open(path) as f:
-    #     _raw = yaml.load(f.read(), Loader=yaml.FullLoader)
 
-    # def _entrypoint(search, current, value, parent):
-    #     if type(value) in [dict]:
-    #         current = current+1
-    #         parent = value
-    #         _iterate_dict(search, current, value, parent)
-    #     if type(value) in [list, tuple]:
-    #         current = current+1
-    #         parent = value
-    #         _iterate_list(search, current, value, parent)
-    #     if type(value) in [str, int, bool]:
-    #         print(f"{search[current]} with value {value} in {parent}")
-    #         exit(1)
+def yaml_write_many(path, values):
+    """
+    Sets several keys of a YAML file, the file is written once (atomically) and
+    only if a value changed. Keys that are not in the file are ignored. Comments
+    of the file are not kept when it is written.
 
-    # def _iterate_dict(search, current, value, parent):
-    #     for k, v in value.items():
-    #         if k == search[current]:
-    #             _entrypoint(search, current, v, parent)
+    :param str path: path of the YAML file
+    :param dict values: flattened key (e.g. `settings/allow-end`) and value to set
+    :returns: ``set`` of the keys whose value changed
+    """
 
-    # def _iterate_list(search, current, value, parent):
-    #     _entrypoint(search, current, value[search[current]], parent)
+    import yaml
 
-    # _search = [int(x) if is_integer(x) else x for x in key.split("/")]
-    # _current = 0
+    with open(path) as f:
+        data = yaml.load(f.read(), Loader=yaml.FullLoader)
 
-    # for i in range(len(_search)):
-    #     for k, v in _raw.items():
-    #         if _search[_current] == k:
-    #             _entrypoint(_search, _current, v, _raw)
+    changed = set_values(data, values)
 
-    # with open(path, "w") as f:
-    #     yaml.dump(_raw)
+    if changed:
+        write_atomic(
+            path,
+            yaml.dump(
+                data, default_flow_style=False, sort_keys=False, allow_unicode=True
+            ),
+        )
 
-    # return True
+    return changed
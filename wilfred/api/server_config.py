@@ -9,21 +9,70 @@
 #################################################################
 
 import click
+import json
 
-from tabulate import tabulate
+from appdirs import user_data_dir
+from os import makedirs, remove, replace, stat
+from os.path import dirname
 
 from wilfred.container_variables import ContainerVariables
 from wilfred.errors import WilfredException, ParseError, WriteError
 
-from wilfred.api.parser.properties import properties_read, properties_write
-from wilfred.api.parser.yaml import yaml_read, yaml_write
-from wilfred.api.parser.json import json_read, json_write
+from wilfred.api.parser.properties import properties_read, properties_write_many
+from wilfred.api.parser.yaml import yaml_read, yaml_write_many
+from wilfred.api.parser.json import json_read, json_write_many
+
+# bump when the layout of the parse cache changes
+CACHE_FORMAT = 1
+
+PARSERS = {"properties": properties_read, "yaml": yaml_read, "json": json_read}
+
+# set several variables of a file at once, returning the variables that changed
+WRITERS = {
+    "properties": properties_write_many,
+    "yaml": yaml_write_many,
+    "json": json_write_many,
+}
 
 
 class UnsupportedFiletype(WilfredException):
     """File type is not supported by parser"""
 
 
+def get_cache_path(server_id):
+    """
+    Returns path of the parse cache of the configuration files of a server
+    """
+
+    return f"{user_data_dir()}/wilfred/config_cache/{server_id}.json"
+
+
+def _coerce(value):
+    """converts value given as text to int or bool, if possible"""
+
+    try:
+        value = int(value)
+    except Exception:
+        pass
+
+    try:
+        value = True if value.lower() == "true" else value
+        value = False if value.lower() == "false" else value
+    except Exception:
+        pass
+
+    return value
+
+
+def remove_cache(server_id):
+    """removes the parse cache of a server, if any"""
+
+    try:
+        remove(get_cache_path(server_id))
+    except OSError:
+        pass
+
+
 class ServerConfig:
     def __init__(self, configuration, servers, server, image):
         """
@@ -40,59 +89,184 @@ class ServerConfig:
         self._server = server
         self._image = image
 
-        self.raw = []
         self._variables = []  # list of dicts
 
-        self._parse()
+        # read once, writing does not touch the database object (may run in another thread)
+        self._directory = f"{configuration['data_path']}/{server.name}_{server.id}"
 
-    def _parse(self):
-        """iterates configuration files for the specific server and parses the files"""
+        self.cache_path = get_cache_path(server.id)
 
-        def _err(e):
-            raise ParseError(f"failed to parse {file['filename']}, err {str(e)}")
+        self._raw = None
+        self._cache = None  # filename -> cached key and values, as on disk
+        self._parsed = {}  # filename -> key and values, read by this object
+        self._index = None  # variable -> filenames, according to the cache
 
-        for file in self._image["config"]["files"]:
-            path = f"{self._configuration['data_path']}/{self._server.name}_{self._server.id}/{file['filename']}"
+    @property
+    def raw(self):
+        """
+        Values of every configuration file, parsed on first access
 
-            if file["parser"] == "properties":
-                try:
-                    _raw = properties_read(path)
-                except Exception as e:
-                    _err(e)
+        Returns:
+            Returns ``list`` of ``dict``, one per file, `_wilfred_config_filename` holds the filename.
+        """
 
-                _raw["_wilfred_config_filename"] = file["filename"]
-                self.raw.append(_raw)
+        if self._raw is None:
+            self._raw = [
+                {**self._read(file), "_wilfred_config_filename": file["filename"]}
+                for file in self._image["config"]["files"]
+            ]
 
-                continue
+            self._save()
+
+        return self._raw
 
-            if file["parser"] == "yaml":
-                try:
-                    _raw = yaml_read(path)
-                except Exception as e:
-                    _err(e)
+    def occurrences(self, variable):
+        """
+        Returns the configuration files containing variable
 
-                _raw["_wilfred_config_filename"] = file["filename"]
-                self.raw.append(_raw)
+        Only files that contain variable according to the cache, or changed since
+        they were cached, are read.
 
-                continue
+        Args:
+            variable (str): Name of the setting
 
-            if file["parser"] == "json":
-                try:
-                    _raw = json_read(path)
-                except Exception as e:
-                    _err(e)
+        Returns:
+            Returns ``list`` of ``dict`` (like :py:attr:`raw`) of the files containing variable.
+        """
 
-                _raw["_wilfred_config_filename"] = file["filename"]
-                self.raw.append(_raw)
+        candidates = self._variable_index().get(variable, ())
+        occurrences = []
 
+        for file in self._image["config"]["files"]:
+            if file["filename"] not in candidates and self._fresh(file):
                 continue
 
+            values = self._read(file)
+
+            if variable in values:
+                occurrences.append(
+                    {**values, "_wilfred_config_filename": file["filename"]}
+                )
+
+        self._save()
+
+        return occurrences
+
+    def _path(self, file):
+        return f"{self._directory}/{file['filename']}"
+
+    def _key(self, file):
+        """returns the cache key of file, ``None`` if it does not exist"""
+
+        path = self._path(file)
+
+        try:
+            st = stat(path)
+        except OSError:
+            return None
+
+        return [path, file["parser"], st.st_mtime_ns, st.st_size]
+
+    def _fresh(self, file):
+        """checks if the cached values of file are up to date"""
+
+        entry = self._cached().get(file["filename"])
+        key = self._key(file)
+
+        return bool(key and entry and entry["key"] == key)
+
+    def _read(self, file):
+        """
+        returns the values of file, parsed only if it changed since it was cached
+
+        Parsed files are cached by path, modification time and size.
+        """
+
+        if file["filename"] in self._parsed:
+            return self._parsed[file["filename"]]["raw"]
+
+        if file["parser"] not in PARSERS:
             raise UnsupportedFiletype(file["parser"])
-        return True
+
+        key = self._key(file)
+        entry = self._cached().get(file["filename"])
+
+        if key and entry and entry["key"] == key:
+            values = entry["raw"]
+        else:
+            try:
+                values = PARSERS[file["parser"]](self._path(file))
+            except Exception as e:
+                raise ParseError(
+                    f"failed to parse {file['filename']}, err {str(e)}"
+                ) from e
+
+        self._parsed[file["filename"]] = {"key": key, "raw": values}
+
+        return values
+
+    def _cached(self):
+        if self._cache is None:
+            self._cache = self._load_cache()
+
+        return self._cache
+
+    def _variable_index(self):
+        if self._index is None:
+            self._index = {}
+
+            for filename, entry in self._cached().items():
+                for variable in entry["raw"]:
+                    self._index.setdefault(variable, []).append(filename)
+
+        return self._index
+
+    def _save(self):
+        """writes the cache if files were parsed, files that were not read are kept"""
+
+        files = {
+            file["filename"]: self._parsed.get(file["filename"])
+            or self._cached().get(file["filename"])
+            for file in self._image["config"]["files"]
+        }
+        files = {filename: entry for filename, entry in files.items() if entry}
+
+        if files != self._cached():
+            self._write_cache(files)
+            self._cache = files
+            self._index = None
+
+    def _load_cache(self):
+        """returns ``dict`` of filename and cached key and values, empty if not available"""
+
+        try:
+            with open(self.cache_path) as f:
+                cache = json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+        if not isinstance(cache, dict) or cache.get("format") != CACHE_FORMAT:
+            return {}
+
+        return cache["files"]
+
+    def _write_cache(self, files):
+        # the cache is only an optimization, files are parsed again if it cannot be written
+        try:
+            makedirs(dirname(self.cache_path), exist_ok=True)
+
+            with open(f"{self.cache_path}.tmp", "w") as f:
+                json.dump({"format": CACHE_FORMAT, "files": files}, f)
+
+            replace(f"{self.cache_path}.tmp", self.cache_path)
+        except (OSError, TypeError, ValueError):
+            pass
 
     def pretty(self):
         """returns parsed configuration variables in a print-friendly format"""
 
+        from tabulate import tabulate
+
         headers = {
             "file": click.style("Config File", bold=True),
             "setting": click.style("Setting", bold=True),
@@ -124,60 +298,112 @@ class ServerConfig:
     def edit(self, filename, variable, value, override_linking_check=False):
         """modifies value of specified variable"""
 
-        try:
-            value = int(value)
-        except Exception:
-            pass
+        self.apply([(filename, variable, value)], override_linking_check)
 
-        try:
-            value = True if value.lower() == "true" else value
-            value = False if value.lower() == "false" else value
-        except Exception:
-            pass
+    def apply(self, changes, override_linking_check=False, actions=True):
+        """
+        Modifies several variables, every file is written at most once
+
+        Files are replaced atomically and only written if a value changed. Actions
+        of the image (commands sent to the server) only run for changed values.
+
+        Args:
+            changes (list): ``tuple`` of filename, variable and value for every change
+            override_linking_check (bool): Allow changing variables linked to environment variables
+            actions (bool): Send the commands of the image for changed values, `False` if the server is not running
+
+        Returns:
+            Returns ``set`` of filename and variable of the variables whose value changed.
+
+        Raises:
+            :py:class:`wilfred.errors.WriteError`
+                If a variable is linked to an environment variable (unless overridden)
+            :py:class:`UnsupportedFiletype`
+                If the parser of a file is not supported
+        """
+
+        linked = {
+            x["config_variable"]
+            for _image_config_file in self._image["config"]["files"]
+            for x in _image_config_file["environment"]
+        }
+
+        by_file = {}
+        applied = set()
+
+        for filename, variable, value in changes:
+            if variable in linked and not override_linking_check:
+                raise WriteError(
+                    "This setting is linked to an environment variable and is therefore not editable directly"
+                )
+
+            by_file.setdefault(filename, {})[variable] = _coerce(value)
 
         for file in self._image["config"]["files"]:
-            if file["filename"] == filename:
-                path = f"{self._configuration['data_path']}/{self._server.name}_{self._server.id}"
+            if file["filename"] not in by_file:
+                continue
 
-                for _image_config_file in self._image["config"]["files"]:
-                    for x in _image_config_file["environment"]:
-                        if (
-                            x["config_variable"] == variable
-                            and not override_linking_check
-                        ):
-                            raise WriteError(
-                                "This setting is linked to an environment variable and is therefore not editable directly"
-                            )
+            values = by_file[file["filename"]]
+            path = self._path(file)
 
-                if file["parser"] == "properties":
-                    properties_write(f"{path}/{file['filename']}", variable, value)
+            if file["parser"] not in WRITERS:
+                raise UnsupportedFiletype(f"parser {file['parser']} is not supported")
 
-                if file["parser"] == "yaml":
-                    yaml_write(f"{path}/{file['filename']}", variable, value)
+            changed = WRITERS[file["parser"]](path, values)
+            applied.update((file["filename"], variable) for variable in changed)
 
-                if file["parser"] == "json":
-                    json_write(f"{path}/{file['filename']}", variable, value)
+            if changed:
+                # read again on next access
+                self._parsed.pop(file["filename"], None)
+                self._raw = None
 
+            if not actions:
+                continue
+
+            for variable in changed:
                 if variable in file["action"]:
                     self._servers.command(
-                        self._server, file["action"][variable].format(value)
+                        self._server, file["action"][variable].format(values[variable])
                     )
 
-    def write_environment_variables(self):
-        """writes environment variable to config file(s)"""
+        return applied
+
+    def environment_changes(self):
+        """
+        Returns the changes writing the environment variables to the config file(s),
+        to be passed to :py:meth:`apply`
+
+        Returns:
+            Returns ``list`` of ``tuple`` filename, variable and value.
+        """
+
+        env_vars = ContainerVariables(self._server, self._image).get_env_vars()
+
+        changes = []
 
         for file in self._image["config"]["files"]:
             for _env in file["environment"]:
-                env_vars = ContainerVariables(self._server, self._image).get_env_vars()
-
                 if _env["environment_variable"] in env_vars:
-                    self.edit(
-                        file["filename"],
-                        _env["config_variable"],
-                        _env["value_format"].format(
-                            env_vars[_env["environment_variable"]]
+                    changes.append(
+                        (
+                            file["filename"],
+                            _env["config_variable"],
+                            (
+                                _env["value_format"].format(
+                                    env_vars[_env["environment_variable"]]
+                                )
+                                if _env["value_format"]
+                                else env_vars[_env["environment_variable"]]
+                            ),
                         )
-                        if _env["value_format"]
-                        else env_vars[_env["environment_variable"]],
-                        override_linking_check=True,
                     )
+
+        return changes
+
+    def write_environment_variables(self):
+        """writes environment variable to config file(s), before the server starts"""
+
+        # every file is written once, and only if a value changed
+        self.apply(
+            self.environment_changes(), override_linking_check=True, actions=False
+        )
@@ -9,23 +9,62 @@
 #################################################################
 
 import click
-import docker
+import threading
 
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from math import ceil
 from pathlib import Path
 from shutil import rmtree
 from os import remove as remove_file
 from os import rename
-from time import sleep
+from queue import Queue, Empty
+from time import sleep, monotonic
 from sys import platform
 from subprocess import call
-from sqlalchemy import inspect
+from typing import TYPE_CHECKING
 
-from wilfred.database import session, Server, EnvironmentVariable, Port
 from wilfred.keyboard import KeyboardThread
 from wilfred.container_variables import ContainerVariables
 from wilfred.api.images import Images
+from wilfred.api.stats import StatsSubscriptions, apply_samples
+from wilfred.api.server_config import ServerConfig, remove_cache
 from wilfred.errors import WilfredException, WriteError
 
+if TYPE_CHECKING:
+    import docker
+
+    from wilfred.database import Server
+
+STATS_WORKERS = 32
+STATS_TIMEOUT = 5
+
+# seconds to wait for the stop command (unless the image specifies `stop_timeout`)
+# and then for SIGTERM before the container is killed
+STOP_TIMEOUT = 60
+TERMINATE_TIMEOUT = 10
+
+# seconds to wait for a killed container to be removed before giving up
+KILL_TIMEOUT = 10
+
+# seconds a snapshot of the container states is reused before listing again
+SNAPSHOT_TTL = 2
+
+# watchers restart crashed servers, again after 5, 10, 20... seconds (at most
+# RESTART_BACKOFF_MAX) while they keep crashing, and mark them as stopped after
+# RESTART_LIMIT restarts in a row (less than RESTART_RESET seconds apart)
+RESTART_BACKOFF = 5
+RESTART_BACKOFF_MAX = 300
+RESTART_LIMIT = 5
+RESTART_RESET = 600
+
+
+# maximum number of servers `bulk` operates on at once
+BULK_PARALLEL = 4
+
+StopResult = namedtuple("StopResult", ("outcome", "duration"))
+BulkResult = namedtuple("BulkResult", ("name", "success", "detail", "duration"))
+
 
 class ServerNotRunning(WilfredException):
     """Server is not running"""
@@ -33,7 +72,7 @@ class ServerNotRunning(WilfredException):
 
 class Servers(object):
     def __init__(
-        self, docker_client: docker.DockerClient, configuration: dict, images: Images
+        self, docker_client: "docker.DockerClient", configuration: dict, images: Images
     ):
         """
         Initiates wilfred.api.Servers, method for controlling servers
@@ -48,115 +87,348 @@ class Servers(object):
         self._configuration = configuration
         self._docker_client = docker_client
 
-    def all(self, cpu_load=False, memory_usage=False):
+        self._snapshot = None
+        self._snapshot_at = None
+
+        # server id -> restarts in a row by watch and time of the latest
+        self._restarts = {}
+
+    def reload(self, configuration: dict, images: Images):
+        """
+        Replaces the configuration and images in use, e.g. after they were read again.
+        Safe to call while another thread is watching.
+
+        Args:
+            configuration (dict): Dictionary of Wilfred config
+            images (Images): wilfred.api.Images object
+        """
+
+        self._configuration = configuration
+        self._images = images
+
+    def all(
+        self,
+        cpu_load=False,
+        memory_usage=False,
+        workers=STATS_WORKERS,
+        timeout=STATS_TIMEOUT,
+    ):
         """
         Returns data of all servers
 
         Args:
             cpu_load (bool): Include the CPU load of the container. Defaults to `None` if server is not running.
             memory_usage (bool): Include memory usage of the container. Defaults to `None` if server is not running.
+            workers (int): Maximum number of containers to retrieve statistics from concurrently.
+            timeout (float): Seconds to wait for the statistics of a single container before reporting `timeout`.
         """
 
+        from sqlalchemy import inspect
+        from wilfred.database import session, Server
+
+        # long-running callers (top, exporter) must see changes made by other processes
         servers = [
             {c.key: getattr(u, c.key) for c in inspect(u).mapper.column_attrs}
-            for u in session.query(Server).all()
+            for u in session.query(Server).populate_existing().all()
         ]
 
-        for server in servers:
-            if cpu_load or memory_usage:
-                for server in servers:
-                    _running = True
-                    _stats_avail = True
-
-                    try:
-                        container = self._docker_client.containers.get(
-                            f"wilfred_{server['id']}"
-                        )
-                        d = container.stats(stream=False)
-                    except docker.errors.NotFound:
-                        server.update({"cpu_load": "-"})
-                        server.update({"memory_usage": "-"})
-                        _running = False
-                    except Exception:
-                        server.update({"cpu_load": "error"})
-                        server.update({"memory_usage": "error"})
-                        _running = False
-
-                    if cpu_load and _running:
-                        # on some systems, statisics are not available
-                        if (
-                            "system_cpu_usage" not in d["cpu_stats"]
-                            or "system_cpu_usage" not in d["precpu_stats"]
-                        ):
-                            server.update({"cpu_load": "-"})
-                            _stats_avail = False
-
-                    if cpu_load and _running and _stats_avail:
-                        # calculate the change in CPU usage between current and previous reading
-                        cpu_delta = float(
-                            d["cpu_stats"]["cpu_usage"]["total_usage"]
-                        ) - float(d["precpu_stats"]["cpu_usage"]["total_usage"])
-
-                        # calculate the change in system CPU usage between current and previous reading
-                        system_delta = float(
-                            d["cpu_stats"]["system_cpu_usage"]
-                        ) - float(d["precpu_stats"]["system_cpu_usage"])
-
-                        # Calculate number of CPU cores
-                        cpu_count = float(d["cpu_stats"]["online_cpus"])
-                        if cpu_count == 0.0:
-                            cpu_count = len(
-                                d["precpu_stats"]["cpu_usage"]["percpu_usage"]
-                            )
-
-                        if system_delta > 0.0:
-                            cpu_percent = f"{round(cpu_delta / system_delta * 100.0 * cpu_count, 2)}%"
-
-                        server.update({"cpu_load": cpu_percent if cpu_percent else "-"})
-
-                    if memory_usage and _running:
-                        mem_used = d["memory_stats"]["usage"] / 1024 / 1024
-                        mem_percent = (
-                            d["memory_stats"]["usage"]
-                            / d["memory_stats"]["limit"]
-                            * 100
-                        )
-                        server.update(
-                            {
-                                "memory_usage": f"{round(mem_used, 1)} MB / {round(mem_percent, 2)}%"
-                            }
-                        )
-
-        return servers
+        if not cpu_load and not memory_usage:
+            return servers
+
+        return apply_samples(
+            servers,
+            self._collect_stats(
+                [server["id"] for server in servers], workers=workers, timeout=timeout
+            ),
+            cpu_load=cpu_load,
+            memory_usage=memory_usage,
+        )
+
+    def _collect_stats(self, server_ids, workers=STATS_WORKERS, timeout=STATS_TIMEOUT):
+        """
+        Retrieves one-shot statistics for several containers concurrently
+
+        Every sample blocks for roughly one sample period while Docker gathers
+        the previous CPU reading, the samples are therefore fetched in parallel.
+        A container is reported as `timeout` once its request has been running
+        for longer than `timeout` seconds.
+
+        Returns:
+            Returns ``dict`` of server id and stats sample, or one of `-`, `timeout` and `error`.
+        """
+
+        from docker.errors import NotFound
+
+        results = {}
+        containers = self._containers()
+
+        # only running containers have statistics, no need to ask for the rest
+        results.update(
+            {
+                i: "-"
+                for i in server_ids
+                if i not in containers or containers[i].status != "running"
+            }
+        )
+        server_ids = [i for i in server_ids if i not in results]
+
+        if not server_ids:
+            return results
+
+        workers = max(1, min(workers, len(server_ids)))
+        started = {}
+        queued = Queue()
+        finished = Queue()
+
+        for server_id in server_ids:
+            queued.put(server_id)
+
+        def _fetch():
+            while True:
+                try:
+                    server_id = queued.get_nowait()
+                except Empty:
+                    return
+
+                # already given up on
+                if server_id in results:
+                    continue
+
+                started[server_id] = monotonic()
+
+                try:
+                    finished.put((server_id, containers[server_id].stats(stream=False)))
+                except NotFound:
+                    finished.put((server_id, "-"))
+                except Exception:
+                    finished.put((server_id, "error"))
+
+        # daemon threads, a request that never returns must not keep the process
+        # alive once the caller is done (executor threads are joined at exit)
+        for i in range(workers):
+            threading.Thread(
+                target=_fetch, name=f"wilfred-stats-{i}", daemon=True
+            ).start()
+
+        pending = set(server_ids)
+
+        # requests that never got a worker (all workers stuck) give up after this
+        deadline = monotonic() + timeout * ceil(len(server_ids) / workers)
+
+        while pending:
+            try:
+                server_id, sample = finished.get(timeout=0.1)
+
+                if server_id in pending:
+                    pending.discard(server_id)
+                    results[server_id] = sample
+            except Empty:
+                pass
+
+            now = monotonic()
+
+            for server_id in list(pending):
+                _started = started.get(server_id)
+
+                if (_started is not None and now - _started > timeout) or (
+                    _started is None and now > deadline
+                ):
+                    pending.discard(server_id)
+                    results[server_id] = "timeout"
+
+        return results
+
+    def subscribe_stats(self, server_ids=()):
+        """
+        Opens streaming stats subscriptions to the containers of the specified servers
+
+        Args:
+            server_ids (list): IDs of the servers to subscribe to, can be changed later using `update`
+
+        Returns:
+            Returns :py:class:`wilfred.api.stats.StatsSubscriptions` object.
+        """
+
+        subscriptions = StatsSubscriptions(self._docker_client)
+        subscriptions.update(server_ids)
+
+        return subscriptions
 
     def set_status(self, server, status):
+        from wilfred.database import session
+
         server.status = status
         session.commit()
 
+    def _set_status_of(self, server_id, status):
+        """sets status of a server from any thread, using the session of the thread"""
+
+        from wilfred.database import session, Server
+
+        try:
+            server = session.query(Server).filter_by(id=server_id).first()
+
+            if server:
+                self.set_status(server, status)
+        finally:
+            session.remove()
+
     def sync(self):
         """
         Performs sync, checks for state of containers
         """
 
+        from wilfred.database import session, Server
+
+        states = self._container_states()
+
         for server in session.query(Server).all():
-            if server.status == "installing":
-                try:
-                    self._docker_client.containers.get(f"wilfred_{server.id}")
-                except docker.errors.NotFound:
-                    self.set_status(server, "stopped")
+            if server.status == "installing" and server.id not in states:
+                self.set_status(server, "stopped")
 
             # stopped
-            if server.status == "stopped":
+            if server.status == "stopped" and server.id in states:
                 self._stop(server)
 
             # start
-            if server.status == "running":
-                try:
-                    self._docker_client.containers.get(f"wilfred_{server.id}")
-                except docker.errors.NotFound:
-                    self._start(server)
+            if server.status == "running" and server.id not in states:
+                self._start(server)
+
+    def watch(self, callback=None):
+        """
+        Reconciles server states as Docker container events arrive, blocks until interrupted
+
+        Installing servers are marked as stopped when the installation container exits,
+        servers marked as running are started again once their container has died and
+        servers started outside of Wilfred are marked as running.
+
+        Args:
+            callback (callable): Called with the server object and the action taken for every reconciled event.
+        """
+
+        events = self._docker_client.events(
+            decode=True,
+            filters={"type": "container", "event": ["start", "die", "destroy"]},
+        )
+
+        try:
+            for event in events:
+                name = event.get("Actor", {}).get("Attributes", {}).get("name", "")
+
+                if not name.startswith("wilfred_"):
+                    continue
+
+                self._invalidate_snapshot()
+
+                server, action = self._reconcile_event(
+                    name[len("wilfred_") :],
+                    event.get("Action", event.get("status")),
+                    callback=callback,
+                )
+
+                if action and callback:
+                    callback(server, action)
+        finally:
+            events.close()
+
+    def _reconcile_event(self, server_id, event, callback=None):
+        from wilfred.database import session, Server
+
+        # other processes (the CLI) modify the database while we are watching
+        session.expire_all()
+        server = session.query(Server).filter_by(id=server_id).first()
+
+        if not server:
+            return (None, None)
+
+        if event == "start" and server.status == "stopped":
+            self.set_status(server, "running")
+
+            return (server, "running")
+
+        if event == "die" and server.status == "installing":
+            self.set_status(server, "stopped")
+
+            return (server, "installed")
+
+        # containers are removed on exit, the name is only free once destroyed
+        if event == "destroy" and server.status == "running":
+            return (server, self._restart_crashed(server, callback))
+
+        return (server, None)
+
+    def _restart_crashed(self, server, callback):
+        """
+        restarts a server whose container is gone, backing off while it keeps crashing,
+        returns the action taken
+        """
+
+        count, latest = self._restarts.get(server.id, (0, None))
+
+        # ran long enough since the latest restart
+        if latest is not None and monotonic() - latest > RESTART_RESET:
+            count = 0
+
+        if count >= RESTART_LIMIT:
+            self._restarts.pop(server.id, None)
+            self.set_status(server, "stopped")
+
+            return f"stopped, crashed {count} times in a row"
+
+        self._restarts[server.id] = (count + 1, monotonic())
+
+        if count:
+            delay = min(RESTART_BACKOFF * 2 ** (count - 1), RESTART_BACKOFF_MAX)
+
+            timer = threading.Timer(
+                delay, self._restart_delayed, args=(server.id, callback)
+            )
+            timer.daemon = True
+            timer.start()
+
+            return f"restarting in {delay}s (restart {count + 1} in a row)"
+
+        try:
+            self._start(server)
+        except Exception as e:
+            # no container, no event, retried after a delay instead
+            return (
+                f"restart failed, {str(e)}, {self._restart_crashed(server, callback)}"
+            )
+
+        return "restarted"
+
+    def _restart_delayed(self, server_id, callback):
+        """runs in a timer thread, using the database session of the thread"""
+
+        from wilfred.database import session, Server
 
-    def remove(self, server: Server):
+        try:
+            server = session.query(Server).filter_by(id=server_id).first()
+
+            # stopped by the user or started by someone else in the meantime
+            if (
+                not server
+                or server.status != "running"
+                or server_id in self._container_states(refresh=True)
+            ):
+                return
+
+            try:
+                self._start(server)
+                action = "restarted"
+            except Exception as e:
+                action = f"restart failed, {str(e)}, {self._restart_crashed(server, callback)}"
+
+            if callback:
+                callback(server, action)
+        except Exception:
+            # e.g. Docker went away, the next event is handled as usual
+            pass
+        finally:
+            session.remove()
+
+    def remove(self, server: "Server"):
         """
         Removes specified server
 
@@ -164,6 +436,9 @@ class Servers(object):
             server (wilfred.database.Server): Server database object
         """
 
+        from docker.errors import NotFound
+        from wilfred.database import session, EnvironmentVariable, Port
+
         path = f"{self._configuration['data_path']}/{server.name}_{server.id}"
 
         # delete all environment variables associated to this server
@@ -182,12 +457,14 @@ class Servers(object):
         try:
             container = self._docker_client.containers.get(f"wilfred_{server.id}")
             container.kill()
-        except docker.errors.NotFound:
+        except NotFound:
             pass
 
+        self._invalidate_snapshot()
         rmtree(path, ignore_errors=True)
+        remove_cache(server.id)
 
-    def console(self, server: Server, disable_user_input=False):
+    def console(self, server: "Server", disable_user_input=False):
         """
         Enters server console
 
@@ -200,9 +477,11 @@ class Servers(object):
                 If server is not running
         """
 
+        from docker.errors import NotFound
+
         try:
             container = self._docker_client.containers.get(f"wilfred_{server.id}")
-        except docker.errors.NotFound:
+        except NotFound:
             raise ServerNotRunning(f"server {server.id} is not running")
 
         if platform.startswith("win"):
@@ -215,10 +494,10 @@ class Servers(object):
             try:
                 for line in container.logs(stream=True, tail=200):
                     click.echo(line.strip())
-            except docker.errors.NotFound:
+            except NotFound:
                 raise ServerNotRunning(f"server {server.id} is not running")
 
-    def install(self, server: Server, skip_wait=False, spinner=None):
+    def install(self, server: "Server", skip_wait=False, spinner=None):
         """
         Performs installation
 
@@ -261,6 +540,7 @@ class Servers(object):
             remove=True,
             detach=True,
         )
+        self._invalidate_snapshot()
 
         if skip_wait and spinner:
             spinner.info(
@@ -280,9 +560,151 @@ class Servers(object):
                     f"You can also follow the installation log using `wilfred console {server.name}`"
                 )
                 spinner.start()
-            while self._container_alive(server):
+            while self._container_alive(server, refresh=True):
                 sleep(1)
 
+    def stop(self, server):
+        """
+        Stops server gracefully using the stop command of the image
+
+        Waits for the stop command for `stop_timeout` seconds (image setting), then
+        escalates to SIGTERM and finally kills the container.
+
+        Args:
+            server (wilfred.database.Server): Server database object
+
+        Returns:
+            Returns ``StopResult`` with outcome (`graceful`, `terminated`, `killed` or `failed` if the container
+            was still there after being killed) and duration in seconds, ``None`` if the server was not running.
+        """
+
+        self.set_status(server, "stopped")
+
+        return self._stop(server)
+
+    def bulk(self, action, servers, parallel=BULK_PARALLEL):
+        """
+        Performs the same action on several servers concurrently
+
+        Statuses are updated and everything needed is read from the database
+        up front, only the Docker operations run in parallel. Restarted servers are
+        marked as running once their new container has been created.
+
+        Args:
+            action (str): One of `start`, `stop`, `restart` and `kill`
+            servers (list): List of wilfred.database.Server objects
+            parallel (int): Maximum number of servers to operate on at once
+
+        Returns:
+            Returns ``list`` of ``BulkResult`` (name, success, detail and duration in seconds) in the order of `servers`.
+
+        Raises:
+            :py:class:`WilfredException`
+                If action is not supported
+        """
+
+        if action not in ("start", "stop", "restart", "kill"):
+            raise WilfredException(f"unsupported action {action}")
+
+        jobs = [(server.name, self._bulk_job(action, server)) for server in servers]
+
+        def _run(job):
+            name, job = job
+            started = monotonic()
+
+            try:
+                detail = job()
+            except Exception as e:
+                return BulkResult(
+                    name, False, f"{type(e).__name__} {str(e)}", monotonic() - started
+                )
+
+            return BulkResult(name, True, detail, monotonic() - started)
+
+        if not jobs:
+            return []
+
+        with ThreadPoolExecutor(
+            max_workers=max(1, min(parallel, len(jobs))),
+            thread_name_prefix="wilfred-bulk",
+        ) as executor:
+            return list(executor.map(_run, jobs))
+
+    def _bulk_job(self, action, server):
+        """
+        prepares action for server (database work happens here, in the calling thread)
+        and returns a callable performing the Docker operations, safe to run in any thread
+        """
+
+        from docker.errors import NotFound
+
+        server_id = server.id
+        image = self._images.get_image(server.image_uid)
+        running = server_id in self._container_states()
+
+        # restarted servers are marked as running once their new container runs,
+        # watchers would otherwise start the server as soon as the old one is removed
+        self.set_status(server, "running" if action == "start" else "stopped")
+
+        def _stop():
+            result = self._stop_container(server_id, image)
+
+            if result and result.outcome == "failed":
+                raise WilfredException(
+                    f"container still running {round(result.duration)}s after being killed"
+                )
+
+            return result.outcome if result else "not running"
+
+        def _kill():
+            try:
+                container = self._docker_client.containers.get(f"wilfred_{server_id}")
+            except NotFound:
+                raise ServerNotRunning(f"server {server_id} is not running")
+
+            container.kill()
+            self._invalidate_snapshot()
+
+            return "killed"
+
+        if action == "stop":
+            return _stop
+
+        if action == "kill":
+            return _kill
+
+        arguments = self._start_arguments(server)
+
+        if action == "restart":
+            # written once the server has stopped, servers save their config on shutdown
+            config = ServerConfig(self._configuration, self, server, image)
+            changes = config.environment_changes()
+
+        def _start():
+            if running:
+                return "already running"
+
+            self._run(arguments)
+
+            return "started"
+
+        def _restart():
+            stopped = _stop()
+
+            try:
+                config.apply(changes, override_linking_check=True, actions=False)
+                self._run(arguments)
+            except Exception as e:
+                raise WilfredException(
+                    f"{stopped}, not started again (server left stopped), {type(e).__name__} {str(e)}"
+                )
+
+            self._set_status_of(server_id, "running")
+
+            return f"{stopped}, started"
+
+        return _start if action == "start" else _restart
+
     def kill(self, server):
         """
         Kills server container
@@ -295,12 +717,15 @@ class Servers(object):
                 If server is not running
         """
 
+        from docker.errors import NotFound
+
         try:
             container = self._docker_client.containers.get(f"wilfred_{server.id}")
-        except docker.errors.NotFound:
+        except NotFound:
             raise ServerNotRunning(f"server {server.id} is not running")
 
         container.kill()
+        self._invalidate_snapshot()
 
     def rename(self, server, name):
         """
@@ -317,6 +742,8 @@ class Servers(object):
                 If not able to move folder
         """
 
+        from wilfred.database import session
+
         if self._container_alive(server):
             raise WilfredException("You cannot rename the server while it is running")
 
@@ -347,40 +774,92 @@ class Servers(object):
                 If server is not running
         """
 
+        self._command(server.id, command)
+
+    def _command(self, server_id, command):
+        from docker.errors import NotFound
+
         _cmd = f"{command}\n".encode("utf-8")
 
         try:
-            container = self._docker_client.containers.get(f"wilfred_{server.id}")
-        except docker.errors.NotFound:
-            raise ServerNotRunning(f"server {server.id} is not running")
+            container = self._docker_client.containers.get(f"wilfred_{server_id}")
+        except NotFound:
+            raise ServerNotRunning(f"server {server_id} is not running")
 
         s = container.attach_socket(params={"stdin": 1, "stream": 1})
         s.send(_cmd) if platform.startswith("win") else s._sock.send(_cmd)
         s.close()
 
     def _running_docker_sync(self):
+        from wilfred.database import session, Server
+
+        states = self._container_states()
+
         for server in session.query(Server).all():
-            try:
-                self._docker_client.containers.get(f"wilfred_{server.id}")
-            except docker.errors.NotFound:
+            if server.id not in states:
                 self.set_status(server, "stopped")
 
-    def _parse_startup_command(self, cmd, server, image):
-        return ContainerVariables(server, image).parse_startup_command(
+    def _parse_startup_command(self, cmd, server, variables):
+        return variables.parse_startup_command(
             cmd.replace("{{SERVER_MEMORY}}", str(server.memory)).replace(
                 "{{SERVER_PORT}}", str(server.port)
             )
         )
 
-    def _container_alive(self, server):
-        try:
-            self._docker_client.containers.get(f"wilfred_{server.id}")
-        except docker.errors.NotFound:
-            return False
+    def _container_alive(self, server, refresh=False):
+        return server.id in self._container_states(refresh=refresh)
 
-        return True
+    def _containers(self, refresh=False):
+        """
+        Returns ``dict`` of server id and (sparse) container object of all Wilfred containers
+
+        All containers are retrieved using a single Docker API call, the result is
+        reused for `SNAPSHOT_TTL` seconds or until a container is started or stopped.
+        """
+
+        if (
+            refresh
+            or self._snapshot is None
+            or monotonic() - self._snapshot_at > SNAPSHOT_TTL
+        ):
+            self._snapshot = {}
+
+            for container in self._docker_client.containers.list(
+                all=True, filters={"name": "wilfred_"}, sparse=True
+            ):
+                for name in container.attrs.get("Names") or []:
+                    name = name.lstrip("/")
+
+                    if name.startswith("wilfred_"):
+                        self._snapshot[name[len("wilfred_") :]] = container
+
+            self._snapshot_at = monotonic()
+
+        return self._snapshot
+
+    def _container_states(self, refresh=False):
+        """Returns ``dict`` of server id and container state (e.g. `running` or `exited`)"""
+
+        return {
+            server_id: container.status
+            for server_id, container in self._containers(refresh=refresh).items()
+        }
+
+    def _invalidate_snapshot(self):
+        self._snapshot = None
 
     def _start(self, server):
+        self._run(self._start_arguments(server))
+
+    def _run(self, arguments):
+        self._docker_client.containers.run(**arguments)
+        self._invalidate_snapshot()
+
+    def _start_arguments(self, server):
+        """returns arguments for `containers.run`, reads everything needed from the database"""
+
+        from wilfred.database import session, Port
+
         path = f"{self._configuration['data_path']}/{server.name}_{server.id}"
         image = self._images.get_image(server.image_uid)
 
@@ -392,11 +871,16 @@ class Servers(object):
         # get additional ports
         ports = session.query(Port).filter_by(server_id=server.id).all()
 
-        self._docker_client.containers.run(
-            image["docker_image"],
-            self._parse_startup_command(server.custom_startup, server, image)
-            if server.custom_startup is not None
-            else f"{self._parse_startup_command(image['command'], server, image)}",
+        # read once, used for both the startup command and the environment
+        variables = ContainerVariables(server, image)
+
+        return dict(
+            image=image["docker_image"],
+            command=(
+                self._parse_startup_command(server.custom_startup, server, variables)
+                if server.custom_startup is not None
+                else f"{self._parse_startup_command(image['command'], server, variables)}"
+            ),
             volumes={path: {"bind": "/server", "mode": "rw"}},
             name=f"wilfred_{server.id}",
             remove=True,
@@ -419,29 +903,62 @@ class Servers(object):
             mem_limit=f"{server.memory}m",
             oom_kill_disable=True,
             stdin_open=True,
-            environment=ContainerVariables(server, image).get_env_vars(),
+            environment=variables.get_env_vars(),
             user=image["user"] if image["user"] else "root",
         )
 
     def _stop(self, server):
-        image = self._images.get_image(server.image_uid)
+        return self._stop_container(server.id, self._images.get_image(server.image_uid))
 
-        try:
-            container = self._docker_client.containers.get(f"wilfred_{server.id}")
-        except docker.errors.NotFound:
-            return
+    def _stop_container(self, server_id, image):
+        from docker.errors import NotFound, APIError
 
-        if not image["stop_command"]:
-            container.stop()
+        self._invalidate_snapshot()
 
-            return
+        try:
+            container = self._docker_client.containers.get(f"wilfred_{server_id}")
+        except NotFound:
+            return None
+
+        started = monotonic()
 
-        self.command(server, image["stop_command"])
+        if image["stop_command"]:
+            try:
+                self._command(server_id, image["stop_command"])
+            except ServerNotRunning:
+                return StopResult("graceful", monotonic() - started)
 
-        stopped = False
+            if self._wait_removed(container, image.get("stop_timeout") or STOP_TIMEOUT):
+                return StopResult("graceful", monotonic() - started)
 
-        while not stopped:
+        # stop command not available or ignored, escalate
+        for signal, outcome, timeout in (
+            ("SIGTERM", "terminated", TERMINATE_TIMEOUT),
+            ("SIGKILL", "killed", KILL_TIMEOUT),
+        ):
             try:
-                self._docker_client.containers.get(f"wilfred_{server.id}")
-            except docker.errors.NotFound:
-                stopped = True
+                container.kill(signal=signal)
+            except APIError:
+                # container exited in the meantime
+                pass
+
+            if self._wait_removed(container, timeout):
+                return StopResult(outcome, monotonic() - started)
+
+        # e.g. a wedged Docker daemon, do not wait forever
+        return StopResult("failed", monotonic() - started)
+
+    def _wait_removed(self, container, timeout):
+        """blocks until container has been removed, returns `False` on timeout"""
+
+        from docker.errors import NotFound
+        from requests.exceptions import RequestException
+
+        try:
+            container.wait(timeout=timeout, condition="removed")
+        except NotFound:
+            pass
+        except RequestException:
+            return False
+
+        return True
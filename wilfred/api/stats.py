@@ -0,0 +1,254 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import threading
+
+
+def cpu_percent(d: dict):
+    """
+    Calculates CPU load of a container from a Docker stats sample
+
+    Args:
+        d (dict): Stats sample as returned by the Docker API
+
+    Returns:
+        Returns ``float`` CPU load in percent or ``None`` if statistics are not available.
+    """
+
+    # on some systems, statisics are not available
+    if (
+        "system_cpu_usage" not in d["cpu_stats"]
+        or "system_cpu_usage" not in d["precpu_stats"]
+    ):
+        return None
+
+    # calculate the change in CPU usage between current and previous reading
+    cpu_delta = float(d["cpu_stats"]["cpu_usage"]["total_usage"]) - float(
+        d["precpu_stats"]["cpu_usage"]["total_usage"]
+    )
+
+    # calculate the change in system CPU usage between current and previous reading
+    system_delta = float(d["cpu_stats"]["system_cpu_usage"]) - float(
+        d["precpu_stats"]["system_cpu_usage"]
+    )
+
+    # calculate number of CPU cores
+    cpu_count = float(d["cpu_stats"].get("online_cpus", 0))
+    if cpu_count == 0.0:
+        cpu_count = len(d["precpu_stats"]["cpu_usage"].get("percpu_usage") or [])
+
+    if system_delta <= 0.0:
+        return None
+
+    return cpu_delta / system_delta * 100.0 * cpu_count
+
+
+def memory_usage(d: dict):
+    """
+    Retrieves memory usage of a container from a Docker stats sample
+
+    Args:
+        d (dict): Stats sample as returned by the Docker API
+
+    Returns:
+        Returns ``tuple`` of used and limit in bytes or ``None`` if statistics are not available.
+    """
+
+    if "usage" not in d["memory_stats"] or "limit" not in d["memory_stats"]:
+        return None
+
+    return (d["memory_stats"]["usage"], d["memory_stats"]["limit"])
+
+
+def network_io(d: dict):
+    """
+    Retrieves network I/O of a container from a Docker stats sample
+
+    Args:
+        d (dict): Stats sample as returned by the Docker API
+
+    Returns:
+        Returns ``tuple`` of bytes received and transmitted (all interfaces) or ``None`` if not available.
+    """
+
+    if not d.get("networks"):
+        return None
+
+    return (
+        sum(network.get("rx_bytes", 0) for network in d["networks"].values()),
+        sum(network.get("tx_bytes", 0) for network in d["networks"].values()),
+    )
+
+
+def block_io(d: dict):
+    """
+    Retrieves block I/O of a container from a Docker stats sample
+
+    Args:
+        d (dict): Stats sample as returned by the Docker API
+
+    Returns:
+        Returns ``tuple`` of bytes read and written or ``None`` if not available.
+    """
+
+    entries = (d.get("blkio_stats") or {}).get("io_service_bytes_recursive")
+
+    if entries is None:
+        return None
+
+    # cgroup v1 reports "Read"/"Write", cgroup v2 "read"/"write"
+    return (
+        sum(x["value"] for x in entries if x.get("op", "").lower() == "read"),
+        sum(x["value"] for x in entries if x.get("op", "").lower() == "write"),
+    )
+
+
+def format_cpu_load(d: dict):
+    """Returns CPU load of stats sample in a print-friendly format"""
+
+    cpu = cpu_percent(d)
+
+    return f"{round(cpu, 2)}%" if cpu is not None else "-"
+
+
+def format_memory_usage(d: dict):
+    """Returns memory usage of stats sample in a print-friendly format"""
+
+    memory = memory_usage(d)
+
+    if not memory or not memory[1]:
+        return "-"
+
+    used, limit = memory
+
+    return f"{round(used / 1024 / 1024, 1)} MB / {round(used / limit * 100, 2)}%"
+
+
+def running_server_ids(servers):
+    """
+    Returns IDs of servers that should have a container (running or installing)
+
+    Args:
+        servers (list): List of server dicts, as returned by :py:meth:`Servers.all`
+    """
+
+    return [
+        server["id"]
+        for server in servers
+        if server["status"] in ("running", "installing")
+    ]
+
+
+def apply_samples(servers, samples, cpu_load=True, memory_usage=True):
+    """
+    Adds print-friendly CPU load and memory usage to server data
+
+    Args:
+        servers (list): List of server dicts, as returned by :py:meth:`Servers.all`
+        samples (dict): Server id and stats sample, or a string to display instead (e.g. `timeout`)
+        cpu_load (bool): Add `cpu_load` to each server
+        memory_usage (bool): Add `memory_usage` to each server
+    """
+
+    for server in servers:
+        d = samples.get(server["id"], "-")
+
+        if isinstance(d, str):
+            # container not running, timed out or failed
+            if cpu_load:
+                server.update({"cpu_load": d})
+            if memory_usage:
+                server.update({"memory_usage": d})
+
+            continue
+
+        if cpu_load:
+            server.update({"cpu_load": format_cpu_load(d)})
+
+        if memory_usage:
+            server.update({"memory_usage": format_memory_usage(d)})
+
+    return servers
+
+
+class StatsSubscriptions(object):
+    """
+    Keeps one streaming stats subscription per container and the latest sample of each
+
+    Every subscription runs in its own thread, blocked on the stats stream of
+    the Docker API (one sample per second). Readers only look at the shared table.
+    """
+
+    def __init__(self, docker_client):
+        self._docker_client = docker_client
+        self._lock = threading.Lock()
+        self._subscriptions = {}  # server id -> threading.Event, set to unsubscribe
+        self._latest = {}
+
+    def update(self, server_ids):
+        """
+        Subscribes to the containers of the servers listed, drops all other subscriptions
+
+        Args:
+            server_ids (list): IDs of the servers that should be subscribed to
+        """
+
+        server_ids = set(server_ids)
+
+        with self._lock:
+            for server_id in set(self._subscriptions) - server_ids:
+                self._subscriptions.pop(server_id).set()
+                self._latest.pop(server_id, None)
+
+            for server_id in server_ids - set(self._subscriptions):
+                cancelled = threading.Event()
+                self._subscriptions[server_id] = cancelled
+
+                threading.Thread(
+                    target=self._subscribe,
+                    args=(server_id, cancelled),
+                    name=f"wilfred-stats-{server_id}",
+                    daemon=True,
+                ).start()
+
+    def latest(self):
+        """
+        Returns the latest stats sample of every subscribed container
+
+        Returns:
+            Returns ``dict`` of server id and stats sample.
+        """
+
+        with self._lock:
+            return dict(self._latest)
+
+    def close(self):
+        """Drops all subscriptions"""
+
+        self.update([])
+
+    def _subscribe(self, server_id, cancelled):
+        try:
+            container = self._docker_client.containers.get(f"wilfred_{server_id}")
+
+            for sample in container.stats(stream=True, decode=True):
+                if cancelled.is_set():
+                    return
+
+                with self._lock:
+                    self._latest[server_id] = sample
+        except Exception:
+            # container exited or disappeared, the next update subscribes again
+            pass
+        finally:
+            with self._lock:
+                if self._subscriptions.get(server_id) is cancelled:
+                    del self._subscriptions[server_id]
+                    self._latest.pop(server_id, None)
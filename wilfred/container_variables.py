@@ -8,7 +8,8 @@
 #                                                               #
 #################################################################
 
-from wilfred.database import session, EnvironmentVariable
+
+from wilfred.errors import ReadError
 
 
 class ContainerVariables(object):
@@ -17,6 +18,8 @@ class ContainerVariables(object):
         self._image = image
         self._install = install
 
+        self._env_vars = None
+
     def parse_startup_command(self, cmd):
         for k, v in self.get_env_vars().items():
             cmd = cmd.replace("{{image.env." + str(k) + "}}", str(v if v else ""))
@@ -24,21 +27,49 @@ class ContainerVariables(object):
         return cmd
 
     def get_env_vars(self):
+        """
+        Returns environment variables of the server container
+
+        The variables of the server are read from the database (in one query) on the
+        first call, reuse the object to avoid reading them again.
+
+        Returns:
+            Returns ``dict`` of variable and value.
+
+        Raises:
+            :py:class:`wilfred.errors.ReadError`
+                If a variable of the image has no value on file
+        """
+
+        if self._env_vars is None:
+            self._env_vars = self._read_env_vars()
+
+        return dict(self._env_vars)
+
+    def _read_env_vars(self):
+        from wilfred.database import session, EnvironmentVariable
+
+        values = {}
+
+        for variable, value in (
+            session.query(EnvironmentVariable.variable, EnvironmentVariable.value)
+            .filter_by(server_id=self._server.id)
+            .order_by(EnvironmentVariable.id)
+        ):
+            values.setdefault(variable, value)
+
         environment = {}
 
         for var in self._image["variables"]:
-            value = (
-                session.query(EnvironmentVariable)
-                .filter_by(server_id=self._server.id)
-                .filter_by(variable=var["variable"])
-                .first()
-                .value
-            )
+            if var["variable"] not in values:
+                raise ReadError(
+                    f"variable {var['variable']} of server {self._server.name} has no value"
+                )
 
             if var["install_only"] and not self._install:
                 continue
 
-            environment[var["variable"]] = value
+            environment[var["variable"]] = values[var["variable"]]
 
         environment["SERVER_MEMORY"] = self._server.memory
         environment["SERVER_PORT"] = self._server.port
@@ -8,14 +8,23 @@
 #                                                               #
 #################################################################
 
-import requests
 import click
+import json
+import os
+import subprocess
+import sys
 
+from appdirs import user_config_dir, user_data_dir
+from datetime import datetime, timedelta
 from random import choice
 from string import ascii_lowercase, digits
 
 from wilfred.version import version, commit_hash
-from wilfred.message_handler import warning
+
+# the latest release is looked up in the background at most once per TTL
+RELEASE_CHECK_TTL = timedelta(days=1)
+RELEASE_CHECK_TIMEOUT = 3
+RELEASE_CHECK_DISABLE = "WILFRED_NO_UPDATE_CHECK"
 
 
 def random_string(length=8):
@@ -28,37 +37,159 @@ def random_string(length=8):
     return "".join(choice(ascii_lowercase + digits) for i in range(length))
 
 
-def check_for_new_releases(enable_emojis=True):
+def get_database_path():
     """
-    Checks if a new version is available on GitHub
+    Returns path of the Wilfred database (without importing the database module)
+    """
+
+    return f"{user_data_dir()}/wilfred/wilfred.sqlite"
+
+
+def get_release_cache_path():
     """
+    Returns path of the cached result of the latest release check
+    """
+
+    return f"{user_config_dir()}/wilfred/release_cache.json"
 
-    url = "https://api.github.com/repos/wilfred-dev/wilfred/tags"
-    key = "name"
-    version_type = "version"
+
+def _release_source():
+    """returns (url, key, version type) of the latest release (or commit on dev builds)"""
 
     if version == "0.0.0.dev0":
-        url = "https://api.github.com/repos/wilfred-dev/wilfred/commits"
-        key = "sha"
-        version_type = "commit"
+        return (
+            "https://api.github.com/repos/wilfred-dev/wilfred/commits",
+            "sha",
+            "commit",
+        )
+
+    return ("https://api.github.com/repos/wilfred-dev/wilfred/tags", "name", "version")
+
+
+def release_check_enabled(configuration=None):
+    """
+    Checks if the release check has been disabled
+
+    The check is disabled by setting the environment variable `WILFRED_NO_UPDATE_CHECK`
+    or `"update_check": false` in the configuration.
+
+    :param dict configuration: Wilfred configuration, if read
+    """
+
+    if os.environ.get(RELEASE_CHECK_DISABLE, "") not in ("", "0"):
+        return False
+
+    if configuration and configuration.get("update_check") is False:
+        return False
+
+    return True
+
+
+def refresh_release_cache(timeout=RELEASE_CHECK_TIMEOUT):
+    """
+    Looks up the latest release on GitHub and writes it to the release cache
+
+    Failures are cached as well (without a release), so that the lookup is not
+    retried until the cache expires.
+    """
+
+    url, key, _ = _release_source()
+    latest = None
+
+    import requests
+
+    try:
+        r = requests.get(url, timeout=timeout)
 
-    r = requests.get(url)
+        if r.status_code == requests.codes.ok:
+            latest = r.json()[0][key]
+    except Exception:
+        pass
+
+    path = get_release_cache_path()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+
+    with open(f"{path}.{os.getpid()}.tmp", "w") as f:
+        json.dump(
+            {
+                "time": str(datetime.now()),
+                "version": version,
+                "url": url,
+                "latest": latest,
+            },
+            f,
+        )
+
+    os.replace(f"{path}.{os.getpid()}.tmp", path)
+
+
+def _read_release_cache():
+    try:
+        with open(get_release_cache_path()) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _refresh_release_cache_in_background():
+    """starts a detached interpreter refreshing the release cache, never waits for it"""
+
+    try:
+        subprocess.Popen(
+            [
+                sys.executable,
+                "-c",
+                "from wilfred.core import refresh_release_cache; refresh_release_cache()",
+            ],
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+            start_new_session=True,
+        )
+    except OSError:
+        pass
+
+
+def check_for_new_releases(enable_emojis=True, configuration=None):
+    """
+    Checks if a new version is available on GitHub
 
-    if r.status_code != requests.codes.ok:
-        warning("unable to retrieve latest version")
+    Never blocks on the network. The latest release is read from the release cache,
+    which is refreshed in the background once expired (the message is therefore
+    shown on the first run after the cache has been refreshed).
+
+    :param bool enable_emojis: use emojis in the message
+    :param dict configuration: Wilfred configuration, if read
+    """
 
+    if not release_check_enabled(configuration):
         return
 
+    url, _, version_type = _release_source()
+    cache = _read_release_cache()
+
     try:
-        latest = r.json()[0][key]
+        expired = (
+            cache["url"] != url
+            or cache["version"] != version
+            or datetime.now() - datetime.strptime(cache["time"], "%Y-%m-%d %H:%M:%S.%f")
+            > RELEASE_CHECK_TTL
+        )
     except Exception:
-        warning("unable to parse release data")
+        expired = True
 
+    if expired:
+        _refresh_release_cache_in_background()
+
+    # results cached by another version/build say nothing about this one
+    if not cache or cache.get("url") != url or cache.get("version") != version:
         return
 
+    latest = cache.get("latest")
     compare = commit_hash if version == "0.0.0.dev0" else f"v{version}"
 
-    if latest != compare:
+    if latest and latest != compare:
         click.echo(
             "".join(
                 (
@@ -80,6 +211,25 @@ def is_integer(variable):
     return True
 
 
+def parse_duration(duration):
+    """
+    Parses a duration such as `90s`, `15m`, `6h` or `7d` (plain integers are seconds)
+
+    :param str duration: duration to parse
+    :returns: duration in seconds
+    """
+
+    units = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+    if is_integer(duration):
+        return int(duration)
+
+    if len(duration) < 2 or duration[-1] not in units or not is_integer(duration[:-1]):
+        raise ValueError(f"invalid duration {duration}")
+
+    return int(duration[:-1]) * units[duration[-1]]
+
+
 def set_in_dict(dic, keys, value):
     for key in keys[:-1]:
         dic = dic.setdefault(key, {})
@@ -0,0 +1,586 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+"""
+Optional long-lived Wilfred daemon (`wilfredd`) and the client used by the CLI
+
+The daemon keeps the database engine, the Docker connection and the parsed images
+warm, reconciles server states as Docker events arrive and streams the statistics
+of running servers (recording their history). It listens on a Unix socket, every
+message is a JSON object on a single line.
+
+When the daemon is running, the CLI forwards the non-interactive commands to it and
+prints the output, otherwise (or for any other command) the CLI runs in-process.
+"""
+
+import click
+import io
+import json
+import os
+import socket
+import sys
+import threading
+
+from appdirs import user_data_dir
+from datetime import datetime
+from shutil import get_terminal_size
+from socketserver import StreamRequestHandler
+
+from wilfred.errors import WilfredException
+from wilfred.version import version
+
+SOCKET_ENV = "WILFRED_SOCKET"
+
+# seconds to wait for the daemon to accept the connection
+CONNECT_TIMEOUT = 1
+
+# commands forwarded to the daemon, unless any of the interactive options are used
+FORWARDED = ("servers", "images", "sync", "start", "stop", "restart", "command")
+INTERACTIVE_OPTIONS = ("--console", "--watch", "--help")
+
+# seconds between refreshes of the stats subscriptions and retries of the watcher
+STATS_REFRESH = 5
+WATCH_RETRY = 5
+
+
+class DaemonRunning(WilfredException):
+    """Another daemon is already listening on the socket"""
+
+
+class DaemonUnsupported(WilfredException):
+    """Unix sockets are not available on this platform (e.g. Windows)"""
+
+
+def get_socket_path():
+    """
+    Returns path of the daemon socket, WILFRED_SOCKET if set
+    """
+
+    return os.environ.get(SOCKET_ENV) or f"{user_data_dir()}/wilfred/wilfredd.sock"
+
+
+def _connect(path=None):
+    """returns a socket connected to the daemon, ``None`` if it is not running"""
+
+    # e.g. Windows, the daemon is never running
+    if not hasattr(socket, "AF_UNIX"):
+        return None
+
+    path = path or get_socket_path()
+
+    # the common case, no daemon, costs a single stat
+    if not os.path.exists(path):
+        return None
+
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(CONNECT_TIMEOUT)
+
+    try:
+        sock.connect(path)
+    except OSError:
+        sock.close()
+
+        return None
+
+    return sock
+
+
+def _send(sock, message):
+    sock.sendall((json.dumps(message) + "\n").encode("utf-8"))
+
+
+def _receive(sock):
+    for line in sock.makefile("r", encoding="utf-8"):
+        yield json.loads(line)
+
+
+def request(op, **kwargs):
+    """
+    Sends a single request to the daemon
+
+    Args:
+        op (str): Operation, `ping` or `stats`
+
+    Returns:
+        Returns ``dict`` response, ``None`` if the daemon is not running or refused the request.
+    """
+
+    sock = _connect()
+
+    if sock is None:
+        return None
+
+    try:
+        with sock:
+            _send(sock, {"op": op, "version": version, **kwargs})
+
+            for message in _receive(sock):
+                return None if "error" in message else message
+    except (OSError, ValueError):
+        return None
+
+
+def forward(args):
+    """
+    Runs a CLI command in the daemon, printing its output
+
+    Args:
+        args (list): Command line arguments, without the program name
+
+    Returns:
+        Returns ``int`` exit code, ``None`` if the command has to run in-process.
+    """
+
+    if not args or args[0] not in FORWARDED:
+        return None
+
+    if any(arg in INTERACTIVE_OPTIONS for arg in args):
+        return None
+
+    sock = _connect()
+
+    if sock is None:
+        return None
+
+    streams = {"stdout": sys.stdout, "stderr": sys.stderr}
+
+    with sock:
+        try:
+            _send(
+                sock,
+                {
+                    "op": "run",
+                    "version": version,
+                    "args": args,
+                    "color": sys.stdout.isatty(),
+                    "columns": get_terminal_size((80, 20))[0],
+                },
+            )
+
+            # commands such as start may run for a long time
+            sock.settimeout(None)
+
+            for message in _receive(sock):
+                if "error" in message:
+                    # refused, nothing has run yet
+                    return None
+
+                if "exit_code" in message:
+                    return message["exit_code"]
+
+                for name, stream in streams.items():
+                    if name in message:
+                        stream.write(message[name])
+                        stream.flush()
+        except (OSError, ValueError):
+            pass
+
+    click.echo("lost connection to wilfredd", err=True)
+
+    return 1
+
+
+class RemoteStats(object):
+    """
+    Latest stats samples streamed by the daemon, a stand-in for
+    :py:class:`wilfred.api.stats.StatsSubscriptions`
+
+    The daemon subscribes to every running server (and records the history) by itself.
+    """
+
+    def update(self, server_ids):
+        pass
+
+    def latest(self):
+        response = request("stats")
+
+        return response["samples"] if response else {}
+
+    def close(self):
+        pass
+
+
+def remote_stats():
+    """
+    Returns :py:class:`RemoteStats` if the daemon is running, otherwise ``None``
+    """
+
+    return RemoteStats() if request("ping") else None
+
+
+class _Output(io.TextIOBase):
+    """
+    Replaces stdout/stderr of the daemon, output is sent to the client of the command
+    running (if any). Libraries holding on to sys.stdout (e.g. Halo) keep working.
+    """
+
+    encoding = "utf-8"
+
+    def __init__(self, name, fallback):
+        self.name = name
+        self.fallback = fallback
+        self.target = None
+        self.tty = False
+
+    def write(self, data):
+        target = self.target
+
+        if target is None:
+            return self.fallback.write(data)
+
+        target(self.name, data)
+
+        return len(data)
+
+    def flush(self):
+        if self.target is None:
+            self.fallback.flush()
+
+    def isatty(self):
+        return self.tty if self.target else self.fallback.isatty()
+
+    def writable(self):
+        return True
+
+
+class _Handler(StreamRequestHandler):
+    """handles one connection, a single request"""
+
+    def handle(self):
+        self._alive = True
+
+        try:
+            line = self.rfile.readline()
+
+            if line:
+                self.server.daemon.handle(json.loads(line), self._reply)
+        except ValueError:
+            self._reply({"error": "invalid request"})
+
+    def _reply(self, message):
+        # the client may have left, the command keeps running
+        if not self._alive:
+            return
+
+        try:
+            self.wfile.write((json.dumps(message) + "\n").encode("utf-8"))
+        except OSError:
+            self._alive = False
+
+
+class Daemon(object):
+    """
+    Serves CLI commands and stats on a Unix socket, keeps state between commands
+
+    Args:
+        path (str): Path of the socket, defaults to :py:func:`get_socket_path`
+    """
+
+    def __init__(self, path=None):
+        self.path = path or get_socket_path()
+
+        # output is routed to one client at a time, other clients run the command
+        # in-process instead of waiting (database sessions are per thread)
+        self._busy = threading.Lock()
+
+        self._server = None
+        self._servers = None
+        self._subscriptions = None
+        self._stopped = threading.Event()
+
+        self._stdout = _Output("stdout", sys.stdout)
+        self._stderr = _Output("stderr", sys.stderr)
+
+    def serve(self):
+        """
+        Listens on the socket until :py:meth:`shutdown` is called
+
+        Raises:
+            :py:class:`DaemonRunning`
+                If another daemon is listening on the socket
+            :py:class:`DaemonUnsupported`
+                If the platform has no Unix sockets
+        """
+
+        if not hasattr(socket, "AF_UNIX"):
+            raise DaemonUnsupported(
+                "wilfredd requires Unix sockets, not available on this platform"
+            )
+
+        # only defined on platforms with Unix sockets
+        from socketserver import ThreadingUnixStreamServer
+
+        from wilfred.api.history import ResourceHistory, Sampler
+
+        self._bind(ThreadingUnixStreamServer)
+
+        sys.stdout, sys.stderr = self._stdout, self._stderr
+
+        try:
+            self._servers = self._warm_up()
+            self._subscriptions = self._servers.subscribe_stats()
+
+            sampler = Sampler(self._subscriptions, ResourceHistory())
+            sampler.start()
+
+            for target in (self._watch, self._refresh_stats):
+                threading.Thread(target=target, daemon=True).start()
+
+            self.log(f"listening on {self.path}")
+
+            try:
+                self._server.serve_forever()
+            finally:
+                self._stopped.set()
+                sampler.stop()
+                self._subscriptions.close()
+        finally:
+            sys.stdout, sys.stderr = self._stdout.fallback, self._stderr.fallback
+
+            self._server.server_close()
+
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
+
+    def shutdown(self):
+        """Stops serving, can be called from any thread (or a signal handler)"""
+
+        threading.Thread(target=self._server.shutdown, daemon=True).start()
+
+    def log(self, message):
+        click.echo(
+            f"{datetime.now().strftime('%Y-%m-%d %H:%M:%S')} {message}",
+            file=self._stderr.fallback,
+        )
+
+    def handle(self, message, reply):
+        """
+        Handles a request
+
+        Args:
+            message (dict): Request, must contain `op` and the `version` of the client
+            reply (callable): Called with every response message
+        """
+
+        if message.get("version") != version:
+            return reply({"error": f"wilfredd runs version {version}"})
+
+        op = message.get("op")
+
+        if op == "ping":
+            return reply({"pid": os.getpid(), "version": version})
+
+        if op == "stats":
+            return reply({"samples": self._subscriptions.latest()})
+
+        if op == "run":
+            if not self._busy.acquire(blocking=False):
+                return reply({"error": "wilfredd is busy"})
+
+            try:
+                exit_code = self.run(
+                    message["args"],
+                    lambda name, data: reply({name: data}),
+                    color=message.get("color", False),
+                    columns=message.get("columns", 80),
+                )
+            finally:
+                self._busy.release()
+
+            return reply({"exit_code": exit_code})
+
+        reply({"error": f"unknown operation {op}"})
+
+    def run(self, args, write, color=False, columns=80):
+        """
+        Runs a CLI command, the caller makes sure only one runs at a time
+
+        Args:
+            args (list): Command line arguments, without the program name
+            write (callable): Called with the stream name (`stdout` or `stderr`) and output of the command
+            color (bool): Keep ANSI styles in the output
+            columns (int): Width of the terminal of the client
+
+        Returns:
+            Returns ``int`` exit code of the command.
+        """
+
+        from wilfred.wilfred import cli, get_config, get_images, get_servers
+        from wilfred.database import session
+
+        # other processes may have changed the configuration and images, the Docker
+        # connection and database engine are kept
+        get_config.cache_clear()
+        get_images.cache_clear()
+        get_servers.cache_clear()
+
+        for output in (self._stdout, self._stderr):
+            output.target = write
+            output.tty = color
+
+        try:
+            exit_code = self._invoke(cli, args, color, columns)
+
+            # the watcher reconciles using what the command has read
+            self._reload()
+
+            return exit_code
+        finally:
+            for output in (self._stdout, self._stderr):
+                output.target = None
+                output.tty = False
+
+            # the session of this (handler) thread
+            session.remove()
+
+    def _invoke(self, cli, args, color, columns):
+        import traceback
+
+        try:
+            result = cli.main(
+                args=list(args),
+                prog_name="wilfred",
+                standalone_mode=False,
+                color=color,
+                terminal_width=columns,
+            )
+        except click.ClickException as e:
+            e.show()
+
+            return e.exit_code
+        except click.Abort:
+            click.echo("Aborted!", err=True)
+
+            return 1
+        except SystemExit as e:
+            if e.code is None or isinstance(e.code, int):
+                return e.code or 0
+
+            click.echo(e.code, err=True)
+
+            return 1
+        except Exception:
+            traceback.print_exc()
+
+            return 1
+
+        return result if isinstance(result, int) else 0
+
+    def _reload(self):
+        """hands the configuration and images, read again by commands, to the watcher"""
+
+        from wilfred.wilfred import get_config, get_images
+
+        if self._servers is None:
+            return
+
+        try:
+            self._servers.reload(get_config().configuration, get_images())
+        except (Exception, SystemExit):
+            # reported to the client, the watcher keeps what it had
+            pass
+
+    def _bind(self, server_class):
+        if _connect(self.path):
+            raise DaemonRunning(f"wilfredd is already listening on {self.path}")
+
+        # stale socket of a daemon that did not exit cleanly
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+        # only the user running the daemon may connect
+        umask = os.umask(0o177)
+
+        try:
+            self._server = server_class(self.path, _Handler)
+        finally:
+            os.umask(umask)
+
+        self._server.daemon = self
+        self._server.daemon_threads = True
+
+    def _warm_up(self):
+        """opens the database, connects to Docker and reads the images"""
+
+        from wilfred.migrate import Migrate
+        from wilfred.wilfred import get_servers
+
+        Migrate()
+
+        servers = get_servers()
+        servers.sync()
+
+        return servers
+
+    def _watch(self):
+        def _log(server, action):
+            self.log(f"{server.name} ({server.id}) {action}")
+
+        while not self._stopped.is_set():
+            try:
+                self._servers.watch(callback=_log)
+            except Exception as e:
+                self.log(f"watching Docker events failed, {type(e).__name__} {str(e)}")
+
+            self._stopped.wait(WATCH_RETRY)
+
+    def _refresh_stats(self):
+        from wilfred.api.stats import running_server_ids
+        from wilfred.database import session
+
+        while not self._stopped.is_set():
+            try:
+                self._subscriptions.update(running_server_ids(self._servers.all()))
+            except Exception as e:
+                self.log(f"refreshing stats failed, {type(e).__name__} {str(e)}")
+            finally:
+                # start over with a fresh session, commands commit in theirs
+                session.remove()
+
+            self._stopped.wait(STATS_REFRESH)
+
+
+@click.command()
+@click.option(
+    "--socket",
+    "path",
+    type=click.Path(dir_okay=False),
+    help="Path of the socket, defaults to WILFRED_SOCKET or the Wilfred data directory.",
+)
+def wilfredd(path):
+    """
+    Wilfred daemon, keeps Wilfred warm and servers in sync.
+
+    While running, the wilfred commands servers, images, sync, start, stop, restart
+    and command are executed by the daemon.
+    """
+
+    import signal
+
+    from wilfred.message_handler import ui_exception
+
+    daemon = Daemon(path)
+
+    signal.signal(signal.SIGTERM, lambda *args: daemon.shutdown())
+
+    try:
+        daemon.serve()
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        ui_exception(e)
+
+
+def main():
+    wilfredd()
@@ -8,20 +8,80 @@
 #                                                               #
 #################################################################
 
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey
-from sqlalchemy.orm import relationship, sessionmaker, validates
+from sqlalchemy import create_engine, event, Column, Integer, String, ForeignKey, Index
+from sqlalchemy.orm import relationship, scoped_session, sessionmaker, validates
 from sqlalchemy.ext.declarative import declarative_base
 
 from appdirs import user_data_dir
 from os.path import isdir
 from pathlib import Path
 
+from wilfred.core import get_database_path
+from wilfred import profiler
 
 if not isdir(f"{user_data_dir()}/wilfred"):
     Path(f"{user_data_dir()}/wilfred").mkdir(parents=True, exist_ok=True)
 
-database_path = f"{user_data_dir()}/wilfred/wilfred.sqlite"
+# applied to every connection, WAL lets readers (e.g. top) and the writer work concurrently
+PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA busy_timeout=5000",
+)
+
+# schema changes of existing databases, by the version (PRAGMA user_version) they
+# upgrade to, new databases are created at the latest version
+MIGRATIONS = {
+    1: (
+        "CREATE INDEX IF NOT EXISTS ix_environment_variables_server_id_variable "
+        "ON environment_variables (server_id, variable)",
+        "CREATE INDEX IF NOT EXISTS ix_ports_server_id ON ports (server_id)",
+    ),
+}
+SCHEMA_VERSION = max(MIGRATIONS)
+
+
+def _set_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+
+    for pragma in PRAGMAS:
+        cursor.execute(pragma)
+
+    cursor.close()
+
+
+def migrate(engine):
+    """
+    Creates missing tables and applies the migrations the database has not seen yet
+
+    The version of the schema is kept in `PRAGMA user_version`, a database that is up
+    to date costs a single query.
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine
+    """
+
+    with engine.begin() as conn:
+        current = conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+        # databases written by newer versions are left alone
+        if current >= SCHEMA_VERSION:
+            return
+
+        Base.metadata.create_all(conn)
+
+        for version in sorted(MIGRATIONS):
+            if version > current:
+                for statement in MIGRATIONS[version]:
+                    conn.exec_driver_sql(statement)
+
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+
+database_path = get_database_path()
 engine = create_engine(f"sqlite:///{database_path}")
+event.listen(engine, "connect", _set_pragmas)
+profiler.instrument_engine(engine)
 Base = declarative_base()
 
 
@@ -51,6 +111,9 @@ class Server(Base):
 
 class EnvironmentVariable(Base):
     __tablename__ = "environment_variables"
+    __table_args__ = (
+        Index("ix_environment_variables_server_id_variable", "server_id", "variable"),
+    )
 
     id = Column(Integer, primary_key=True)
     server_id = Column(String, ForeignKey("servers.id"), unique=False)
@@ -60,14 +123,17 @@ class EnvironmentVariable(Base):
 
 class Port(Base):
     __tablename__ = "ports"
+    __table_args__ = (Index("ix_ports_server_id", "server_id"),)
 
     id = Column(Integer, primary_key=True)
     server_id = Column(String, ForeignKey("servers.id"), unique=False)
     port = Column(Integer, unique=True)
 
 
-Base.metadata.create_all(engine)
+migrate(engine)
 
 Session = sessionmaker()
 Session.configure(bind=engine)
-session = Session()
+
+# one session per thread (e.g. commands and the watcher of wilfredd run concurrently)
+session = scoped_session(Session)
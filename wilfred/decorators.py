@@ -13,17 +13,17 @@ from functools import wraps
 from wilfred.message_handler import error
 from wilfred.api.config_parser import Config, NoConfiguration
 
-config = Config()
-
-try:
-    config.read()
-except NoConfiguration:
-    pass
-
 
 def configuration_present(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
+        config = Config()
+
+        try:
+            config.read()
+        except NoConfiguration:
+            pass
+
         if not config.configuration:
             error("Wilfred has not been configured", exit_code=1)
         return f(*args, **kwargs)
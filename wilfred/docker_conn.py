@@ -8,7 +8,7 @@
 #                                                               #
 #################################################################
 
-import docker
+from wilfred import profiler
 
 
 def docker_client(base_url=None):
@@ -16,6 +16,13 @@ def docker_client(base_url=None):
 
     :param str base_url: Base URL for Docker socket. Uses env if None."""
 
-    client = docker.DockerClient(base_url=base_url) if base_url else docker.from_env()
+    with profiler.phase("docker connect"):
+        import docker
+
+        client = (
+            docker.DockerClient(base_url=base_url) if base_url else docker.from_env()
+        )
+
+    profiler.instrument_docker(client)
 
     return client
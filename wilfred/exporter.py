@@ -0,0 +1,267 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import socket
+import threading
+
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from time import monotonic
+
+from wilfred.api.stats import (
+    cpu_percent,
+    memory_usage,
+    network_io,
+    block_io,
+    running_server_ids,
+)
+
+CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+# seconds between re-rendering metrics and re-reading the server list
+RENDER_INTERVAL = 1
+SERVER_REFRESH = 5
+
+STATUSES = ("running", "stopped", "installing")
+
+# name, type, help and function returning the value from a stats sample
+METRICS = (
+    (
+        "wilfred_server_cpu_percent",
+        "gauge",
+        "CPU load of the server container in percent",
+        cpu_percent,
+    ),
+    (
+        "wilfred_server_memory_used_bytes",
+        "gauge",
+        "Memory used by the server container",
+        lambda d: (memory_usage(d) or (None, None))[0],
+    ),
+    (
+        "wilfred_server_memory_limit_bytes",
+        "gauge",
+        "Memory limit of the server container",
+        lambda d: (memory_usage(d) or (None, None))[1],
+    ),
+    (
+        "wilfred_server_network_receive_bytes",
+        "counter",
+        "Bytes received by the server container",
+        lambda d: (network_io(d) or (None, None))[0],
+    ),
+    (
+        "wilfred_server_network_transmit_bytes",
+        "counter",
+        "Bytes transmitted by the server container",
+        lambda d: (network_io(d) or (None, None))[1],
+    ),
+    (
+        "wilfred_server_block_read_bytes",
+        "counter",
+        "Bytes read from block devices by the server container",
+        lambda d: (block_io(d) or (None, None))[0],
+    ),
+    (
+        "wilfred_server_block_write_bytes",
+        "counter",
+        "Bytes written to block devices by the server container",
+        lambda d: (block_io(d) or (None, None))[1],
+    ),
+)
+
+
+def _labels(server, **extra):
+    def _escape(value):
+        return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+    labels = {
+        "id": server["id"],
+        "name": server["name"],
+        "image_uid": server["image_uid"],
+        **extra,
+    }
+
+    return ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items())
+
+
+def render(servers, samples, restarts):
+    """
+    Renders metrics in the OpenMetrics text format
+
+    Args:
+        servers (list): Server data as returned by :py:meth:`Servers.all`
+        samples (dict): Server id and latest Docker stats sample
+        restarts (dict): Server id and number of times the container has been replaced
+
+    Returns:
+        Returns ``str`` of metrics.
+    """
+
+    lines = [
+        "# TYPE wilfred_server_status stateset",
+        "# HELP wilfred_server_status Status of the server",
+    ]
+
+    for server in servers:
+        for status in STATUSES:
+            lines.append(
+                " ".join(
+                    (
+                        f"wilfred_server_status{{{_labels(server, wilfred_server_status=status)}}}",
+                        "1" if server["status"] == status else "0",
+                    )
+                )
+            )
+
+    for name, metric_type, description, value in METRICS:
+        lines.append(f"# TYPE {name} {metric_type}")
+        lines.append(f"# HELP {name} {description}")
+
+        for server in servers:
+            if server["id"] not in samples:
+                continue
+
+            try:
+                v = value(samples[server["id"]])
+            except (KeyError, TypeError, ZeroDivisionError):
+                v = None
+
+            if v is not None:
+                lines.append(
+                    " ".join(
+                        (
+                            f"{name}{'_total' if metric_type == 'counter' else ''}{{{_labels(server)}}}",
+                            str(v),
+                        )
+                    )
+                )
+
+    lines.append("# TYPE wilfred_server_restarts counter")
+    lines.append(
+        "# HELP wilfred_server_restarts Number of times the server container was replaced"
+    )
+
+    for server in servers:
+        lines.append(
+            f"wilfred_server_restarts_total{{{_labels(server)}}} {restarts.get(server['id'], 0)}"
+        )
+
+    lines.append("# EOF")
+
+    return "\n".join(lines) + "\n"
+
+
+class _IPv6HTTPServer(ThreadingHTTPServer):
+    address_family = socket.AF_INET6
+
+
+def _http_server(host, port, handler):
+    """returns a threading HTTP server bound to host (an IPv4 or IPv6 address, or hostname)"""
+
+    # e.g. ::1, the address family of the socket is fixed by the server class
+    server_class = _IPv6HTTPServer if ":" in host else ThreadingHTTPServer
+
+    httpd = server_class((host, port), handler)
+    httpd.daemon_threads = True
+
+    return httpd
+
+
+class Exporter(object):
+    """
+    Serves resource usage of all servers as OpenMetrics, e.g. for Prometheus
+
+    Samples are streamed from Docker and metrics are rendered in a background
+    thread, a scrape only returns the last rendered payload.
+    """
+
+    def __init__(self, servers):
+        """
+        Args:
+            servers (Servers): wilfred.api.Servers object
+        """
+
+        self._servers = servers
+        self._subscriptions = servers.subscribe_stats()
+        self._stopped = threading.Event()
+
+        self._restarts = {}
+        self._container_ids = {}
+        self.payload = render([], {}, {}).encode("utf-8")
+
+    def serve(self, host, port):
+        """Refreshes metrics in the background and serves them over HTTP, blocks until interrupted"""
+
+        exporter = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+
+                payload = exporter.payload
+
+                self.send_response(200)
+                self.send_header("Content-Type", CONTENT_TYPE)
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, format, *args):
+                pass
+
+        thread = threading.Thread(
+            target=self._refresh_loop, name="wilfred-exporter", daemon=True
+        )
+        thread.start()
+
+        httpd = _http_server(host, port, _Handler)
+
+        try:
+            httpd.serve_forever()
+        finally:
+            self._stopped.set()
+            httpd.server_close()
+            self._subscriptions.close()
+
+    def _refresh_loop(self):
+        rows = []
+        refreshed_at = None
+
+        while not self._stopped.is_set():
+            if refreshed_at is None or monotonic() - refreshed_at >= SERVER_REFRESH:
+                try:
+                    rows = self._servers.all()
+                except Exception:
+                    # keep serving the last known servers, e.g. while the database is locked
+                    pass
+
+                self._subscriptions.update(running_server_ids(rows))
+                refreshed_at = monotonic()
+
+            samples = self._subscriptions.latest()
+            self._count_restarts(samples)
+            self.payload = render(rows, samples, self._restarts).encode("utf-8")
+
+            self._stopped.wait(RENDER_INTERVAL)
+
+    def _count_restarts(self, samples):
+        # containers are removed on exit, a new container id means the server was started again
+        for server_id, sample in samples.items():
+            container_id = sample.get("id")
+
+            if container_id is None:
+                continue
+
+            if self._container_ids.get(server_id, container_id) != container_id:
+                self._restarts[server_id] = self._restarts.get(server_id, 0) + 1
+
+            self._container_ids[server_id] = container_id
@@ -8,8 +8,13 @@
 #                                                               #
 #################################################################
 
+import os
+import sys
 import threading
 
+from select import select
+from time import monotonic, sleep
+
 
 class KeyboardThread(threading.Thread):
     def __init__(self, input_callback, params):
@@ -27,3 +32,65 @@ class KeyboardThread(threading.Thread):
                 self.input_callback(input(), self.params)
             except Exception:
                 self._running = False
+
+
+class KeyReader(object):
+    """
+    Reads single key presses without waiting for enter, use as a context manager
+
+    The terminal is put in cbreak mode while in use (POSIX), on Windows msvcrt is used.
+    If stdin is not a terminal, no keys are ever read.
+    """
+
+    def __init__(self):
+        self._attributes = None
+        self._enabled = sys.stdin.isatty()
+
+    def __enter__(self):
+        if self._enabled and not sys.platform.startswith("win"):
+            import termios
+            import tty
+
+            self._attributes = termios.tcgetattr(sys.stdin.fileno())
+            tty.setcbreak(sys.stdin.fileno())
+
+        return self
+
+    def __exit__(self, *args):
+        if self._attributes is not None:
+            import termios
+
+            termios.tcsetattr(sys.stdin.fileno(), termios.TCSADRAIN, self._attributes)
+            self._attributes = None
+
+    def read(self, timeout):
+        """
+        Waits up to `timeout` seconds for key presses
+
+        Returns:
+            Returns ``str`` of the keys pressed, empty if none.
+        """
+
+        if not self._enabled:
+            sleep(timeout)
+            return ""
+
+        if sys.platform.startswith("win"):
+            import msvcrt
+
+            deadline = monotonic() + timeout
+            keys = ""
+
+            while not keys and monotonic() < deadline:
+                while msvcrt.kbhit():
+                    keys += msvcrt.getwch()
+
+                if not keys:
+                    sleep(0.02)
+
+            return keys
+
+        if not select([sys.stdin], [], [], timeout)[0]:
+            return ""
+
+        return os.read(sys.stdin.fileno(), 32).decode("utf-8", errors="ignore")
@@ -8,7 +8,6 @@
 #                                                               #
 #################################################################
 
-import sqlite3
 import click
 
 from appdirs import user_data_dir
@@ -16,7 +15,18 @@ from os.path import isfile
 from os import remove
 
 from wilfred.message_handler import error
-from wilfred.database import session, Server, EnvironmentVariable
+
+# columns copied from the legacy database
+SERVER_COLUMNS = (
+    "id",
+    "name",
+    "image_uid",
+    "memory",
+    "port",
+    "custom_startup",
+    "status",
+)
+VARIABLE_COLUMNS = ("server_id", "variable", "value")
 
 
 class Migrate:
@@ -26,66 +36,76 @@ class Migrate:
         # perform checks
         self._legacy_sqlite_db_check()
 
-    def _legacy_sqlite_query(self, query):
-        result = []
+    def _legacy_sqlite_read(self):
+        """
+        Reads servers and variables of the legacy database using one connection
 
-        try:
-            conn = sqlite3.connect(self._legacy_sqlite_path)
-            conn.row_factory = sqlite3.Row
+        Returns:
+            Returns ``tuple`` of servers and variables, as ``list`` of ``dict``.
+        """
 
-            cur = conn.cursor()
-            cur.execute(query)
+        import sqlite3
 
-            for r in cur.fetchall():
-                result.append(dict(r))
+        try:
+            conn = sqlite3.connect(f"file:{self._legacy_sqlite_path}?mode=ro", uri=True)
+        except sqlite3.OperationalError as e:
+            error(
+                "could not communicate with database " + click.style(str(e), bold=True),
+                exit_code=1,
+            )
 
-            conn.commit()
-            conn.close()
+        conn.row_factory = sqlite3.Row
+
+        try:
+            servers = [dict(r) for r in conn.execute("SELECT * FROM servers")]
+            variables = [dict(r) for r in conn.execute("SELECT * FROM variables")]
         except sqlite3.OperationalError as e:
             error(
                 "could not communicate with database " + click.style(str(e), bold=True),
                 exit_code=1,
             )
-        except sqlite3.IntegrityError as e:
-            error("invalid input " + click.style(str(e), bold=True), exit_code=1)
+        finally:
+            conn.close()
 
-        return result
+        return (servers, variables)
 
     def _legacy_sqlite_db_check(self):
-        if isfile(self._legacy_sqlite_path):
-            for server in self._legacy_sqlite_query("SELECT * FROM servers"):
-                session.add(
-                    Server(
-                        id=server["id"],
-                        name=server["name"],
-                        image_uid=server["image_uid"],
-                        memory=server["memory"],
-                        port=server["port"],
-                        custom_startup=server["custom_startup"],
-                        status=server["status"],
-                    )
+        # the only thing done on every start, a single stat
+        if not isfile(self._legacy_sqlite_path):
+            return
+
+        from sqlalchemy import insert
+
+        from wilfred.database import session, Server, EnvironmentVariable
+
+        servers, variables = self._legacy_sqlite_read()
+
+        # everything or nothing is migrated, the legacy database is kept on failure
+        try:
+            if servers:
+                session.execute(
+                    insert(Server.__table__),
+                    [
+                        {key: server[key] for key in SERVER_COLUMNS}
+                        for server in servers
+                    ],
                 )
 
-            try:
-                session.commit()
-            except Exception as e:
-                error(str(e), exit_code=1)
-
-            for variable in self._legacy_sqlite_query("SELECT * FROM variables"):
-                session.add(
-                    EnvironmentVariable(
-                        server_id=variable["server_id"],
-                        variable=variable["variable"],
-                        value=variable["value"],
-                    )
+            if variables:
+                session.execute(
+                    insert(EnvironmentVariable.__table__),
+                    [
+                        {key: variable[key] for key in VARIABLE_COLUMNS}
+                        for variable in variables
+                    ],
                 )
 
-            try:
-                session.commit()
-            except Exception as e:
-                error(str(e), exit_code=1)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            error(str(e), exit_code=1)
 
-            try:
-                remove(f"{self._legacy_sqlite_path}")
-            except Exception as e:
-                error(str(e), exit_code=1)
+        try:
+            remove(f"{self._legacy_sqlite_path}")
+        except Exception as e:
+            error(str(e), exit_code=1)
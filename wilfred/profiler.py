@@ -0,0 +1,260 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+"""
+Phase profiler of the Wilfred CLI, enabled using `wilfred --profile` or WILFRED_PROFILE=1
+
+Hooks are installed centrally (the Servers, Images and ServerConfig APIs, the Docker
+client and the database engine), commands do not have to be instrumented. The
+report is printed to stderr when the process exits.
+"""
+
+import atexit
+import sys
+import threading
+
+from collections import defaultdict
+from contextlib import contextmanager
+from functools import wraps
+from time import perf_counter
+
+# set as early as possible, startup is measured from here
+STARTED = perf_counter()
+
+PROFILE_ENV = "WILFRED_PROFILE"
+PROFILE_OUTPUT_ENV = "WILFRED_PROFILE_OUTPUT"
+
+# API methods timed as phases, by module and class
+INSTRUMENTED = (
+    (
+        "wilfred.api.servers",
+        "Servers",
+        (
+            "__init__",
+            "all",
+            "sync",
+            "watch",
+            "remove",
+            "install",
+            "stop",
+            "bulk",
+            "kill",
+            "rename",
+            "command",
+        ),
+    ),
+    ("wilfred.api.images", "Images", ("read_images", "download")),
+    (
+        "wilfred.api.server_config",
+        "ServerConfig",
+        ("__init__", "write_environment_variables", "edit", "apply"),
+    ),
+)
+
+REPORT_LIMIT = 10
+
+_lock = threading.Lock()
+
+enabled = False
+
+_phases = defaultdict(lambda: [0, 0.0])  # name: [calls, seconds]
+_docker = defaultdict(lambda: [0, 0.0])  # method and path: [calls, seconds]
+_sql = defaultdict(lambda: [0, 0.0])  # statement: [calls, seconds]
+_cprofile = None
+_output = None
+
+
+def _record(table, key, duration):
+    with _lock:
+        table[key][0] += 1
+        table[key][1] += duration
+
+
+@contextmanager
+def phase(name):
+    """
+    Times a block as phase `name`, does nothing unless the profiler is enabled
+
+    Args:
+        name (str): Name of the phase, durations of phases with the same name are summed
+    """
+
+    if not enabled:
+        yield
+        return
+
+    started = perf_counter()
+
+    try:
+        yield
+    finally:
+        _record(_phases, name, perf_counter() - started)
+
+
+def _timed(name, function):
+    @wraps(function)
+    def wrapper(*args, **kwargs):
+        with phase(name):
+            return function(*args, **kwargs)
+
+    wrapper.__wilfred_profiled__ = True
+
+    return wrapper
+
+
+def enable(output=None):
+    """
+    Enables the profiler and prints the report to stderr at exit
+
+    Args:
+        output (str): Path to dump cProfile statistics to (readable using `pstats`)
+    """
+
+    global enabled, _cprofile, _output
+
+    if enabled:
+        return
+
+    enabled = True
+    _record(_phases, "startup (imports)", perf_counter() - STARTED)
+
+    from importlib import import_module
+
+    for module, name, methods in INSTRUMENTED:
+        cls = getattr(import_module(module), name)
+
+        for method in methods:
+            function = getattr(cls, method, None)
+
+            if function is not None and not hasattr(function, "__wilfred_profiled__"):
+                setattr(cls, method, _timed(f"{name}.{method}", function))
+
+    # the database may already be open (e.g. by migrations)
+    if "wilfred.database" in sys.modules:
+        instrument_engine(sys.modules["wilfred.database"].engine)
+
+    if output:
+        import cProfile
+
+        _output = output
+        _cprofile = cProfile.Profile()
+        _cprofile.enable()
+
+    atexit.register(report)
+
+
+def instrument_docker(client):
+    """
+    Counts and times every Docker API request made by client
+
+    Args:
+        client (docker.DockerClient): Docker client
+    """
+
+    if not enabled or hasattr(client.api.send, "__wilfred_profiled__"):
+        return
+
+    send = client.api.send
+
+    @wraps(send)
+    def _send(request, **kwargs):
+        started = perf_counter()
+
+        try:
+            return send(request, **kwargs)
+        finally:
+            # strip the API version and query, e.g. GET /containers/{id}/json
+            path = request.path_url.split("?")[0].split("/")
+            path = "/".join(
+                "{id}" if len(part) == 64 or part.startswith("wilfred_") else part
+                for part in path[2 if path[1].startswith("v1.") else 1 :]
+            )
+
+            _record(_docker, f"{request.method} /{path}", perf_counter() - started)
+
+    _send.__wilfred_profiled__ = True
+    client.api.send = _send
+
+
+def instrument_engine(engine):
+    """
+    Counts and times every SQL statement executed on engine
+
+    Args:
+        engine (sqlalchemy.engine.Engine): Database engine
+    """
+
+    if not enabled:
+        return
+
+    from sqlalchemy import event
+
+    if event.contains(engine, "before_cursor_execute", _before_cursor_execute):
+        return
+
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("wilfred_started", []).append(perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["wilfred_started"].pop()
+
+    # e.g. SELECT servers.id AS ...
+    _record(_sql, " ".join(statement.split()[:4]), perf_counter() - started)
+
+
+def _table(title, rows, total):
+    lines = [f"{title}:"]
+
+    for name, (calls, seconds) in sorted(
+        rows.items(), key=lambda x: x[1][1], reverse=True
+    )[:REPORT_LIMIT]:
+        lines.append(f"  {seconds * 1000:>9.1f} ms {calls:>6}x  {name}")
+
+    if len(rows) > REPORT_LIMIT:
+        lines.append(f"  ... {len(rows) - REPORT_LIMIT} more")
+
+    if total:
+        calls = sum(x[0] for x in rows.values())
+        seconds = sum(x[1] for x in rows.values())
+        lines.append(f"  {seconds * 1000:>9.1f} ms {calls:>6}x  total")
+
+    return lines
+
+
+def report():
+    """prints the report to stderr, dumps cProfile statistics if requested"""
+
+    if _cprofile:
+        _cprofile.disable()
+        _cprofile.dump_stats(_output)
+
+    lines = [
+        "",
+        f"wilfred profile, {(perf_counter() - STARTED) * 1000:.1f} ms in total "
+        "(phases are nested, e.g. Servers.all includes Docker requests)",
+    ]
+
+    lines += _table("Phases", _phases, False)
+
+    if _docker:
+        lines += _table("Docker API requests", _docker, True)
+
+    if _sql:
+        lines += _table("SQL statements", _sql, True)
+
+    if _output:
+        lines.append(f"cProfile statistics written to {_output}")
+
+    print("\n".join(lines), file=sys.stderr)
@@ -0,0 +1,298 @@
+#################################################################
+#                                                               #
+# Wilfred                                                       #
+# Copyright (C) 2020-2022, Vilhelm Prytz, <vilhelm@prytznet.se> #
+#                                                               #
+# Licensed under the terms of the MIT license, see LICENSE.     #
+# https://github.com/wilfred-dev/wilfred                        #
+#                                                               #
+#################################################################
+
+import click
+
+from shutil import get_terminal_size
+
+from wilfred.api.stats import (
+    cpu_percent,
+    memory_usage,
+    format_cpu_load,
+    format_memory_usage,
+)
+
+# key, header and whether the column may be dropped on narrow terminals
+COLUMNS = (
+    ("id", "ID", False),
+    ("name", "Name", False),
+    ("image_uid", "Image UID", True),
+    ("memory", "RAM", True),
+    ("port", "Port", True),
+    ("custom_startup", "Custom startup", True),
+    ("status", "Status", False),
+    ("cpu_load", "CPU", False),
+    ("memory_usage", "MEM usage / MEM %", False),
+)
+
+# room for typical values, e.g. "100.00%" and "10240.0 MB / 100.0%", so that
+# changing values do not resize (and redraw) the table
+MIN_WIDTHS = {"cpu_load": 7, "memory_usage": 19}
+
+STATUS_COLORS = {"running": "green", "stopped": "red", "installing": "yellow"}
+
+SORT_KEYS = ("name", "cpu", "memory")
+SORT_SHORTCUTS = {"c": "cpu", "m": "memory", "n": "name"}
+
+# rows above the table (status line and headers)
+_HEADER_LINES = 2
+_GAP = 2
+
+
+def _move(row, column):
+    return f"\x1b[{row};{column}H"
+
+
+_CLEAR_LINE = "\x1b[K"
+_CLEAR_SCREEN = "\x1b[H\x1b[2J"
+
+ENTER_SCREEN = "\x1b[?1049h\x1b[?25l"
+LEAVE_SCREEN = "\x1b[?25h\x1b[?1049l"
+
+
+class TopView(object):
+    """
+    Renders the `wilfred top` table and only redraws what changed between frames
+
+    Each frame is compared cell by cell to the previous frame, the returned
+    output moves the cursor to the cells that changed and rewrites them. The
+    whole screen is only redrawn when the layout (terminal size or column
+    widths) changes. Columns only ever grow until the terminal is resized.
+    """
+
+    def __init__(self, sort="name", reverse=False, filter_text=None):
+        self.sort = sort
+        self.reverse = reverse
+        self.filter_text = filter_text or ""
+        self.editing_filter = False
+
+        self._layout = None
+        self._widths = {}  # widest cell of every column so far
+        self._lines = []  # status line, headers and rows of cells of the previous frame
+
+    def sort_by(self, key):
+        """Sorts by key, reverses the order if already sorted by it"""
+
+        if key == self.sort:
+            self.reverse = not self.reverse
+        else:
+            self.sort = key
+            # busiest servers first
+            self.reverse = key != "name"
+
+    def handle_keys(self, keys):
+        """
+        Handles key presses (sort, filter and quit)
+
+        Returns:
+            Returns ``False`` if the user wants to quit, otherwise ``True``.
+        """
+
+        for key in keys:
+            if self.editing_filter:
+                if key in ("\r", "\n"):
+                    self.editing_filter = False
+                elif key == "\x1b":
+                    self.editing_filter = False
+                    self.filter_text = ""
+                elif key in ("\x7f", "\b"):
+                    self.filter_text = self.filter_text[:-1]
+                elif key.isprintable():
+                    self.filter_text += key
+
+                continue
+
+            if key == "q":
+                return False
+
+            if key == "/":
+                self.editing_filter = True
+                self.filter_text = ""
+
+            if key in SORT_SHORTCUTS:
+                self.sort_by(SORT_SHORTCUTS[key])
+
+        return True
+
+    def render(self, servers, samples, size=None):
+        """
+        Renders a frame
+
+        Args:
+            servers (list): Server data as returned by :py:meth:`Servers.all`
+            samples (dict): Server id and latest stats sample (or a string to show instead)
+            size (tuple): Terminal size (columns, lines), detected if not specified
+
+        Returns:
+            Returns ``str`` to write to the terminal.
+        """
+
+        columns, lines = size if size else get_terminal_size((80, 20))
+        rows = self._rows(servers, samples)
+
+        total = len(rows)
+        rows = rows[: max(lines - _HEADER_LINES - 1, 0)]
+
+        # start over with the widths of the current cells on resize
+        if self._layout and self._layout[:2] != (columns, lines):
+            self._widths = {}
+
+        widths, keys = self._fit(rows, columns)
+
+        frame = [
+            [self._status_line(total, len(rows))],
+            [header for key, header, _ in COLUMNS if key in keys],
+        ] + [[row[key] for key in keys] for row in rows]
+
+        layout = (columns, lines, tuple(widths), tuple(keys))
+        output = []
+
+        if layout != self._layout:
+            output.append(_CLEAR_SCREEN)
+            self._lines = []
+
+        for i, cells in enumerate(frame):
+            previous = self._lines[i] if i < len(self._lines) else None
+
+            if previous is None:
+                output.append(_move(i + 1, 1))
+                output.append(self._line(i, cells, keys, widths, columns))
+                output.append(_CLEAR_LINE)
+                continue
+
+            x = 1
+
+            for j, cell in enumerate(cells):
+                width = widths[j] if i > 0 else columns - 1
+
+                if cell != previous[j]:
+                    output.append(_move(i + 1, x))
+                    output.append(
+                        self._cell(i, keys[j] if i > 1 else None, cell, width)
+                    )
+
+                x += width + _GAP
+
+        # rows that are no longer shown
+        for i in range(len(frame), len(self._lines)):
+            output.append(_move(i + 1, 1))
+            output.append(_CLEAR_LINE)
+
+        self._layout = layout
+        self._lines = frame
+
+        return "".join(output)
+
+    def _rows(self, servers, samples):
+        rows = []
+
+        for server in servers:
+            sample = samples.get(server["id"], "-")
+
+            if self.filter_text and not any(
+                self.filter_text.lower() in str(server[key]).lower()
+                for key in ("id", "name", "image_uid", "status")
+            ):
+                continue
+
+            cpu = None
+            memory = None
+
+            if isinstance(sample, str):
+                cpu_load = sample
+                memory_load = sample
+            else:
+                cpu = cpu_percent(sample)
+                memory = (memory_usage(sample) or (None, None))[0]
+                cpu_load = format_cpu_load(sample)
+                memory_load = format_memory_usage(sample)
+
+            rows.append(
+                (
+                    {
+                        **{
+                            key: "" if value is None else str(value)
+                            for key, value in server.items()
+                        },
+                        "cpu_load": cpu_load,
+                        "memory_usage": memory_load,
+                    },
+                    {"name": server["name"], "cpu": cpu, "memory": memory},
+                )
+            )
+
+        # servers without statistics are always listed last
+        known = [row for row in rows if row[1][self.sort] is not None]
+        unknown = [row for row in rows if row[1][self.sort] is None]
+
+        known.sort(key=lambda row: row[1][self.sort], reverse=self.reverse)
+        unknown.sort(key=lambda row: row[1]["name"])
+
+        rows = known + unknown
+
+        return [row for row, _ in rows]
+
+    def _fit(self, rows, columns):
+        """returns column widths and keys of columns that fit the terminal"""
+
+        keys = [key for key, _, _ in COLUMNS]
+        widths = {
+            key: max(
+                [len(header), MIN_WIDTHS.get(key, 0), self._widths.get(key, 0)]
+                + [len(row[key]) for row in rows]
+            )
+            for key, header, _ in COLUMNS
+        }
+        self._widths = widths
+
+        for key, _, optional in reversed(COLUMNS):
+            if sum(widths[k] + _GAP for k in keys) - _GAP <= columns:
+                break
+
+            if optional:
+                keys.remove(key)
+
+        return ([widths[key] for key in keys], keys)
+
+    def _status_line(self, total, shown):
+        filter_text = (
+            f", filter: {self.filter_text}{'_' if self.editing_filter else ''}"
+            if self.filter_text or self.editing_filter
+            else ""
+        )
+        hidden = f" ({total - shown} not shown)" if shown < total else ""
+
+        return "".join(
+            (
+                f"{total} servers{hidden}, sorted by {self.sort}",
+                f" ({'descending' if self.reverse else 'ascending'}){filter_text}",
+                " - [c]pu [m]emory [n]ame [/]filter [q]uit",
+            )
+        )
+
+    def _line(self, i, cells, keys, widths, columns):
+        if i == 0:
+            return self._cell(0, None, cells[0], columns - 1)
+
+        return (" " * _GAP).join(
+            self._cell(i, keys[j] if i > 1 else None, cell, widths[j])
+            for j, cell in enumerate(cells)
+        )
+
+    def _cell(self, i, key, cell, width):
+        text = cell[:width].ljust(width)
+
+        if i == 1:
+            return click.style(text, bold=True)
+
+        if key == "status" and cell in STATUS_COLORS:
+            return click.style(text, fg=STATUS_COLORS[cell])
+
+        return text
@@ -10,90 +10,138 @@
 #                                                               #
 #################################################################
 
+from wilfred import profiler  # first, startup is measured from here
+
 import click
 import codecs
 import locale
 import os
 import sys
 
-from halo import Halo
 from pathlib import Path
-from sqlalchemy.exc import IntegrityError
-from sqlalchemy import inspect
-from time import sleep
-from tabulate import tabulate
+from time import sleep, monotonic, time
+from functools import lru_cache
 from shutil import get_terminal_size
+from datetime import datetime
 
 from wilfred.docker_conn import docker_client
 from wilfred.version import version, commit_hash, commit_date
 from wilfred.api.config_parser import Config, NoConfiguration
-from wilfred.database import session, database_path, Server, EnvironmentVariable, Port
-from wilfred.api.servers import Servers
-from wilfred.api.images import Images, ImageAPIMismatch, ImagesOutdated
+from wilfred.api.servers import Servers, BulkResult, BULK_PARALLEL
+from wilfred.api.stats import running_server_ids
+from wilfred.top import TopView, SORT_KEYS, ENTER_SCREEN, LEAVE_SCREEN
+from wilfred.keyboard import KeyReader
+from wilfred.api.history import ResourceHistory, Sampler, HistoryNotFound
+from wilfred.api.images import (
+    Images,
+    ImageAPIMismatch,
+    ImagesOutdated,
+    DEFAULT_MIRRORS,
+)
 from wilfred.message_handler import warning, error, ui_exception
-from wilfred.core import is_integer, random_string, check_for_new_releases
+from wilfred.core import (
+    is_integer,
+    random_string,
+    check_for_new_releases,
+    parse_duration,
+    get_database_path,
+)
 from wilfred.migrate import Migrate
+from wilfred.daemon import forward, remote_stats
 from wilfred.api.server_config import ServerConfig
 from wilfred.decorators import configuration_present
 
 
-config = Config()
+# resources are initialized on first use, commands only pay for what they need
+@lru_cache(maxsize=None)
+def get_config():
+    """returns the Wilfred configuration, read on first use"""
+
+    config = Config()
+
+    try:
+        config.read()
+    except NoConfiguration:
+        warning(
+            "Wilfred is not yet configured. Run `wilfred setup` to configure Wilfred."
+        )
+    except Exception as e:
+        ui_exception(e)
+
+    return config
+
+
+def _download_images(images, text, succeed, **kwargs):
+    """downloads images with a spinner, exits on failure"""
+
+    from halo import Halo
+
+    with Halo(text=text, color="yellow", spinner="dots") as spinner:
+        try:
+            updated = images.download(**kwargs)
+        except Exception as e:
+            spinner.fail()
+            ui_exception(e)
+
+        spinner.succeed(succeed if updated else f"{succeed} (up to date)")
+
 
-try:
-    config.read()
-except NoConfiguration:
-    warning("Wilfred is not yet configured. Run `wilfred setup` to configure Wilfred.")
-except Exception as e:
-    ui_exception(e)
+@lru_cache(maxsize=None)
+def get_images():
+    """returns images, downloaded if missing or outdated and read on first use"""
 
+    images = Images()
 
-images = Images()
+    if not images.check_if_present():
+        _download_images(images, "Downloading default images", "Images downloaded")
 
-if not os.environ.get("WILFRED_SKIP_DOCKER", False):
     try:
-        servers = Servers(docker_client(), config.configuration, images)
+        images.read_images()
+    except ImageAPIMismatch:
+        _download_images(images, "Downloading default images", "Images downloaded")
+        try:
+            images.read_images()
+        except Exception as e:
+            ui_exception(e)
+    except ImagesOutdated:
+        _download_images(
+            images, "Images outdated, refreshing default images", "Images refreshed"
+        )
+        try:
+            images.read_images()
+        except Exception as e:
+            ui_exception(e)
     except Exception as e:
         ui_exception(e)
 
-if not images.check_if_present():
-    with Halo(
-        text="Downloading default images", color="yellow", spinner="dots"
-    ) as spinner:
-        images.download()
-        spinner.succeed("Images downloaded")
+    return images
+
+
+@lru_cache(maxsize=None)
+def get_docker():
+    """returns the Docker client, connects on first use"""
 
-try:
-    images.read_images()
-except ImageAPIMismatch:
-    with Halo(
-        text="Downloading default images", color="yellow", spinner="dots"
-    ) as spinner:
-        images.download()
-        spinner.succeed("Images downloaded")
     try:
-        images.read_images()
+        return docker_client()
     except Exception as e:
         ui_exception(e)
-except ImagesOutdated:
-    with Halo(
-        text="Images outdated, refreshing default images",
-        color="yellow",
-        spinner="dots",
-    ) as spinner:
-        images.download()
-        spinner.succeed("Images refreshed")
+
+
+@lru_cache(maxsize=None)
+def get_servers():
+    """returns wilfred.api.Servers, connects to Docker on first use"""
+
     try:
-        images.read_images()
+        return Servers(get_docker(), get_config().configuration, get_images())
     except Exception as e:
         ui_exception(e)
-except Exception as e:
-    ui_exception(e)
 
-# check
-Migrate()
 
 ENABLE_EMOJIS = False if sys.platform.startswith("win") else True
 
+# seconds between re-reading the server list in `wilfred top`
+TOP_SERVER_REFRESH = 5
+
 
 def print_version(ctx, param, value):
     """
@@ -113,7 +161,17 @@ def print_version(ctx, param, value):
         f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}"
     )
 
-    check_for_new_releases(enable_emojis=ENABLE_EMOJIS)
+    # read quietly, `--version` works without configuration
+    config = Config()
+
+    try:
+        config.read()
+    except Exception:
+        pass
+
+    check_for_new_releases(
+        enable_emojis=ENABLE_EMOJIS, configuration=config.configuration
+    )
     if str(version) == "0.0.0.dev0":
         click.echo(
             "".join(
@@ -144,12 +202,12 @@ def print_path(ctx, param, value):
     if not value or ctx.resilient_parsing:
         return
 
-    click.echo(f"Configuration file: {click.format_filename(config.config_path)}")
-    click.echo(f"Image config file: {click.format_filename(images.image_dir)}")
-    click.echo(f"Database file: {click.format_filename(database_path)}")
+    click.echo(f"Configuration file: {click.format_filename(get_config().config_path)}")
+    click.echo(f"Image config file: {click.format_filename(Images().image_dir)}")
+    click.echo(f"Database file: {click.format_filename(get_database_path())}")
 
-    if config.configuration:
-        _path = f"{click.format_filename(config.configuration['data_path'])}"
+    if get_config().configuration:
+        _path = f"{click.format_filename(get_config().configuration['data_path'])}"
 
         if sys.platform.startswith("win"):
             _path = _path.replace("/", "\\")
@@ -159,7 +217,20 @@ def print_path(ctx, param, value):
     ctx.exit()
 
 
+def terminal_width():
+    """width of the terminal, of the client when the command runs in wilfredd"""
+
+    ctx = click.get_current_context(silent=True)
+
+    if ctx and ctx.terminal_width:
+        return ctx.terminal_width
+
+    return get_terminal_size((80, 20))[0]
+
+
 def pretty_list(data, tablefmt):
+    from tabulate import tabulate
+
     for server in data:
         server.update(
             (
@@ -198,6 +269,12 @@ def main():
         os.environ["LC_ALL"] = "C.UTF-8"
         os.environ["LANG"] = "C.UTF-8"
 
+    # thin client if wilfredd is running
+    exit_code = forward(sys.argv[1:])
+
+    if exit_code is not None:
+        sys.exit(exit_code)
+
     cli()
 
 
@@ -218,7 +295,19 @@ def main():
     is_eager=True,
     help="Print paths for configurations and server data",
 )
-def cli():
+@click.option(
+    "--profile",
+    is_flag=True,
+    envvar=profiler.PROFILE_ENV,
+    help="Print time spent per phase, Docker API requests and SQL statements to stderr",
+)
+@click.option(
+    "--profile-output",
+    type=click.Path(dir_okay=False, writable=True),
+    envvar=profiler.PROFILE_OUTPUT_ENV,
+    help="Also write cProfile statistics to this file (implies --profile)",
+)
+def cli(profile, profile_output):
     """
     Wilfred - A CLI for managing game servers using Docker.
 
@@ -231,14 +320,19 @@ def cli():
     Discord server for support - https://wilfredproject.org/discord
     """
 
-    pass
+    if profile or profile_output:
+        profiler.enable(output=profile_output)
+
+    # only runs when a command is invoked, not for --version, --path or --help
+    with profiler.phase("migrate"):
+        Migrate()
 
 
 @cli.command()
 def setup():
     """Setup wilfred, create configuration."""
 
-    if config.configuration:
+    if get_config().configuration:
         warning("A configuration file for Wilfred already exists.")
         click.confirm("Are you sure you wan't to continue?", abort=True)
 
@@ -247,7 +341,7 @@ def setup():
         default=f"{str(Path.home())}/wilfred-data/servers",
     )
 
-    config.write(data_path)
+    get_config().write(data_path)
 
 
 @cli.command("servers")
@@ -255,14 +349,14 @@ def servers_list():
     """List all existing servers."""
 
     # run sync to refresh server state
-    servers.sync()
+    get_servers().sync()
 
-    data = servers.all()
+    data = get_servers().all()
 
     click.echo(
         pretty_list(
             data,
-            tablefmt="plain" if get_terminal_size((80, 20))[0] < 96 else "fancy_grid",
+            tablefmt="plain" if terminal_width() < 96 else "fancy_grid",
         )
     )
 
@@ -281,21 +375,36 @@ def servers_list():
     default="master",
     show_default=True,
 )
-def list_images(refresh, repo, branch):
+@click.option(
+    "--mirror",
+    "mirrors",
+    help="URL of the image archive to try before GitHub during image refresh, "
+    "{repo} and {branch} are replaced (can be used multiple times)",
+    multiple=True,
+)
+def list_images(refresh, repo, branch, mirrors):
     """List images available on file."""
 
+    from tabulate import tabulate
+
     if refresh:
-        with Halo(
-            text=f"Refreshing images [{repo}/{branch}]", color="yellow", spinner="dots"
-        ) as spinner:
-            try:
-                images.download(repo=repo, branch=branch)
-                images.read_images()
-            except Exception as e:
-                spinner.fail()
-                ui_exception(e)
+        images = Images()
+
+        _download_images(
+            images,
+            f"Refreshing images [{repo}/{branch}]",
+            f"Images refreshed [{repo}/{branch}]",
+            repo=repo,
+            branch=branch,
+            mirrors=list(mirrors) + list(DEFAULT_MIRRORS),
+        )
 
-            spinner.succeed(f"Images refreshed [{repo}/{branch}]")
+        try:
+            images.read_images()
+        except Exception as e:
+            ui_exception(e)
+    else:
+        images = get_images()
 
     click.echo(
         tabulate(
@@ -338,6 +447,11 @@ def list_images(refresh, repo, branch):
 def create(ctx, console, detach):
     """Create a new server."""
 
+    from halo import Halo
+    from sqlalchemy.exc import IntegrityError
+    from tabulate import tabulate
+    from wilfred.database import session, Server, EnvironmentVariable
+
     name = click.prompt("Server Name").lower()
 
     if " " in name:
@@ -346,7 +460,7 @@ def create(ctx, console, detach):
     click.secho("Available Images", bold=True)
     click.echo(
         tabulate(
-            images.data_strip_non_ui(),
+            get_images().data_strip_non_ui(),
             headers={
                 "uid": click.style("UID", bold=True),
                 "name": click.style("Image Name", bold=True),
@@ -362,10 +476,12 @@ def create(ctx, console, detach):
     if " " in image_uid:
         error("space not allowed in image_uid", exit_code=1)
 
-    if not images.get_image(image_uid):
+    if not get_images().get_image(image_uid):
         error("image does not exist", exit_code=1)
 
-    port = click.prompt("Port", default=images.get_image(image_uid)["default_port"])
+    port = click.prompt(
+        "Port", default=get_images().get_image(image_uid)["default_port"]
+    )
     memory = click.prompt("Memory", default=1024)
 
     # create
@@ -392,7 +508,7 @@ def create(ctx, console, detach):
     click.secho("Environment Variables", bold=True)
 
     # environment variables available for the container
-    for v in images.get_image(image_uid)["variables"]:
+    for v in get_images().get_image(image_uid)["variables"]:
         if not v["hidden"]:
             value = click.prompt(
                 v["prompt"], default=v["default"] if v["default"] is not True else None
@@ -416,7 +532,8 @@ def create(ctx, console, detach):
     # custom startup command
     if click.confirm("Would you like to set a custom startup command (optional)?"):
         custom_startup = click.prompt(
-            "Custom startup command", default=images.get_image(image_uid)["command"]
+            "Custom startup command",
+            default=get_images().get_image(image_uid)["command"],
         )
 
         server.custom_startup = custom_startup
@@ -430,7 +547,7 @@ def create(ctx, console, detach):
 
     with Halo(text="Creating server", color="yellow", spinner="dots") as spinner:
         try:
-            servers.install(
+            get_servers().install(
                 server, skip_wait=True if detach else False, spinner=spinner
             )
         except Exception as e:
@@ -439,175 +556,353 @@ def create(ctx, console, detach):
         spinner.succeed("Server created")
 
     if console:
-        ctx.invoke(start, name=name)
+        ctx.invoke(start, names=(name,))
         ctx.invoke(server_console, name=name)
 
 
 @cli.command("sync")
+@click.option(
+    "--watch",
+    help="Keep running and sync servers as soon as their containers start or exit.",
+    is_flag=True,
+)
 @configuration_present
-def sync_cmd():
+def sync_cmd(watch):
     """
     Sync all servers on file with Docker (start/stop/kill).
     """
 
+    from halo import Halo
+
+    def _print_event(server, action):
+        click.echo(
+            " ".join(
+                (
+                    click.style(
+                        datetime.now().strftime("%Y-%m-%d %H:%M:%S"), bold=True
+                    ),
+                    f"{server.name} ({server.id}) {action}",
+                )
+            )
+        )
+
     with Halo(text="Docker sync", color="yellow", spinner="dots") as spinner:
         try:
-            servers.sync()
+            get_servers().sync()
         except Exception as e:
             spinner.fail()
             ui_exception(e)
         spinner.succeed("Servers synced")
 
+    if watch:
+        click.echo("Watching Docker events, press CTRL+C to exit")
 
-@cli.command(short_help="Start server")
-@click.argument("name")
-@click.option(
-    "--console", help="Attach to server console immediately after start.", is_flag=True
-)
-@click.pass_context
-@configuration_present
-def start(ctx, name, console):
-    """
-    Start server
+        try:
+            get_servers().watch(callback=_print_event)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            ui_exception(e)
 
-    NAME is the name of the server
-    """
 
-    try:
-        servers.sync()
-    except Exception as e:
-        ui_exception(e)
+def lifecycle_options(action):
+    """decorator adding the server selectors shared by start, stop, restart and kill"""
+
+    def decorator(f):
+        for option in reversed(
+            (
+                click.argument("names", metavar="[NAME]...", nargs=-1),
+                click.option(
+                    "--all", "all_servers", is_flag=True, help=f"{action} all servers"
+                ),
+                click.option(
+                    "--image",
+                    "image_uid",
+                    metavar="UID",
+                    help=f"{action} all servers using this image",
+                ),
+                click.option(
+                    "--parallel",
+                    type=click.IntRange(min=1),
+                    default=BULK_PARALLEL,
+                    show_default=True,
+                    help="Maximum number of servers to operate on at once",
+                ),
+            )
+        ):
+            f = option(f)
+
+        return f
 
-    with Halo(text="Starting server", color="yellow", spinner="dots") as spinner:
+    return decorator
+
+
+def select_servers(names, all_servers, image_uid):
+    """returns servers matching the names, `--all` and `--image` selectors"""
+
+    from wilfred.database import session, Server
+
+    if not names and not all_servers and not image_uid:
+        error("specify at least one server name, --all or --image", exit_code=1)
+
+    selected = session.query(Server).all() if all_servers else []
+
+    if image_uid:
+        selected += session.query(Server).filter_by(image_uid=image_uid).all()
+
+    for name in names:
         server = session.query(Server).filter_by(name=name.lower()).first()
 
         if not server:
-            spinner.fail("Server does not exit")
-            sys.exit(1)
+            error(f"Server {name} does not exist", exit_code=1)
+
+        selected.append(server)
+
+    # e.g. --image with no servers using the image
+    if not selected:
+        error("no servers match the selection", exit_code=1)
 
+    # remove duplicates, keep order
+    return list({server.id: server for server in selected}.values())
+
+
+def prepare_start(selected, write_config=True):
+    """
+    writes the environment variables to the config files of servers that are about to start,
+    restarts write them once the server has stopped (`write_config=False`)
+    """
+
+    ready = []
+    skipped = []
+
+    for server in selected:
         if server.status == "installing":
-            spinner.fail("Server is installing, start blocked.")
-            sys.exit(1)
+            skipped.append(
+                BulkResult(server.name, False, "server is installing, start blocked", 0)
+            )
+            continue
 
-        image = images.get_image(server.image_uid)
+        image = get_images().get_image(server.image_uid)
 
         if not image:
-            error("Image UID does not exit", exit_code=1)
+            skipped.append(
+                BulkResult(server.name, False, "Image UID does not exist", 0)
+            )
+            continue
+
+        if not write_config:
+            ready.append(server)
+            continue
 
         try:
             ServerConfig(
-                config.configuration, servers, server, image
+                get_config().configuration, get_servers(), server, image
             ).write_environment_variables()
         except Exception as e:
-            ui_exception(e)
+            skipped.append(
+                BulkResult(server.name, False, f"{type(e).__name__} {str(e)}", 0)
+            )
+            continue
+
+        ready.append(server)
+
+    return (ready, skipped)
+
+
+def run_bulk(action, selected, parallel, skipped=()):
+    """performs action on the selected servers and prints the outcome"""
 
+    from halo import Halo
+    from tabulate import tabulate
+
+    _text = {
+        "start": ("Starting", "started"),
+        "stop": ("Stopping", "stopped"),
+        "restart": ("Restarting", "restarted"),
+        "kill": ("Killing", "killed"),
+    }
+
+    try:
+        get_servers().sync()
+    except Exception as e:
+        ui_exception(e)
+
+    with Halo(
+        text=f"{_text[action][0]} {'server' if len(selected) == 1 else 'servers'}",
+        color="yellow",
+        spinner="dots",
+    ) as spinner:
         try:
-            servers.set_status(server, "running")
-            servers.sync()
+            results = list(skipped) + get_servers().bulk(
+                action, selected, parallel=parallel
+            )
+            get_servers().sync()
         except Exception as e:
             spinner.fail()
             ui_exception(e)
 
-        spinner.succeed("Server started")
+        failed = len([result for result in results if not result.success])
 
-        if console:
-            ctx.invoke(server_console, name=name)
+        if len(results) == 1:
+            result = results[0]
 
+            if not result.success:
+                spinner.fail(result.detail)
+                sys.exit(1)
 
-@cli.command(short_help="Forcefully kill running server")
-@click.argument("name")
-@click.option("-f", "--force", is_flag=True, help="Force action without confirmation")
+            spinner.succeed(
+                f"Server {_text[action][1]} ({result.detail}, took {round(result.duration, 1)}s)"
+            )
+
+            return
+
+        if failed:
+            spinner.fail(f"{failed} of {len(results)} servers failed")
+        else:
+            spinner.succeed(f"{len(results)} servers {_text[action][1]}")
+
+    click.echo(
+        tabulate(
+            [
+                {
+                    "name": result.name,
+                    "result": (
+                        click.style("ok", fg="green")
+                        if result.success
+                        else click.style("failed", fg="red")
+                    ),
+                    "detail": result.detail,
+                    "duration": f"{round(result.duration, 1)}s",
+                }
+                for result in results
+            ],
+            headers={
+                "name": click.style("Name", bold=True),
+                "result": click.style("Result", bold=True),
+                "detail": click.style("Detail", bold=True),
+                "duration": click.style("Time", bold=True),
+            },
+            tablefmt="plain" if terminal_width() < 96 else "fancy_grid",
+        )
+    )
+
+    if failed:
+        sys.exit(1)
+
+
+@cli.command(short_help="Start servers")
+@lifecycle_options("Start")
+@click.option(
+    "--console", help="Attach to server console immediately after start.", is_flag=True
+)
+@click.pass_context
 @configuration_present
-def kill(name, force):
+def start(ctx, names, all_servers, image_uid, parallel, console):
     """
-    Forcefully kill running server
+    Start servers
 
-    NAME is the name of the server
+    NAME is the name of the server, multiple names can be specified
     """
 
-    if force or click.confirm(
-        "Are you sure you want to do this? This will kill the running container without saving data."
-    ):
-        with Halo(text="Killing server", color="yellow", spinner="dots") as spinner:
-            server = session.query(Server).filter_by(name=name.lower()).first()
+    selected = select_servers(names, all_servers, image_uid)
 
-            if not server:
-                spinner.fail("Server does not exit")
-                sys.exit(1)
+    if console and len(selected) != 1:
+        error("--console can only be used with a single server", exit_code=1)
 
-            try:
-                servers.kill(server)
-                servers.set_status(server, "stopped")
-                servers.sync()
-            except Exception as e:
-                spinner.fail()
-                ui_exception(e)
+    ready, skipped = prepare_start(selected)
+    run_bulk("start", ready, parallel, skipped=skipped)
 
-            spinner.succeed("Server killed")
+    if console:
+        ctx.invoke(server_console, name=selected[0].name)
 
 
-@cli.command(short_help="Stop server gracefully")
-@click.argument("name")
+@cli.command(short_help="Forcefully kill running servers")
+@lifecycle_options("Kill")
+@click.option("-f", "--force", is_flag=True, help="Force action without confirmation")
 @configuration_present
-def stop(name):
+def kill(names, all_servers, image_uid, parallel, force):
     """
-    Stop server gracefully.
+    Forcefully kill running servers
 
-    NAME is the name of the server
+    NAME is the name of the server, multiple names can be specified
     """
 
-    try:
-        servers.sync()
-    except Exception as e:
-        ui_exception(e)
+    selected = select_servers(names, all_servers, image_uid)
 
-    with Halo(text="Stopping server", color="yellow", spinner="dots") as spinner:
-        server = session.query(Server).filter_by(name=name.lower()).first()
+    if force or click.confirm(
+        " ".join(
+            (
+                "Are you sure you want to do this?",
+                (
+                    "This will kill the running container without saving data."
+                    if len(selected) == 1
+                    else f"This will kill {len(selected)} containers without saving data."
+                ),
+            )
+        )
+    ):
+        run_bulk("kill", selected, parallel)
 
-        if not server:
-            spinner.fail("Server does not exit")
-            sys.exit(1)
 
+@cli.command(short_help="Stop servers gracefully")
+@lifecycle_options("Stop")
+@configuration_present
+def stop(names, all_servers, image_uid, parallel):
+    """
+    Stop servers gracefully.
+
+    NAME is the name of the server, multiple names can be specified
+    """
+
+    ready = []
+    skipped = []
+
+    for server in select_servers(names, all_servers, image_uid):
         if server.status == "installing":
-            spinner.fail(
-                " ".join(
-                    (
-                        "Server is installing, you cannot gracefully stop it.",
-                        "Use `wilfred kill` if the installation process has hanged.",
-                    )
+            skipped.append(
+                BulkResult(
+                    server.name,
+                    False,
+                    " ".join(
+                        (
+                            "Server is installing, you cannot gracefully stop it.",
+                            "Use `wilfred kill` if the installation process has hanged.",
+                        )
+                    ),
+                    0,
                 )
             )
-            sys.exit(1)
+            continue
 
-        try:
-            servers.set_status(server, "stopped")
-            servers.sync()
-        except Exception as e:
-            spinner.fail()
-            ui_exception(e)
+        ready.append(server)
 
-        spinner.succeed("Server stopped")
+    run_bulk("stop", ready, parallel, skipped=skipped)
 
 
-@cli.command(short_help="Restart server")
-@click.argument("name")
+@cli.command(short_help="Restart servers")
+@lifecycle_options("Restart")
 @click.option(
     "--console", help="Attach to server console immediately after start.", is_flag=True
 )
 @click.pass_context
 @configuration_present
-def restart(ctx, name, console):
+def restart(ctx, names, all_servers, image_uid, parallel, console):
     """
-    Restart server
+    Restart servers
 
-    NAME is the name of the server
+    NAME is the name of the server, multiple names can be specified
     """
 
-    ctx.invoke(stop, name=name)
-    ctx.invoke(start, name=name)
+    selected = select_servers(names, all_servers, image_uid)
+
+    if console and len(selected) != 1:
+        error("--console can only be used with a single server", exit_code=1)
+
+    ready, skipped = prepare_start(selected, write_config=False)
+    run_bulk("restart", ready, parallel, skipped=skipped)
 
     if console:
-        ctx.invoke(server_console, name=name)
+        ctx.invoke(server_console, name=selected[0].name)
 
 
 @cli.command()
@@ -621,6 +916,9 @@ def delete(name, force):
     NAME is the name of the server
     """
 
+    from halo import Halo
+    from wilfred.database import session, Server
+
     if force or click.confirm(
         "Are you sure you want to do this? All data will be permanently deleted."
     ):
@@ -632,7 +930,8 @@ def delete(name, force):
                 sys.exit(1)
 
             try:
-                servers.remove(server)
+                get_servers().remove(server)
+                ResourceHistory().remove(server.id)
                 spinner.succeed("Server removed")
             except Exception as e:
                 spinner.fail()
@@ -652,13 +951,15 @@ def run_command(name, command):
     COMMAND is the command to send, can be put in \" for commands with whitespaces
     """
 
+    from wilfred.database import session, Server
+
     server = session.query(Server).filter_by(name=name.lower()).first()
 
     if not server:
         error("Server does not exit", exit_code=1)
 
     try:
-        servers.command(server, command)
+        get_servers().command(server, command)
     except Exception as e:
         ui_exception(e)
 
@@ -686,6 +987,8 @@ def server_console(name):
     NAME is the name of the server
     """
 
+    from wilfred.database import session, Server
+
     server = session.query(Server).filter_by(name=name.lower()).first()
 
     if not server:
@@ -702,7 +1005,7 @@ def server_console(name):
     )
 
     try:
-        servers.console(
+        get_servers().console(
             server, disable_user_input=True if server.status == "installing" else False
         )
     except Exception as e:
@@ -726,6 +1029,10 @@ def edit(name):
     NAME is the name of the server
     """
 
+    from sqlalchemy import inspect
+    from sqlalchemy.exc import IntegrityError
+    from wilfred.database import session, Server, EnvironmentVariable
+
     server = session.query(Server).filter_by(name=name.lower()).first()
 
     if not server:
@@ -739,7 +1046,7 @@ def edit(name):
                     for c in inspect(server).mapper.column_attrs
                 }
             ],
-            tablefmt="plain" if get_terminal_size((80, 20))[0] < 96 else "fancy_grid",
+            tablefmt="plain" if terminal_width() < 96 else "fancy_grid",
         )
     )
     click.echo("Leave values empty to use existing value")
@@ -757,7 +1064,7 @@ def edit(name):
 
     click.secho("Environment Variables", bold=True)
 
-    for v in images.get_image(server.image_uid)["variables"]:
+    for v in get_images().get_image(server.image_uid)["variables"]:
         if v["install_only"]:
             continue
 
@@ -802,14 +1109,14 @@ def edit(name):
         if click.confirm("Would you like to set a custom startup command?"):
             custom_startup = click.prompt(
                 "Custom startup command (use 'None' to reset to default)",
-                default=images.get_image(server.image_uid)["command"],
+                default=get_images().get_image(server.image_uid)["command"],
             )
 
             custom_startup = None if custom_startup == "None" else custom_startup
 
     if name != server.name:
         try:
-            servers.rename(server, name)
+            get_servers().rename(server, name)
         except Exception as e:
             ui_exception(e)
 
@@ -832,49 +1139,214 @@ def edit(name):
 @cli.command(
     short_help=" ".join(("Show server statistics, CPU load, memory load etc.",))
 )
-def top():
-    while True:
-        # retrieve data (this can take a split moment)
-        data = servers.all(cpu_load=True, memory_usage=True)
+@click.option(
+    "--interval",
+    default=1.0,
+    type=click.FloatRange(min=0.1),
+    show_default=True,
+    help="Seconds between screen updates.",
+)
+@click.option(
+    "--sort",
+    type=click.Choice(SORT_KEYS),
+    default="name",
+    show_default=True,
+    help="Sort servers by name, CPU load or memory usage (press c, m or n to change).",
+)
+@click.option(
+    "--filter",
+    "filter_text",
+    help="Only show servers whose ID, name, image or status contains this text (press / to change).",
+)
+def top(interval, sort, filter_text):
+    # wilfredd (if running) already streams the stats and records the history
+    subscriptions = remote_stats()
+    sampler = None
+
+    if subscriptions is None:
+        subscriptions = get_servers().subscribe_stats()
+
+        # keep the resource history while watching
+        sampler = Sampler(subscriptions, ResourceHistory())
+        sampler.start()
+
+    refreshed_at = None
+
+    view = TopView(sort=sort, reverse=sort != "name", filter_text=filter_text)
+
+    click.echo(ENTER_SCREEN, nl=False)
 
-        for server in data:
-            server.update(
+    try:
+        with KeyReader() as keys:
+            while True:
+                # server list and subscriptions are refreshed periodically, samples stream in continuously
+                if (
+                    refreshed_at is None
+                    or monotonic() - refreshed_at >= TOP_SERVER_REFRESH
+                ):
+                    rows = get_servers().all()
+                    subscriptions.update(running_server_ids(rows))
+                    refreshed_at = monotonic()
+
+                # only the cells that changed since the last frame are written
+                click.echo(view.render(rows, subscriptions.latest()), nl=False)
+
+                # wait for the next frame, key presses redraw immediately
+                if not view.handle_keys(keys.read(interval)):
+                    break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        click.echo(LEAVE_SCREEN, nl=False)
+
+        if sampler:
+            sampler.stop()
+
+        subscriptions.close()
+
+
+@cli.command(
+    "stats",
+    short_help="Show resource usage history of a server (CPU, memory, network and block I/O).",
+)
+@click.argument("name", required=False)
+@click.option(
+    "--since",
+    default="1h",
+    show_default=True,
+    help="Time window to summarize, e.g. 30m, 6h or 7d.",
+)
+@click.option(
+    "--record",
+    is_flag=True,
+    help="Record resource usage of all running servers until interrupted.",
+)
+def stats_command(name, since, record):
+    """
+    Show resource usage history of a server
+
+    History is recorded while `wilfred top` or `wilfred stats --record` is running.
+
+    \b
+    NAME is the name of the server
+    """
+
+    from tabulate import tabulate
+    from wilfred.database import session, Server
+
+    if record:
+        subscriptions = get_servers().subscribe_stats()
+        sampler = Sampler(subscriptions, ResourceHistory())
+        sampler.start()
+
+        click.echo("Recording resource usage, press CTRL+C to exit")
+
+        try:
+            while True:
+                subscriptions.update(running_server_ids(get_servers().all()))
+                sleep(TOP_SERVER_REFRESH)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            sampler.stop()
+            subscriptions.close()
+
+        return
+
+    if not name:
+        error("NAME is required unless --record is used", exit_code=1)
+
+    server = session.query(Server).filter_by(name=name.lower()).first()
+
+    if not server:
+        error("Server does not exist", exit_code=1)
+
+    try:
+        summary = ResourceHistory().summary(
+            server.id, since=time() - parse_duration(since)
+        )
+    except HistoryNotFound:
+        error(
+            " ".join(
                 (
-                    k,
-                    str(v)
-                    .replace("running", click.style("running", fg="green"))
-                    .replace("stopped", click.style("stopped", fg="red"))
-                    .replace("installing", click.style("installing", fg="yellow")),
+                    "No resource history recorded for this server,",
+                    "run `wilfred stats --record` or `wilfred top` to record it.",
                 )
-                for k, v in server.items()
-            )
+            ),
+            exit_code=1,
+        )
+    except Exception as e:
+        ui_exception(e)
+
+    def _row(metric, label, scale, decimals):
+        values = summary[metric]
 
-        # clear the screen
-        click.clear()
-
-        headers = {
-            "id": click.style("ID", bold=True),
-            "name": click.style("Name", bold=True),
-            "image_uid": click.style("Image UID", bold=True),
-            "memory": click.style("RAM", bold=True),
-            "port": click.style("Port", bold=True),
-            "status": click.style("Status", bold=True),
-            "custom_startup": click.style("Custom startup", bold=True),
-            "cpu_load": click.style("CPU", bold=True),
-            "memory_usage": click.style("MEM usage / MEM %", bold=True),
+        return {
+            "metric": label,
+            **{
+                k: round(values[k] / scale, decimals) if values else "-"
+                for k in ("min", "avg", "max", "p95", "last")
+            },
         }
 
-        # display table
-        click.echo(
-            tabulate(
-                data,
-                headers=headers,
-                tablefmt="plain",
-            )
+    click.echo(
+        f"{summary['samples']} samples of {click.style(server.name, bold=True)} in the last {since}"
+    )
+    click.echo(
+        tabulate(
+            [
+                _row("cpu", "CPU (%)", 1, 2),
+                _row("memory_used", "Memory (MB)", 1024 * 1024, 1),
+                _row("network_rx", "Network in (KB/s)", 1024, 1),
+                _row("network_tx", "Network out (KB/s)", 1024, 1),
+                _row("block_read", "Block read (KB/s)", 1024, 1),
+                _row("block_write", "Block write (KB/s)", 1024, 1),
+            ],
+            headers={
+                "metric": click.style("Metric", bold=True),
+                "min": click.style("Min", bold=True),
+                "avg": click.style("Avg", bold=True),
+                "max": click.style("Max", bold=True),
+                "p95": click.style("P95", bold=True),
+                "last": click.style("Last", bold=True),
+            },
+            tablefmt="fancy_grid",
         )
+    )
+
+
+@cli.command(
+    "exporter",
+    short_help="Serve resource usage of all servers as OpenMetrics (e.g. for Prometheus).",
+)
+@click.option(
+    "--listen",
+    default="127.0.0.1:9357",
+    show_default=True,
+    help="Address and port to serve metrics on, IPv6 addresses in brackets (e.g. [::1]:9357).",
+)
+def exporter_command(listen):
+    """
+    Serve resource usage of all servers as OpenMetrics
 
-        # cooldown before repeating
-        sleep(1)
+    Metrics (status, CPU, memory, network and block I/O) are available at /metrics
+    """
+
+    from wilfred.exporter import Exporter
+
+    host, _, port = listen.rpartition(":")
+
+    if not host or not is_integer(port):
+        error("--listen must be ADDRESS:PORT", exit_code=1)
+
+    click.echo(f"Serving metrics on http://{listen}/metrics, press CTRL+C to exit")
+
+    try:
+        Exporter(get_servers()).serve(host.strip("[]"), int(port))
+    except KeyboardInterrupt:
+        pass
+    except Exception as e:
+        ui_exception(e)
 
 
 @cli.command(
@@ -898,8 +1370,10 @@ def config_command(name, variable, value):
     VALUE is the new value for the variable setting
     """
 
+    from wilfred.database import session, Server
+
     def _get():
-        return ServerConfig(config.configuration, servers, server, image)
+        return ServerConfig(get_config().configuration, get_servers(), server, image)
 
     def _print_all_values(variable, config_list):
         for var in config_list:
@@ -907,27 +1381,20 @@ def config_command(name, variable, value):
                 f"{click.style(var['_wilfred_config_filename'], bold=True)} {variable}: '{var[variable]}'"
             )
 
-    def _get_variable_occurrences(variable, raw):
-        _variable_occurrences = []
-        for x in raw:
-            if variable in x:
-                _variable_occurrences.append(x)
-
-        return _variable_occurrences
-
     server = session.query(Server).filter_by(name=name.lower()).first()
 
     if not server:
         error("Server does not exist", exit_code=1)
 
-    image = images.get_image(server.image_uid)
+    image = get_images().get_image(server.image_uid)
 
     if not image:
         error("Image UID does not exit", exit_code=1)
 
     server_conf = _get()
 
-    _variable_occurrences = _get_variable_occurrences(variable, server_conf.raw)
+    # only the files containing the variable are read
+    _variable_occurrences = server_conf.occurrences(variable) if variable else []
 
     if variable and len(_variable_occurrences) == 0:
         error("variable does not exist", exit_code=1)
@@ -965,10 +1432,7 @@ def config_command(name, variable, value):
 
         try:
             server_conf.edit(filename, variable, value)
-            server_conf = _get()
-            _print_all_values(
-                variable, _get_variable_occurrences(variable, server_conf.raw)
-            )
+            _print_all_values(variable, _get().occurrences(variable))
         except Exception as e:
             ui_exception(e)
 
@@ -994,6 +1458,10 @@ def port_command(name, action, port):
     PORT is the port to add or remove
     """
 
+    from sqlalchemy.exc import IntegrityError
+    from tabulate import tabulate
+    from wilfred.database import session, Server, Port
+
     server = session.query(Server).filter_by(name=name.lower()).first()
 
     if not server: